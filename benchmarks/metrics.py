@@ -0,0 +1,52 @@
+"""
+Cost of the metrics with many processes: recording lifecycle events and
+rendering a scrape.
+
+Usage:
+    python -m benchmarks.metrics [count]
+"""
+
+import sys
+import time
+
+from taskmaster.metrics import Metrics
+from taskmaster.service import ServiceHandler
+from taskmaster.utils.events import Event, EventKind
+
+from .registry import service_config, timed
+
+NUMPROCS = 10
+
+
+def main(count: int) -> None:
+    configs = [
+        dict(service_config(index), numprocs=NUMPROCS)
+        for index in range(count // NUMPROCS)
+    ]
+    handler = ServiceHandler(email=None, services=configs)
+    metrics = Metrics(handler)
+    names = [config["name"] for config in configs]
+
+    events = []
+    for pid in range(count):
+        service = names[pid // NUMPROCS]
+        events += [
+            Event(EventKind.SPAWNED, service, pid, previous=EventKind.STOPPED),
+            Event(EventKind.RUNNING, service, pid),
+            Event(EventKind.EXITED, service, pid, exitcode=pid % 3),
+            Event(EventKind.SPAWNED, service, pid + count, previous=EventKind.EXITED),
+            Event(EventKind.RUNNING, service, pid + count),
+        ]
+    start = time.perf_counter()
+    for event in events:
+        handler.events.publish(event)
+    elapsed = time.perf_counter() - start
+
+    print(f"{count} processes in {len(configs)} services")
+    print(f"{'record an event':<26}{elapsed / len(events) * 1e6:>10.2f}us")
+    print(f"{'render a scrape':<26}{timed(metrics.render) * 1000:>10.2f}ms")
+    print(f"{'scrape size':<26}{len(metrics.render()) / 1024:>10.0f}KiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
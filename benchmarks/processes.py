@@ -0,0 +1,62 @@
+"""
+Memory per managed process and cost of the status with many processes, in
+services of up to 4096 processes, without spawning them.
+
+Usage:
+    python -m benchmarks.processes [count]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from taskmaster.service import ServiceHandler, SubProcess
+
+from .registry import service_config, timed
+
+NUMPROCS = 4096
+
+
+def main(count: int) -> None:
+    configs = []
+    for index in range(0, count, NUMPROCS):
+        numprocs = min(NUMPROCS, count - index)
+        configs.append(dict(service_config(len(configs)), numprocs=numprocs))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    handler = ServiceHandler(email=None, services=configs)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    processes = [
+        process for service in handler.services for process in service._processes
+    ]
+    model = handler.status_model
+    names = [config["name"] for config in configs]
+    handler.status
+
+    def transitions() -> None:
+        for process in processes:
+            process.state = SubProcess.State.RUNNING
+        for process in processes:
+            process.state = SubProcess.State.STOPPED
+
+    def status_after_changes() -> None:
+        for name in names:
+            model.touch(name)
+        handler.status
+
+    start = time.perf_counter()
+    transitions()
+    elapsed = time.perf_counter() - start
+
+    print(f"{count} processes in {len(configs)} services")
+    print(f"{'memory per process':<26}{memory / count:>10.0f}B")
+    print(f"{'state transition':<26}{elapsed / (2 * count) * 1e6:>10.2f}us")
+    print(f"{'status, unchanged':<26}{timed(lambda: handler.status) * 1000:>10.2f}ms")
+    print(f"{'status, all changed':<26}{timed(status_after_changes) * 1000:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
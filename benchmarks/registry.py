@@ -0,0 +1,109 @@
+"""
+Service lookups, bulk selections and reload planning with many services,
+compared to scanning a list of services.
+
+Usage:
+    python -m benchmarks.registry [count]
+"""
+
+import sys
+import time
+from typing import Callable, List
+
+from taskmaster.service import Service, ServiceHandler, SubProcess
+
+
+def service_config(index: int) -> dict:
+    return {
+        "name": f"service-{index}",
+        "cmd": "sleep 100",
+        "numprocs": 1,
+        "umask": 0o22,
+        "workingdir": "/tmp",
+        "autostart": False,
+        "autorestart": "never",
+        "exitcodes": [0],
+        "startretries": 3,
+        "starttime": 1,
+        "stopsignal": "TERM",
+        "stoptime": 10,
+        "stdout": None,
+        "stderr": None,
+        "user": None,
+        "env": None,
+        "labels": ["even" if index % 2 == 0 else "odd"],
+    }
+
+
+def timed(function: Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(count: int) -> None:
+    configs = [service_config(index) for index in range(count)]
+    handler = ServiceHandler(email=None, services=configs)
+    services: List[Service] = list(handler.services)
+    names = [config["name"] for config in configs]
+    half = names[::2]
+    # Make every tenth service look running
+    for service in services[::10]:
+        service._processes[0].state = SubProcess.State.RUNNING
+
+    rows = [
+        (
+            f"select {len(half)} by name",
+            lambda: [service for service in services if service.config.name in half],
+            lambda: handler.services.select(half),
+        ),
+        (
+            f"get {count // 10} by name",
+            lambda: [
+                next(service for service in services if service.config.name == name)
+                for name in names[: count // 10]
+            ],
+            lambda: [handler.services.get(name) for name in names[: count // 10]],
+        ),
+        (
+            "by label",
+            lambda: [
+                service for service in services if "even" in service.config.labels
+            ],
+            lambda: handler.services.with_label("even"),
+        ),
+        (
+            "by state",
+            lambda: [
+                service
+                for service in services
+                if any(
+                    process.state == SubProcess.State.RUNNING
+                    for process in service._processes
+                )
+            ],
+            lambda: handler.services.in_state(SubProcess.State.RUNNING),
+        ),
+    ]
+
+    print(f"{count} services")
+    print(f"{'operation':<26}{'list scan':>12}{'registry':>12}")
+    for label, scan, indexed in rows:
+        print(
+            f"{label:<26}{timed(scan) * 1000:>10.2f}ms{timed(indexed) * 1000:>10.2f}ms"
+        )
+
+    changed = [dict(config) for config in configs]
+    for config in changed[::100]:
+        config["cmd"] = "sleep 200"
+    print(
+        f"{'plan reload':<26}{'':>12}"
+        f"{timed(lambda: handler.plan_reload(changed)) * 1000:>10.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,64 @@
+"""
+Overhead of a resource sampling pass over many processes, with the /proc files
+kept open or opened at each pass, and with or without counting the descriptors.
+The loop stall is the time a scheduled pass blocks the event loop at once.
+
+Spawns `count` sleeping processes (killed at the end).
+
+Usage:
+    python -m benchmarks.resources [count]
+"""
+
+import os
+import signal
+import sys
+import time
+
+from taskmaster.utils.resources import CHUNK, ResourceSampler
+
+from .registry import timed
+
+NUMPROCS = 10
+
+
+def main(count: int) -> None:
+    pids = [
+        os.posix_spawn("/bin/sleep", ["sleep", "600"], os.environ) for _ in range(count)
+    ]
+    try:
+        print(f"{count} processes")
+        # A scheduled pass only blocks the event loop for a chunk at a time
+        print(
+            f"{'variant':<26}{'pass':>12}{'per pid':>12}{'loop stall':>12}"
+            f"{'cpu at 5s':>12}"
+        )
+        for label, max_open, fds in (
+            ("preopened, fds", count, True),
+            ("preopened, no fds", count, False),
+            ("open each pass, fds", 0, True),
+            ("open each pass, no fds", 0, False),
+        ):
+            sampler = ResourceSampler(interval=0, max_open=max_open, fds=fds)
+            start = time.perf_counter()
+            for index, pid in enumerate(pids):
+                sampler.track(pid, f"service-{index // NUMPROCS}")
+            track = time.perf_counter() - start
+            sampler.sample()
+            elapsed = timed(sampler.sample)
+            print(
+                f"{label:<26}{elapsed * 1000:>10.1f}ms"
+                f"{elapsed / count * 1e6:>10.1f}us"
+                f"{elapsed / count * min(CHUNK, count) * 1000:>10.1f}ms"
+                f"{elapsed / 5 * 100:>11.2f}%"
+            )
+            sampler.close()
+        print(f"{'track every pid':<26}{track * 1000:>10.1f}ms")
+    finally:
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)
+        for pid in pids:
+            os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
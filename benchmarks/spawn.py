@@ -0,0 +1,43 @@
+"""
+Spawns per second for each spawn path.
+
+Usage:
+    python -m benchmarks.spawn [count]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+from taskmaster.utils.child_watcher import ChildWatcher
+from taskmaster.utils.spawn import SpawnBackend, SpawnPlan, spawn
+
+
+async def bench(plan: SpawnPlan, backend: SpawnBackend, count: int) -> tuple:
+    watcher = ChildWatcher.current()
+    start = time.perf_counter()
+    futures = []
+    for _ in range(count):
+        child = spawn(plan, backend=backend)
+        futures.append(watcher.watch(child.pid))
+    spawned = time.perf_counter() - start
+    await asyncio.gather(*futures)
+    return child.path.value, count / spawned
+
+
+async def main(count: int) -> None:
+    umask = os.umask(0)
+    os.umask(umask)
+    here = SpawnPlan.compile(cmd="true", umask=umask, workingdir=os.getcwd())
+    elsewhere = SpawnPlan.compile(cmd="true", umask=0o77, workingdir="/tmp")
+
+    print(f"{'backend':<10}{'plan':<12}{'path':<14}{'spawns/s':>10}")
+    for backend in SpawnBackend:
+        for name, plan in (("same cwd", here), ("other cwd", elsewhere)):
+            path, rate = await bench(plan, backend, count)
+            print(f"{backend.value:<10}{name:<12}{path:<14}{rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
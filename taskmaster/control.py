@@ -0,0 +1,584 @@
+from typing import Any, Awaitable, Callable, Dict, List, Set
+import asyncio
+import contextlib
+import fnmatch
+import itertools
+import json
+import os
+
+from .service import ServiceHandler
+from .utils.events import DropPolicy, Event, EventKind, Subscription
+from .utils.logger import logger
+from .utils.status import StatusDelta
+
+DEFAULT_SOCKET = "/tmp/taskmaster.sock"
+# The longest request line accepted, in bytes
+MAX_LINE = 1 << 20
+# The default number of events buffered for a stream before dropping the oldest
+STREAM_BUFFER = 1000
+
+
+class ControlError(ValueError):
+    """
+    Raised when a control request is invalid or fails.
+    """
+
+
+def _is_pattern(name: str) -> bool:
+    return any(character in name for character in "*?[")
+
+
+class _Stream:
+    """
+    A subscription of a client: lifecycle events and/or periodic status deltas
+    of the services matching its filter.
+
+    Events go through a bounded queue dropping the oldest events, and deltas
+    are computed from the last version sent, so a slow client only ever costs
+    its own buffer: the event loop never waits for it.
+    """
+
+    def __init__(
+        self,
+        stream_id: int,
+        connection: "_Connection",
+        handler: ServiceHandler,
+        names: List[str] | None,
+        events: Subscription | None,
+        interval: float | None,
+        states: bool,
+    ) -> None:
+        self.id = stream_id
+        self._connection = connection
+        self._handler = handler
+        self._names = set(names) if names is not None else None
+        # Service name -> whether it matches the names
+        self._matched: Dict[str, bool] = {}
+        self._events = events
+        self._interval = interval
+        self._states = states
+        self._tasks: List[asyncio.Task] = []
+        if events is not None:
+            self._tasks.append(asyncio.create_task(self._send_events()))
+        if interval is not None:
+            self._tasks.append(asyncio.create_task(self._send_deltas()))
+
+    def _matches(self, name: str) -> bool:
+        if self._names is None:
+            return True
+        matches = self._matched.get(name)
+        if matches is None:
+            matches = self._matched[name] = any(
+                fnmatch.fnmatchcase(name, pattern) for pattern in self._names
+            )
+        return matches
+
+    def close(self) -> None:
+        if self._events is not None:
+            self._events.close()
+        for task in self._tasks:
+            task.cancel()
+
+    async def _send_events(self) -> None:
+        dropped = 0
+        async for event in self._events:
+            message = {"stream": self.id, "event": _event(event)}
+            if self._events.dropped != dropped:
+                message["dropped"] = self._events.dropped - dropped
+                dropped = self._events.dropped
+            await self._connection.send(message)
+
+    async def _send_deltas(self) -> None:
+        version = -1
+        while True:
+            delta = self._handler.status_model.changes(version)
+            message = self._delta(delta)
+            if message is not None:
+                await self._connection.send({"stream": self.id, "delta": message})
+            version = delta.version
+            await asyncio.sleep(self._interval)
+
+    def _delta(self, delta: StatusDelta) -> Dict[str, Any] | None:
+        """
+        Gets the compact form of a delta restricted to the filter, None if
+        nothing in it matches.
+        """
+        changed = []
+        for summary in delta.changed:
+            if self._matches(summary.name):
+                entry: Dict[str, Any] = {"name": summary.name, "counts": summary.counts}
+                if self._states:
+                    entry["states"] = list(summary.states)
+                changed.append(entry)
+        message: Dict[str, Any] = {"version": delta.version, "changed": changed}
+        if delta.order is not None:
+            message["order"] = [name for name in delta.order if self._matches(name)]
+        elif not changed:
+            return None
+        return message
+
+
+class _Connection:
+    """
+    A client connection: its writer and its streams.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.streams: Dict[int, _Stream] = {}
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        """
+        Writes a message, waiting while the client is not reading.
+        """
+        if self.writer.is_closing():
+            return
+        self.writer.write(json.dumps(message).encode() + b"\n")
+        with contextlib.suppress(ConnectionError):
+            await self.writer.drain()
+
+    def close(self) -> None:
+        for stream in self.streams.values():
+            stream.close()
+        self.streams.clear()
+
+
+def _event(event: Event) -> Dict[str, Any]:
+    return {
+        "kind": event.kind.value,
+        "service": event.service,
+        "pid": event.pid,
+        "exitcode": event.exitcode,
+        "timestamp": event.timestamp,
+        "previous": event.previous.value if event.previous else None,
+        "reason": event.reason,
+        "leftovers": event.leftovers,
+    }
+
+
+class ControlServer:
+    """
+    Serves the control protocol on a unix socket.
+
+    The protocol is JSON lines: each request is one object on one line, with a
+    `cmd`, an optional `id` echoed in the response, and the parameters of the
+    command. Each response is one line, `{"id", "ok": true, "result"}` or
+    `{"id", "ok": false, "error"}`. A client may send requests without waiting
+    for the responses (pipelining): each request is handled in its own task, so
+    responses come back as they complete and are matched by `id`.
+
+    Commands:
+    - status: The status of the services (`services` to select some), with the
+      restarts queued and throttled by the restart budget if there is one, and
+      the seconds the first autostart took once every autostart service ran.
+    - start, stop, restart: Act on the `services` given, or on every service.
+    - reload: Reload the configuration file.
+    - subscribe: Stream the lifecycle events (`events`, true by default, `kinds`
+      to select some) and/or status deltas every `interval` seconds (`states`
+      to include the state of each process) of the `services` given, names or
+      glob patterns. The result is the id of the stream; its messages are
+      `{"stream", "event"}` (with `dropped`, the number of events dropped
+      before it, if any) and `{"stream", "delta": {"version", "changed",
+      "order"}}`, the first delta holding every service. At most `buffer`
+      events are kept for a client not reading fast enough.
+    - unsubscribe: Stop the `stream` given.
+
+    Args:
+        handler: The service handler to control.
+        path: The path of the unix socket.
+        reload: Reloads the configuration file, if supported. Its result is
+            the result of the reload command.
+    """
+
+    def __init__(
+        self,
+        handler: ServiceHandler,
+        path: str = DEFAULT_SOCKET,
+        reload: Callable[[], Awaitable[Any]] | None = None,
+    ) -> None:
+        self._handler = handler
+        self._path = path
+        self._reload = reload
+        self._server: asyncio.AbstractServer | None = None
+        self._clients: Set[asyncio.Task] = set()
+        self._stream_ids = itertools.count(1)
+        self._commands: Dict[
+            str, Callable[[Dict[str, Any], _Connection], Awaitable[Any]]
+        ] = {
+            "status": self._status,
+            "start": self._start,
+            "stop": self._stop,
+            "restart": self._restart,
+            "reload": self._reload_config,
+            "subscribe": self._subscribe,
+            "unsubscribe": self._unsubscribe,
+        }
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    async def start(self) -> None:
+        """
+        Starts listening, replacing a stale socket file. The socket is created
+        with mode 0600, never readable by others even briefly.
+
+        Raises:
+            ControlError: Another taskmaster is listening on the socket.
+        """
+        try:
+            _, writer = await asyncio.open_unix_connection(self._path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self._path)
+        else:
+            writer.close()
+            await writer.wait_closed()
+            raise ControlError(
+                f"Control socket {self._path} is in use by another taskmaster."
+            )
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(
+                self._serve, path=self._path, limit=MAX_LINE
+            )
+        finally:
+            os.umask(umask)
+        logger.info(f"Control socket listening on {self._path}.")
+
+    async def close(self) -> None:
+        """
+        Stops listening and disconnects the clients.
+        """
+        if self._server is None:
+            return
+        self._server.close()
+        for task in list(self._clients):
+            task.cancel()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._path)
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Reads the requests of a client, each handled in its own task.
+        """
+        self._clients.add(asyncio.current_task())
+        connection = _Connection(writer)
+        requests: Set[asyncio.Task] = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError) as e:
+                    logger.warning(f"Control client dropped: {e}")
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self._answer(line, connection))
+                requests.add(task)
+                task.add_done_callback(requests.discard)
+            if requests:
+                await asyncio.gather(*requests, return_exceptions=True)
+        finally:
+            connection.close()
+            for task in requests:
+                task.cancel()
+            self._clients.discard(asyncio.current_task())
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _answer(self, line: bytes, connection: _Connection) -> None:
+        """
+        Handles a request and writes its response.
+        """
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise ControlError("Invalid JSON.")
+            if not isinstance(request, dict):
+                raise ControlError("A request must be an object.")
+            request_id = request.get("id")
+            command = self._commands.get(request.get("cmd"))
+            if command is None:
+                raise ControlError(f"Unknown command {request.get('cmd')!r}.")
+            response = {
+                "id": request_id,
+                "ok": True,
+                "result": await command(request, connection),
+            }
+        except ControlError as e:
+            response = {"id": request_id, "ok": False, "error": str(e)}
+        except Exception as e:
+            logger.error(f"Control request failed: {e}")
+            response = {"id": request_id, "ok": False, "error": str(e)}
+        await connection.send(response)
+
+    def _names(self, request: Dict[str, Any]) -> List[str] | None:
+        """
+        Gets the services of a request, checking that they exist.
+        """
+        names = request.get("services")
+        if names is None:
+            return None
+        if not isinstance(names, list) or not all(
+            isinstance(name, str) for name in names
+        ):
+            raise ControlError("services must be a list of names.")
+        unknown = [name for name in names if name not in self._handler.services]
+        if unknown:
+            raise ControlError(f"Unknown services: {', '.join(unknown)}.")
+        return names
+
+    async def _status(
+        self, request: Dict[str, Any], connection: _Connection
+    ) -> Dict[str, Any]:
+        names = self._names(request)
+        model = self._handler.status_model
+        if names is None:
+            summaries = model.summaries()
+        else:
+            summaries = [
+                model.summary(service.config.name)
+                for service in self._handler.services.select(names)
+            ]
+        status = {
+            "version": model.version,
+            "counts": {state.value: count for state, count in model.counts.items()},
+            "services": [summary.row for summary in summaries],
+        }
+        if model.autostart_seconds is not None:
+            status["autostart_seconds"] = model.autostart_seconds
+        budget = self._handler.restart_budget
+        if budget is not None:
+            status["restarts"] = {
+                "queued": budget.waiting,
+                "throttled": sum(budget.throttled.values()),
+            }
+        return status
+
+    async def _start(self, request: Dict[str, Any], connection: _Connection) -> None:
+        await self._handler.start(self._names(request))
+
+    async def _stop(self, request: Dict[str, Any], connection: _Connection) -> None:
+        await self._handler.stop(self._names(request))
+
+    async def _restart(self, request: Dict[str, Any], connection: _Connection) -> None:
+        await self._handler.restart(self._names(request))
+
+    async def _reload_config(
+        self, request: Dict[str, Any], connection: _Connection
+    ) -> Any:
+        if self._reload is None:
+            raise ControlError("Reload is not supported.")
+        return await self._reload()
+
+    async def _subscribe(self, request: Dict[str, Any], connection: _Connection) -> int:
+        names = request.get("services")
+        if names is not None and (
+            not isinstance(names, list)
+            or not all(isinstance(name, str) for name in names)
+        ):
+            raise ControlError("services must be a list of names or patterns.")
+        try:
+            kinds = request.get("kinds")
+            kinds = [EventKind(kind) for kind in kinds] if kinds is not None else None
+        except (TypeError, ValueError):
+            raise ControlError(
+                f"kinds must be a list of {', '.join(kind.value for kind in EventKind)}."
+            )
+        interval = request.get("interval")
+        if interval is not None and (
+            not isinstance(interval, (int, float)) or interval <= 0
+        ):
+            raise ControlError("interval must be a positive number of seconds.")
+        buffer = request.get("buffer", STREAM_BUFFER)
+        if not isinstance(buffer, int) or buffer < 1:
+            raise ControlError("buffer must be a positive number of events.")
+
+        events = None
+        if request.get("events", True):
+            exact = names is not None and not any(map(_is_pattern, names))
+            events = self._handler.events.subscribe(
+                maxsize=buffer,
+                policy=DropPolicy.DROP_OLDEST,
+                kinds=kinds,
+                services=names if exact else None,
+                patterns=names if not exact else None,
+            )
+        # Nothing is awaited from here to the response, so the response comes
+        # before the first message of the stream.
+        stream = _Stream(
+            stream_id=next(self._stream_ids),
+            connection=connection,
+            handler=self._handler,
+            names=names,
+            events=events,
+            interval=interval,
+            states=bool(request.get("states", False)),
+        )
+        connection.streams[stream.id] = stream
+        return stream.id
+
+    async def _unsubscribe(
+        self, request: Dict[str, Any], connection: _Connection
+    ) -> None:
+        stream = connection.streams.pop(request.get("stream"), None)
+        if stream is None:
+            raise ControlError(f"Unknown stream {request.get('stream')!r}.")
+        stream.close()
+
+
+class ControlClient:
+    """
+    A client of the control protocol, see ControlServer.
+
+    Requests can be pipelined: `request` may be awaited concurrently, responses
+    are matched to their request by id.
+    """
+
+    def __init__(self) -> None:
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        # Stream id -> its messages, not read yet
+        self._streams: Dict[int, asyncio.Queue] = {}
+        self._receiver: asyncio.Task | None = None
+
+    async def connect(self, path: str = DEFAULT_SOCKET) -> "ControlClient":
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            path, limit=MAX_LINE
+        )
+        self._receiver = asyncio.create_task(self._receive())
+        return self
+
+    async def close(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.close()
+        with contextlib.suppress(ConnectionError):
+            await self._writer.wait_closed()
+        if self._receiver is not None:
+            self._receiver.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._receiver
+        self._writer = None
+
+    async def __aenter__(self) -> "ControlClient":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    def send(self, cmd: str, **params: Any) -> asyncio.Future:
+        """
+        Sends a request without waiting for its response.
+
+        Returns:
+            A future resolved with the response.
+        """
+        if self._writer is None:
+            raise ControlError("Not connected.")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        request = {"id": request_id, "cmd": cmd, **params}
+        self._writer.write(json.dumps(request).encode() + b"\n")
+        return future
+
+    async def request(self, cmd: str, **params: Any) -> Any:
+        """
+        Sends a request and waits for its response.
+
+        Returns:
+            The result of the request.
+
+        Raises:
+            ControlError: If the request failed.
+        """
+        future = self.send(cmd, **params)
+        await self._writer.drain()
+        response = await future
+        if not response.get("ok"):
+            raise ControlError(response.get("error"))
+        return response.get("result")
+
+    async def subscribe(self, **params: Any) -> "ControlStream":
+        """
+        Subscribes to a stream, see ControlServer for the parameters.
+
+        Returns:
+            The stream, iterating over its messages, each with an `event` or a
+            `delta`, until it is closed or the connection is.
+
+        Raises:
+            ControlError: If the subscription failed.
+        """
+        stream_id = await self.request("subscribe", **params)
+        queue = self._streams.setdefault(stream_id, asyncio.Queue())
+        return ControlStream(self, stream_id, queue)
+
+    async def _receive(self) -> None:
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                if "stream" in response:
+                    queue = self._streams.setdefault(
+                        response["stream"], asyncio.Queue()
+                    )
+                    queue.put_nowait(response)
+                    continue
+                future = self._pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ControlError("Connection closed."))
+            self._pending.clear()
+            for queue in self._streams.values():
+                queue.put_nowait(None)
+
+
+class ControlStream:
+    """
+    A stream subscribed to with ControlClient.subscribe, read with `async for`.
+    """
+
+    def __init__(
+        self, client: ControlClient, stream_id: int, queue: asyncio.Queue
+    ) -> None:
+        self.id = stream_id
+        self._client = client
+        self._queue = queue
+
+    def __aiter__(self) -> "ControlStream":
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        message = await self._queue.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def close(self) -> None:
+        """
+        Stops the stream. The messages already received can still be read.
+        """
+        await self._client.request("unsubscribe", stream=self.id)
+        # The server sends nothing more on the stream after the response
+        self._client._streams.pop(self.id, None)
+        self._queue.put_nowait(None)
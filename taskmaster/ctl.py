@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import json
+import shlex
+import sys
+import time
+from typing import Any, List
+
+from .control import ControlClient, ControlError, DEFAULT_SOCKET
+from .gui.table import table
+
+
+def format_result(cmd: str, result: Any) -> str:
+    """
+    Formats the result of a command for the terminal.
+
+    Args:
+        cmd: The command.
+        result: Its result.
+
+    Returns:
+        The text to print.
+    """
+    if cmd == "status":
+        counts = ", ".join(
+            f"{state}: {count}" for state, count in result["counts"].items()
+        )
+        if "restarts" in result:
+            counts += (
+                f"\nrestarts queued: {result['restarts']['queued']}, "
+                f"throttled: {result['restarts']['throttled']}"
+            )
+        if "autostart_seconds" in result:
+            counts += f"\nautostart: {result['autostart_seconds']:.3f}s"
+        return table(result["services"]) + counts
+    if result is None:
+        return f"{cmd}: ok"
+    if isinstance(result, str):
+        return result
+    return json.dumps(result, indent=2)
+
+
+def format_message(message: dict[str, Any]) -> str:
+    """
+    Formats a message of a stream (see `watch`) as one line.
+    """
+    if "event" in message:
+        event = message["event"]
+        line = (
+            f"{time.strftime('%H:%M:%S', time.localtime(event['timestamp']))} "
+            f"{event['service']} [{event['pid']}] {event['kind']}"
+        )
+        if event["exitcode"] is not None:
+            line += f" ({event['exitcode']})"
+        if message.get("dropped"):
+            line = f"({message['dropped']} events dropped)\n{line}"
+        return line
+    delta = message["delta"]
+    lines = [
+        f"{entry['name']}: "
+        + ", ".join(f"{state}: {count}" for state, count in entry["counts"].items())
+        for entry in delta["changed"]
+    ]
+    if "order" in delta:
+        lines.insert(0, f"services: {', '.join(delta['order'])}")
+    return "\n".join(lines)
+
+
+async def watch(path: str, services: List[str], interval: float | None) -> int:
+    """
+    Prints the lifecycle events, and the status changes every interval if
+    given, of the services (names or glob patterns), until interrupted.
+
+    Returns:
+        The exit status.
+    """
+    async with await ControlClient().connect(path) as client:
+        try:
+            stream = await client.subscribe(
+                services=services or None, interval=interval
+            )
+        except ControlError as e:
+            print(f"watch: {e}", file=sys.stderr)
+            return 1
+        async for message in stream:
+            print(format_message(message), flush=True)
+    return 0
+
+
+def parse_command(words: List[str]) -> tuple[str, dict[str, Any]]:
+    """
+    Parses a command line, `COMMAND [SERVICE...]`.
+
+    Returns:
+        The command and its parameters.
+    """
+    cmd, names = words[0], words[1:]
+    return cmd, {"services": names} if names else {}
+
+
+async def run(path: str, commands: List[List[str]]) -> int:
+    """
+    Sends the commands, pipelined, and prints their results in order.
+
+    Returns:
+        The exit status: 0 if every command succeeded, 1 otherwise.
+    """
+    status = 0
+    async with await ControlClient().connect(path) as client:
+        parsed = [parse_command(words) for words in commands]
+        futures = [client.send(cmd, **params) for cmd, params in parsed]
+        for (cmd, _), future in zip(parsed, futures):
+            try:
+                response = await future
+            except ControlError as e:
+                print(f"{cmd}: {e}", file=sys.stderr)
+                return 1
+            if response.get("ok"):
+                print(format_result(cmd, response.get("result")))
+            else:
+                print(f"{cmd}: {response.get('error')}", file=sys.stderr)
+                status = 1
+    return status
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="taskmasterctl",
+        description="Control a taskmaster daemon. Without a command, the commands "
+        "are read from stdin, one per line, and sent pipelined.",
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        default=DEFAULT_SOCKET,
+        help=f"Path of the control socket, default={DEFAULT_SOCKET}",
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        help="With watch, also print the status changes every interval (seconds)",
+    )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        help="status, start, stop, restart, reload or watch ('-' to read stdin)",
+    )
+    parser.add_argument("services", nargs="*", help="The services to act on")
+    args = parser.parse_args()
+    if args.command == "watch":
+        try:
+            sys.exit(asyncio.run(watch(args.socket, args.services, args.interval)))
+        except KeyboardInterrupt:
+            return
+        except OSError as e:
+            print(f"Cannot connect to {args.socket}: {e}", file=sys.stderr)
+            sys.exit(1)
+    if args.command in (None, "-"):
+        commands = [shlex.split(line) for line in sys.stdin]
+        commands = [words for words in commands if words]
+    else:
+        commands = [[args.command, *args.services]]
+    if not commands:
+        return
+    try:
+        sys.exit(asyncio.run(run(args.socket, commands)))
+    except OSError as e:
+        print(f"Cannot connect to {args.socket}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,28 @@ import curses
 from .table import table
 from ..utils.logger import logger
 from ..utils.log_reader import LogReader
+from ..utils.resources import format_size
 import asyncio
 
 
+def _with_resources(rows, sampler):
+    # Insert the sampled cpu and memory of each service after its command
+    table_rows = []
+    for name, row in rows.items():
+        usage = sampler.service(name)
+        sampled = usage.processes > 0
+        table_rows.append(
+            {
+                "name": row["name"],
+                "cmd": row["cmd"],
+                "cpu": f"{usage.cpu_percent:.1f}%" if sampled else "-",
+                "mem": format_size(usage.rss) if sampled else "-",
+                **row,
+            }
+        )
+    return table_rows
+
+
 def services(self) -> None:
     # Services page
     try:
@@ -16,10 +35,28 @@ def services(self) -> None:
             self.win_data["services"]["index_x"] = 0
             self.win_data["services"]["index_y"] = 0
             self.win_data["services"]["selected_line"] = 0
+            self.win_data["services"]["status_version"] = -1
+            self.win_data["services"]["sample_version"] = -1
+            self.win_data["services"]["rows"] = dict()
         self.win_active = "services"
         self.box("services")
         self.win["services"].addstr(3, 4, "Taskmaster - Services")
-        content = table(self.service_handler.status)
+        # Only rebuild the table when a service changed since the last redraw
+        delta = self.service_handler.status_model.changes(
+            self.win_data["services"]["status_version"]
+        )
+        sampler = self.service_handler.sampler
+        if delta or self.win_data["services"]["sample_version"] != sampler.version:
+            rows = self.win_data["services"]["rows"]
+            for summary in delta.changed:
+                rows[summary.name] = summary.row
+            if delta.order is not None:
+                rows = {name: rows[name] for name in delta.order}
+            self.win_data["services"]["rows"] = rows
+            self.win_data["services"]["content"] = table(_with_resources(rows, sampler))
+        self.win_data["services"]["status_version"] = delta.version
+        self.win_data["services"]["sample_version"] = sampler.version
+        content = self.win_data["services"]["content"]
         # Clear the window
         for i in range(self.height - 8):
             self.win["services"].addstr(4 + i, 4, " " * (self.width - 6))
@@ -0,0 +1,409 @@
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+import asyncio
+import contextlib
+
+from .service import ServiceHandler
+from .utils.events import Event, EventKind
+from .utils.logger import logger
+
+DEFAULT_HOST = "127.0.0.1"
+# Latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+# The longest request head accepted, in bytes
+MAX_REQUEST = 8192
+REQUEST_TIMEOUT = 5
+
+
+class Histogram:
+    """
+    A Prometheus histogram: the number of observations per bucket, their sum
+    and their count.
+
+    Args:
+        buckets: The upper bounds of the buckets, increasing.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # One more for the observations above every bound (+Inf)
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str = "") -> List[str]:
+        """
+        Renders the samples of the histogram.
+
+        Args:
+            name: The name of the metric.
+            labels: The labels, rendered, without braces.
+
+        Returns:
+            The lines of the samples.
+        """
+        separator = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}')
+        braces = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{braces} {self.sum}")
+        lines.append(f"{name}_count{braces} {self.count}")
+        return lines
+
+
+def _label(value: str) -> str:
+    """
+    Escapes a label value.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Aggregates the metrics of a service handler, rendered in the Prometheus text
+    format.
+
+    Counters and histograms are updated as the lifecycle events are published
+    (a synchronous listener of the event bus, so none is missed), and the process
+    gauges come from the state counts the services maintain and the per-service
+    sums of the resource sampler. Rendering only walks these aggregates, never
+    the processes.
+
+    Args:
+        handler: The service handler.
+        lag_interval: The seconds between two event-loop lag measures.
+    """
+
+    def __init__(self, handler: ServiceHandler, lag_interval: float = 1) -> None:
+        self._handler = handler
+        self._lag_interval = lag_interval
+        self._lag_task: asyncio.Task | None = None
+        self.spawns: Dict[str, int] = {}
+        self.restarts: Dict[str, int] = {}
+        self.backoffs: Dict[str, int] = {}
+        self.fatals: Dict[str, int] = {}
+        self.limit_restarts: Dict[str, int] = {}
+        self.orphans: Dict[str, int] = {}
+        # (service, exit code) -> count
+        self.exits: Dict[Tuple[str, int], int] = {}
+        # (service, state) -> seconds spent by processes in the state, once left
+        self.state_seconds: Dict[Tuple[str, EventKind], float] = {}
+        self.spawn_latency: Dict[str, Histogram] = {}
+        self.stop_latency: Dict[str, Histogram] = {}
+        self.lag = Histogram(LAG_BUCKETS)
+        self.last_lag: float = 0
+        # pid -> (last event, its timestamp), while the process is alive
+        self._since: Dict[int, Tuple[EventKind, float]] = {}
+        handler.events.listen(self._on_event)
+
+    def start(self) -> None:
+        """
+        Starts measuring the event-loop lag.
+        """
+        if self._lag_task is None:
+            self._lag_task = asyncio.create_task(self._measure_lag())
+
+    def close(self) -> None:
+        self._handler.events.unlisten(self._on_event)
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+    def _on_event(self, event: Event) -> None:
+        service, kind = event.service, event.kind
+        if kind == EventKind.SPAWNED:
+            self.spawns[service] = self.spawns.get(service, 0) + 1
+            if event.previous in (EventKind.EXITED, EventKind.BACKOFF):
+                self.restarts[service] = self.restarts.get(service, 0) + 1
+        elif kind == EventKind.BACKOFF:
+            self.backoffs[service] = self.backoffs.get(service, 0) + 1
+        elif kind == EventKind.FATAL:
+            self.fatals[service] = self.fatals.get(service, 0) + 1
+        elif kind == EventKind.LIMIT_EXCEEDED:
+            # Not a state of the process, it is restarted through the usual ones
+            self.limit_restarts[service] = self.limit_restarts.get(service, 0) + 1
+            return
+        elif kind == EventKind.ORPHANED:
+            # The pid is the orphan's, not one of a process of the service
+            self.orphans[service] = self.orphans.get(service, 0) + 1
+            return
+        elif kind == EventKind.EXITED and event.exitcode is not None:
+            key = (service, event.exitcode)
+            self.exits[key] = self.exits.get(key, 0) + 1
+
+        if event.pid is None:
+            return
+        since = self._since.pop(event.pid, None)
+        if since is not None:
+            previous, timestamp = since
+            elapsed = max(0.0, event.timestamp - timestamp)
+            key = (service, previous)
+            self.state_seconds[key] = self.state_seconds.get(key, 0) + elapsed
+            if previous == EventKind.SPAWNED and kind == EventKind.RUNNING:
+                self._histogram(self.spawn_latency, service).observe(elapsed)
+            elif previous == EventKind.STOPPING and kind == EventKind.STOPPED:
+                self._histogram(self.stop_latency, service).observe(elapsed)
+        if kind in (EventKind.SPAWNED, EventKind.RUNNING, EventKind.STOPPING):
+            self._since[event.pid] = (kind, event.timestamp)
+
+    @staticmethod
+    def _histogram(histograms: Dict[str, Histogram], service: str) -> Histogram:
+        histogram = histograms.get(service)
+        if histogram is None:
+            histogram = histograms[service] = Histogram(LATENCY_BUCKETS)
+        return histogram
+
+    async def _measure_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            began = loop.time()
+            await asyncio.sleep(self._lag_interval)
+            self.last_lag = max(0.0, loop.time() - began - self._lag_interval)
+            self.lag.observe(self.last_lag)
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text format (version 0.0.4).
+        """
+        lines: List[str] = []
+
+        def header(name: str, kind: str, help: str) -> None:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        services = self._handler.services
+        header("taskmaster_services", "gauge", "Number of services.")
+        lines.append(f"taskmaster_services {len(services)}")
+        header("taskmaster_processes", "gauge", "Number of processes per state.")
+        for service in services:
+            name = _label(service.config.name)
+            for state, count in service.state_counts.items():
+                lines.append(
+                    f'taskmaster_processes{{service="{name}",'
+                    f'state="{state.value.lower()}"}} {count}'
+                )
+
+        resources = self._handler.sampler.services()
+        for metric, field, help in (
+            ("taskmaster_cpu_percent", "cpu_percent", "CPU used, 100 for one core."),
+            ("taskmaster_rss_bytes", "rss", "Resident memory."),
+            ("taskmaster_open_fds", "fds", "Open file descriptors."),
+            ("taskmaster_threads", "threads", "Threads."),
+        ):
+            header(metric, "gauge", f"{help} Summed over the processes, sampled.")
+            for service, usage in resources.items():
+                lines.append(
+                    f'{metric}{{service="{_label(service)}"}} {getattr(usage, field)}'
+                )
+
+        for metric, counts, help in (
+            ("taskmaster_spawns_total", self.spawns, "Processes spawned."),
+            (
+                "taskmaster_restarts_total",
+                self.restarts,
+                "Processes spawned again after an exit or a failed spawn.",
+            ),
+            ("taskmaster_backoffs_total", self.backoffs, "Failed spawns."),
+            ("taskmaster_fatals_total", self.fatals, "Processes given up on."),
+            (
+                "taskmaster_limit_restarts_total",
+                self.limit_restarts,
+                "Processes restarted for exceeding a resource limit.",
+            ),
+            (
+                "taskmaster_orphans_total",
+                self.orphans,
+                "Orphaned descendants of the processes adopted by taskmaster.",
+            ),
+        ):
+            header(metric, "counter", help)
+            for service, count in counts.items():
+                lines.append(f'{metric}{{service="{_label(service)}"}} {count}')
+
+        header(
+            "taskmaster_stop_leftovers_total",
+            "counter",
+            "Processes killed because they outlived the stop of their process "
+            "group or service.",
+        )
+        for service in services:
+            lines.append(
+                "taskmaster_stop_leftovers_total"
+                f'{{service="{_label(service.config.name)}"}} {service.leftovers}'
+            )
+
+        budget = self._handler.restart_budget
+        if budget is not None:
+            header(
+                "taskmaster_restart_queue_depth",
+                "gauge",
+                "Restarts waiting for the restart budget.",
+            )
+            lines.append(f"taskmaster_restart_queue_depth {budget.waiting}")
+            header(
+                "taskmaster_restarts_throttled_total",
+                "counter",
+                "Restarts that had to wait for the restart budget.",
+            )
+            for service, count in budget.throttled.items():
+                lines.append(
+                    "taskmaster_restarts_throttled_total"
+                    f'{{service="{_label(service)}"}} {count}'
+                )
+
+        autostart = self._handler.status_model.autostart_seconds
+        if autostart is not None:
+            header(
+                "taskmaster_autostart_seconds",
+                "gauge",
+                "Seconds from the first autostart until every autostart service "
+                "was running.",
+            )
+            lines.append(f"taskmaster_autostart_seconds {autostart}")
+
+        header("taskmaster_exits_total", "counter", "Process exits per exit code.")
+        for (service, code), count in self.exits.items():
+            lines.append(
+                f'taskmaster_exits_total{{service="{_label(service)}",'
+                f'code="{code}"}} {count}'
+            )
+        header(
+            "taskmaster_state_seconds_total",
+            "counter",
+            "Seconds spent by processes in each state, counted when they leave it.",
+        )
+        for (service, state), seconds in self.state_seconds.items():
+            lines.append(
+                f'taskmaster_state_seconds_total{{service="{_label(service)}",'
+                f'state="{state.value}"}} {seconds}'
+            )
+
+        for metric, histograms, help in (
+            (
+                "taskmaster_spawn_seconds",
+                self.spawn_latency,
+                "Seconds from spawn to running.",
+            ),
+            (
+                "taskmaster_stop_seconds",
+                self.stop_latency,
+                "Seconds from the stop signal to the exit.",
+            ),
+        ):
+            header(metric, "histogram", help)
+            for service, histogram in histograms.items():
+                lines.extend(histogram.render(metric, f'service="{_label(service)}"'))
+
+        header(
+            "taskmaster_event_loop_lag_seconds",
+            "histogram",
+            "Delay of the event loop in waking up a sleeping task.",
+        )
+        lines.extend(self.lag.render("taskmaster_event_loop_lag_seconds"))
+        header(
+            "taskmaster_event_loop_last_lag_seconds",
+            "gauge",
+            "The last event-loop lag measured.",
+        )
+        lines.append(f"taskmaster_event_loop_last_lag_seconds {self.last_lag}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves the metrics at `/metrics` over HTTP, with the standard library only.
+
+    Args:
+        handler: The service handler.
+        port: The port to listen on.
+        host: The address to listen on, the loopback by default.
+        lag_interval: The seconds between two event-loop lag measures.
+    """
+
+    def __init__(
+        self,
+        handler: ServiceHandler,
+        port: int,
+        host: str = DEFAULT_HOST,
+        lag_interval: float = 1,
+    ) -> None:
+        self.metrics = Metrics(handler, lag_interval)
+        self._host = host
+        self._port = port
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def port(self) -> int:
+        """
+        Gets the port listened on (the one picked by the system if 0 was given).
+        """
+        if self._server is not None and self._server.sockets:
+            return self._server.sockets[0].getsockname()[1]
+        return self._port
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._serve, host=self._host, port=self._port, limit=MAX_REQUEST
+        )
+        self.metrics.start()
+        logger.info(f"Metrics served on http://{self._host}:{self.port}/metrics.")
+
+    async def close(self) -> None:
+        self.metrics.close()
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            head = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT
+            )
+            request = head.split(b"\r\n", 1)[0].decode("latin-1").split()
+            if len(request) != 3:
+                status, body = "400 Bad Request", "Bad request.\n"
+            elif request[0] not in ("GET", "HEAD"):
+                status, body = "405 Method Not Allowed", "Method not allowed.\n"
+            elif request[1].split("?", 1)[0] != "/metrics":
+                status, body = "404 Not Found", "Not found, see /metrics.\n"
+            else:
+                status, body = "200 OK", self.metrics.render()
+            content = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+            )
+            if request[:1] != ["HEAD"]:
+                writer.write(content)
+            await writer.drain()
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            asyncio.TimeoutError,
+            ConnectionError,
+        ):
+            pass
+        except Exception as e:
+            logger.error(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
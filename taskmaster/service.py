@@ -1,19 +1,93 @@
-from asyncio.subprocess import Process
 from io import TextIOWrapper
-from typing import List, Dict, Any, Optional, Self
+from typing import (
+    List,
+    Dict,
+    Any,
+    Callable,
+    Coroutine,
+    Optional,
+    Self,
+    AsyncContextManager,
+)
 import subprocess
 from enum import Enum
 import asyncio
 import contextlib
+import signal
+import os
+import time
 
 from .utils.logger import logger
 from .utils.config import Signal, AutoRestart
 from .utils.email import Email
+from .utils.child_watcher import ChildWatcher
+from .utils.timer_wheel import TimerWheel
+from .utils.spawn_scheduler import SpawnScheduler
+from .utils.dependencies import DependencyError, dependents_of, topological_layers
+from .utils.probes import Probe, ProbeError
+from .utils.watchdog import Watchdog
+from .utils.reload_plan import Action, ReloadPlan, ServiceDiff
+from .utils.registry import ServiceRegistry
+from .utils.events import Event, EventBus, EventKind, Subscription
+from .utils.status import ServiceSummary, StatusModel
+from .utils.resources import ResourceSampler
+from .utils.limits import ResourceGuard, ResourceLimits
+from .utils.cgroups import CgroupTree, ServiceCgroup, cgroup_limits
+from .utils.backoff import RestartPolicy
+from .utils.restart_budget import RestartBudget
+from .utils.process_tree import (
+    group_alive,
+    group_members,
+    kill_group,
+    signal_group,
+    still_in_group,
+)
+from .utils.spawn import (
+    ChildProcess,
+    SpawnBackend,
+    SpawnPath,
+    SpawnPlan,
+    SpawnPlanError,
+    spawn,
+)
+
+# Seconds between two checks of the processes left in the group of a stopped process
+GROUP_POLL = 0.05
 
 
 class SubProcess:
     """Represents a subprocess of a service."""
 
+    # A service runs up to 4096 of them, no per-instance dict
+    __slots__ = (
+        "_parent_name",
+        "_cmd",
+        "_umask",
+        "_workingdir",
+        "_stdout",
+        "_stderr",
+        "_user",
+        "_env",
+        "_process",
+        "_exit",
+        "_state",
+        "_retries",
+        "__killing",
+        "_events",
+        "_timers",
+        "_plan",
+        "_spawn_backend",
+        "_scheduler",
+        "_priority",
+        "_readiness",
+        "_spawned_at",
+        "on_state_change",
+        "_index",
+        "_restart_policy",
+        "stop_latency",
+        "leftovers",
+    )
+
     class State(Enum):
         """
         The state of a process.
@@ -38,7 +112,18 @@ class SubProcess:
         stderr: int | TextIOWrapper = subprocess.DEVNULL,
         user: str | None = None,
         env: Dict[str, str] | None = None,
-        email: Email | None = None,
+        events: EventBus | None = None,
+        timers: TimerWheel | None = None,
+        plan: SpawnPlan | None = None,
+        spawn_backend: SpawnBackend = SpawnBackend.FAST,
+        scheduler: SpawnScheduler | None = None,
+        priority: int = 999,
+        readiness: Probe | None = None,
+        on_state_change: (
+            Callable[["SubProcess", "SubProcess.State", "SubProcess.State"], Any] | None
+        ) = None,
+        index: int = 0,
+        restart_policy: Callable[[], RestartPolicy] | None = None,
     ) -> None:
         self._parent_name = parent_name
         self._cmd = cmd
@@ -48,11 +133,29 @@ class SubProcess:
         self._stderr = stderr
         self._user = user
         self._env = env
-        self._process: Process | None = None
+        self._process: ChildProcess | None = None
+        self._exit: asyncio.Future[int] | None = None
         self._state: SubProcess.State = self.State.STOPPED
         self._retries: int = 0
         self.__killing: bool = False
-        self._email: Email | None = email
+        self._events: EventBus | None = events
+        self._timers: TimerWheel | None = timers
+        self._plan: SpawnPlan | None = plan
+        self._spawn_backend: SpawnBackend = spawn_backend
+        self._scheduler: SpawnScheduler | None = scheduler
+        self._priority: int = priority
+        self._readiness: Probe | None = readiness
+        self._spawned_at: float | None = None
+        self.on_state_change = on_state_change
+        # The index of the process in its service, for the spread CPU affinity
+        self._index: int = index
+        # Gets the backoff and circuit breaker of the service, reloads included
+        self._restart_policy: Callable[[], RestartPolicy] = (
+            restart_policy or RestartPolicy
+        )
+        # Seconds the last stop took, and the processes of its tree killed then
+        self.stop_latency: float | None = None
+        self.leftovers: int = 0
 
     async def delete(self) -> None:
         """
@@ -60,10 +163,10 @@ class SubProcess:
         """
         self.__killing = True
         try:
-            if self._process and self._process.returncode is None:
+            if self._process and not self._exited:
                 logger.info(f"Terminating process {self._parent_name}")
-                self._process.terminate()
-                await self._process.wait()
+                self._send_signal(signal.SIGTERM)
+                await self._wait_exit()
                 logger.debug(f"Process {self._parent_name} terminated.")
         except ProcessLookupError as e:
             logger.error(f"Failed to terminate process {self._parent_name}: {e}")
@@ -78,9 +181,28 @@ class SubProcess:
     @state.setter
     def state(self, value: State) -> None:
         """
-        Sets the state of the subprocess.
+        Sets the state of the subprocess, reports the transition to
+        `on_state_change` if any, and publishes it on the event bus.
         """
-        self._state = value
+        previous, self._state = self._state, value
+        if previous == value:
+            return
+        if self.on_state_change is not None:
+            self.on_state_change(self, previous, value)
+        if self._events is not None:
+            exitcode = None
+            if self._process is not None and value != self.State.STARTING:
+                exitcode = self._process.returncode
+            self._events.publish(
+                Event(
+                    kind=EVENT_KINDS[value],
+                    service=self._parent_name,
+                    pid=self._process.pid if self._process else None,
+                    exitcode=exitcode,
+                    previous=EVENT_KINDS[previous],
+                    leftovers=self.leftovers if value == self.State.STOPPED else None,
+                )
+            )
 
     @property
     def retries(self) -> int:
@@ -129,37 +251,216 @@ class SubProcess:
         self._stderr = config["stderr"]
         self._user = config["user"]
         self._env = config["env"]
+        self._plan = None
 
     @property
-    def email(self) -> Email | None:
+    def plan(self) -> SpawnPlan | None:
         """
-        Gets the email configuration.
+        Gets the precompiled spawn plan of the subprocess.
         """
-        return self._email
+        return self._plan
 
-    @email.setter
-    def email(self, email: Email | None) -> None:
+    @plan.setter
+    def plan(self, plan: SpawnPlan | None) -> None:
         """
-        Sets the email configuration.
+        Sets the precompiled spawn plan of the subprocess.
+
+        Without a plan, one is compiled from the configuration at every spawn.
         """
-        self._email = email
+        self._plan = plan
 
-    async def _poll(self) -> int | None:
-        if not self._process:
-            return
-        with contextlib.suppress(asyncio.TimeoutError):
-            await asyncio.wait_for(self._process.wait(), 1e-6)
-        return self._process.returncode
+    @property
+    def priority(self) -> int:
+        """
+        Gets the start priority of the subprocess, lower starts first.
+        """
+        return self._priority
+
+    @priority.setter
+    def priority(self, priority: int) -> None:
+        """
+        Sets the start priority of the subprocess.
+        """
+        self._priority = priority
+
+    @property
+    def readiness(self) -> Probe | None:
+        """
+        Gets the readiness probe of the subprocess, if any.
+        """
+        return self._readiness
+
+    @readiness.setter
+    def readiness(self, readiness: Probe | None) -> None:
+        """
+        Sets the readiness probe of the subprocess.
+
+        Without a probe, the process is running once it survived `starttime`.
+        """
+        self._readiness = readiness
+
+    @property
+    def pid(self) -> int | None:
+        """
+        Gets the pid of the last spawned process, None if it never was.
+        """
+        return self._process.pid if self._process else None
+
+    @property
+    def restart_policy(self) -> RestartPolicy:
+        """
+        Gets how the subprocess is retried.
+        """
+        return self._restart_policy()
+
+    @property
+    def index(self) -> int:
+        """
+        Gets the index of the process in its service.
+        """
+        return self._index
+
+    @property
+    def spawned_at(self) -> float | None:
+        """
+        Gets the time (as returned by time.time) the last process was spawned.
+        """
+        return self._spawned_at
+
+    @property
+    def spawn_path(self) -> SpawnPath | None:
+        """
+        Gets the way the last process was spawned, None if it never was.
+        """
+        return self._process.path if self._process else None
+
+    @property
+    def events(self) -> EventBus | None:
+        """
+        Gets the event bus the lifecycle events are published to.
+        """
+        return self._events
+
+    @events.setter
+    def events(self, events: EventBus | None) -> None:
+        """
+        Sets the event bus the lifecycle events are published to.
+        """
+        self._events = events
+
+    @property
+    def _exited(self) -> bool:
+        """
+        Whether the last spawned process has exited (or none was spawned).
+        """
+        return self._exit is None or self._exit.done()
 
-    async def start(self, retries: int, starttime: int) -> Self:
+    @property
+    def timers(self) -> TimerWheel:
+        """
+        Gets the timer wheel holding the deadlines of the subprocess.
+        """
+        if self._timers is None:
+            self._timers = TimerWheel.current()
+        return self._timers
+
+    def _spawn(self) -> None:
+        """
+        Spawns the process and registers it with the child watcher.
+        """
+        plan = self._plan or SpawnPlan.compile(
+            cmd=self._cmd,
+            umask=self._umask,
+            workingdir=self._workingdir,
+            user=self._user,
+            env=self._env,
+        )
+        self._spawned_at = time.time()
+        self._process = spawn(
+            plan, self._stdout, self._stderr, self._spawn_backend, self._index
+        )
+        self._exit = ChildWatcher.current().watch(self._process.pid)
+        self._exit.add_done_callback(self._on_exit)
+
+    def _on_exit(self, future: asyncio.Future[int]) -> None:
+        """
+        Records the return code of the reaped process.
+        """
+        if self._process and not future.cancelled():
+            self._process.set_returncode(future.result())
+
+    def _send_signal(self, sig: int) -> None:
+        """
+        Sends a signal to the process group the process leads, if it has not been
+        reaped yet. To the process only if it left its group.
+        """
+        if self._process and not self._exited:
+            pid = self._process.pid
+            try:
+                if os.getpgid(pid) != pid or not signal_group(pid, sig):
+                    os.kill(pid, sig)
+            except ProcessLookupError:
+                # Reaped since the check, its exit is on the way
+                logger.debug(f"Process {self._parent_name} with pid {pid} is gone.")
+
+    async def _wait_exit(self, timeout: float | None = None) -> bool:
+        """
+        Waits for the process to exit without polling.
+
+        Args:
+            timeout: The maximum time to wait, in seconds. Waits forever if None.
+
+        Returns:
+            True if the process has exited.
+        """
+        if self._exit is None:
+            return True
+        return await self.timers.wait(self._exit, timeout=timeout)
+
+    async def _wait_ready(self, starttime: float) -> bool:
+        """
+        Runs the readiness probe until it passes, the process exits,
+        or `starttime` seconds elapse (never if 0).
+
+        Returns:
+            True if the process is ready.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + starttime if starttime > 0 else None
+        while not self._exited:
+            if await self._readiness.check(since=self._spawned_at, timers=self.timers):
+                return not self._exited
+            delay = self._readiness.interval
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            await self._wait_exit(timeout=delay)
+        return False
+
+    def _start_slot(self) -> AsyncContextManager[None]:
+        """
+        Gets a start slot from the spawn scheduler, if any.
+        """
+        if self._scheduler is None:
+            return contextlib.nullcontext()
+        return self._scheduler.slot(self._priority)
+
+    async def start(self, retries: int, starttime: float) -> Self:
         """
         Starts the subprocess.
 
         Retries will take increasingly more time depending on the number of subsequent attempts made,
-        adding one second each time. So if you set startretries=3, taskmaster will wait one,
+        adding one second each time by default. So if you set startretries=3, taskmaster will wait one,
         two and then three seconds between each restart attempt, for a total of 5 seconds.
+        See `RestartPolicy` for the other backoffs, and the circuit breaker that
+        retries past startretries.
+
+        With a readiness probe, the process is running as soon as the probe passes,
+        and `starttime` is the time it has to become ready.
         """
-        if self._process and await self._poll() is None:
+        if self._process and not self._exited:
             logger.warning(
                 f"Process {self._parent_name}-{self._process.pid} is already running."
             )
@@ -173,34 +474,35 @@ class SubProcess:
             try:
                 if self._cmd is None:
                     raise ValueError("Command is not provided.")
-                self._process = await asyncio.create_subprocess_exec(
-                    *self._cmd.split(),
-                    cwd=self._workingdir,
-                    env=self._env,
-                    stdout=self._stdout,
-                    stderr=self._stderr,
-                    umask=self._umask or 0,
-                    user=self._user,
-                )
-                self._state = self.State.STARTING
-                logger.info(
-                    f"Starting process: {self._parent_name} with pid: {self._process.pid}"
-                )
+                async with self._start_slot():
+                    if self.__killing:
+                        return self
+                    self._spawn()
+                    self.state = self.State.STARTING
+                    logger.info(
+                        f"Starting process: {self._parent_name} with pid: {self._process.pid}"
+                        f" ({self._process.path.value})"
+                    )
 
-                for _ in range(starttime * 10):
-                    if await self._poll() is not None:
-                        break
-                    await asyncio.sleep(0.1)
-                if starttime == 0 or await self._poll() is None:
+                    if self._readiness is not None:
+                        ready = await self._wait_ready(starttime)
+                    else:
+                        if starttime > 0:
+                            await self._wait_exit(timeout=starttime)
+                        ready = starttime == 0 or not self._exited
+                if ready:
                     logger.info(
                         f"Process {self._parent_name}-{self._process.pid} is now running."
                     )
-                    self._state = self.State.RUNNING
-                    if self._email:
-                        asyncio.create_task(
-                            self._email.send_start(self._parent_name, self._state.name)
-                        )
+                    self.state = self.State.RUNNING
                     success = True
+                elif not self._exited:
+                    logger.error(
+                        f"Process {self._parent_name}-{self._process.pid} is not ready after {starttime} seconds."
+                    )
+                    self._send_signal(signal.SIGKILL)
+                    await self._wait_exit()
+                    retries -= 1
                 else:
                     logger.error(
                         f"Process {self._parent_name}-{self._process.pid} has exited before {starttime} seconds."
@@ -210,26 +512,31 @@ class SubProcess:
             except Exception as e:
                 retries -= 1
                 self.retries += 1
-                self._state = self.State.BACKOFF
+                self.state = self.State.BACKOFF
                 logger.error(f"Failed to start process {self._parent_name}")
                 logger.debug(e)
 
-            if retries <= 0 or success:
+            policy = self.restart_policy
+            if success or (retries <= 0 and policy.breaker is None):
                 break
 
-            logger.info(
-                f"Retrying to start process {self._parent_name} in {self._retries} seconds."
-            )
+            logger.info(f"Retrying to start process {self._parent_name}.")
             logger.info(f"Retries left: {retries}")
-            await asyncio.sleep(self._retries + 1)
+            await policy.retry(self._retries + 1, self.timers)
 
         if not success:
-            self._state = self.State.FATAL
-            if self._email:
-                asyncio.create_task(
-                    self._email.send_exited(self._parent_name, self._state.name)
-                )
+            self.state = self.State.FATAL
+
+        return self
 
+    def fail(self, reason: str) -> Self:
+        """
+        Marks the subprocess as FATAL without trying to spawn it.
+
+        Used when its spawn plan was rejected, retrying would not help.
+        """
+        logger.error(f"Process {self._parent_name} cannot be started: {reason}")
+        self.state = self.State.FATAL
         return self
 
     async def wait(self, startretries: int) -> Self:
@@ -249,9 +556,16 @@ class SubProcess:
         logger.debug(
             f"Waiting for process {self._parent_name}-{self._process.pid} to finish."
         )
-        await self._process.wait()
+        await self._wait_exit()
+        if self._state in (self.State.STOPPING, self.State.STOPPED):
+            # Stopped on purpose, `stop` reports it
+            return self
         logger.info(f"Process {self._parent_name}-{self._process.pid} ended.")
-        if self.retries > 0 and self.retries >= startretries:
+        if (
+            self.retries > 0
+            and self.retries >= startretries
+            and self.restart_policy.breaker is None
+        ):
             logger.error(f"{self._parent_name}: Max retry attempt exceeded")
             self.state = SubProcess.State.FATAL
         else:
@@ -259,16 +573,17 @@ class SubProcess:
                 f"{self._parent_name}: Process exited with code {self._process.returncode}"
             )
             self.state = SubProcess.State.EXITED
-        if self._email:
-            asyncio.create_task(
-                self._email.send_exited(self._parent_name, self._state.name)
-            )
         return self
 
-    async def stop(self, stopsignal: str | Signal, stoptime: int) -> Self:
+    async def stop(self, stopsignal: str | Signal, stoptime: float) -> Self:
         """
-        Tries to stop the process using the given signal.
-        If the process is not stopped after stoptime seconds, it will be killed
+        Tries to stop the process using the given signal, sent to its process group.
+        If the process is not stopped after stoptime seconds, its whole group is
+        killed. If it stopped but processes it forked are still running by then,
+        they are killed.
+
+        The time it took is kept in `stop_latency`, the processes killed in
+        `leftovers`.
         """
         if not isinstance(stopsignal, Signal):
             stopsignal = Signal[str(stopsignal)]
@@ -282,32 +597,87 @@ class SubProcess:
             )
             return self
 
-        self._process.send_signal(stopsignal.value)
+        loop = asyncio.get_running_loop()
+        began = loop.time()
+        pgid = self._process.pid
+        self.leftovers = 0
+        self._send_signal(stopsignal.value)
         logger.info(f"Process {self._parent_name}: sending signal {stopsignal.name}")
-        self._state = self.State.STOPPING
-        for _ in range(stoptime * 10):
-            await asyncio.sleep(0.1)
-            if await self._poll():
-                break
-        if not await self._poll():
+        self.state = self.State.STOPPING
+        if not await self._wait_exit(timeout=stoptime):
             logger.warning(
                 f"Process {self._parent_name} unresponsive: killing forcefully"
             )
-            self._process.kill()
+            killed = kill_group(pgid)
+            # The process itself is not a leftover
+            self.leftovers = len([pid for pid in killed if pid != pgid])
+            self._send_signal(signal.SIGKILL)
+            await self._wait_exit()
+        else:
+            remaining = stoptime - (loop.time() - began)
+            self.leftovers = await self._stop_group(pgid, remaining)
+        if self.leftovers:
+            logger.warning(
+                f"Process {self._parent_name}: killed {self.leftovers} leftover "
+                "processes of its group."
+            )
+        self.stop_latency = loop.time() - began
         self.retries = 0
-        self._state = self.State.STOPPED
+        self.state = self.State.STOPPED
         logger.info(f"Process {self._parent_name} stopped successfully.")
-        if self._email:
-            asyncio.create_task(
-                self._email.send_stop(self._parent_name, self._state.name)
-            )
         return self
 
+    async def _stop_group(self, pgid: int, timeout: float) -> int:
+        """
+        Gives the rest of a process group `timeout` seconds to exit, then kills it.
+
+        The processes are not children of taskmaster, their exit cannot be
+        waited for: the ones in the group when the process exited are checked
+        every GROUP_POLL seconds (zombies aside, which nobody may reap).
+
+        Returns:
+            The number of processes killed.
+        """
+        if not group_alive(pgid):
+            return 0
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        members = group_members(pgid)
+        while members:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return len(kill_group(pgid))
+            await self.timers.sleep(min(GROUP_POLL, remaining))
+            members = still_in_group(members, pgid)
+        return 0
+
+    def exited_unexpectedly(self, exitcodes: List[int]) -> bool:
+        """
+        Whether the last process exited with a code not in `exitcodes`.
+        """
+        return (
+            self._process is not None
+            and self._process.returncode is not None
+            and self._process.returncode not in exitcodes
+        )
+
+    def needs_restart(self, exitcodes: List[int], autorestart: str) -> bool:
+        """
+        Whether the exited process has to be restarted, see `autorestart`.
+        """
+        if self.__killing or self.state != self.State.EXITED:
+            return False
+        if autorestart == AutoRestart.ALWAYS.value:
+            return True
+        return autorestart == AutoRestart.UNEXPECTED.value and self.exited_unexpectedly(
+            exitcodes
+        )
+
     async def autorestart(
         self,
         exitcodes: List[int],
         retries: int,
-        starttime: int,
+        starttime: float,
         autorestart: str,
     ) -> Self:
         """
@@ -334,10 +704,7 @@ class SubProcess:
             )
             return self
 
-        if (
-            self._process.returncode not in exitcodes
-            and autorestart == AutoRestart.UNEXPECTED.value
-        ) or autorestart == AutoRestart.ALWAYS.value:
+        if self.needs_restart(exitcodes, autorestart):
             logger.info(
                 f"Restarting process {self._parent_name} with pid: {self._process.pid}"
             )
@@ -360,6 +727,18 @@ class SubProcess:
             self._stderr.flush()
 
 
+# The event published when a process enters each state
+EVENT_KINDS: Dict[SubProcess.State, EventKind] = {
+    SubProcess.State.STARTING: EventKind.SPAWNED,
+    SubProcess.State.RUNNING: EventKind.RUNNING,
+    SubProcess.State.BACKOFF: EventKind.BACKOFF,
+    SubProcess.State.EXITED: EventKind.EXITED,
+    SubProcess.State.FATAL: EventKind.FATAL,
+    SubProcess.State.STOPPING: EventKind.STOPPING,
+    SubProcess.State.STOPPED: EventKind.STOPPED,
+}
+
+
 class Service:
     """
     Represents a service that can be managed by the service handler.
@@ -383,13 +762,29 @@ class Service:
             self.autorestart: str
             self.exitcodes: List[int]
             self.startretries: int
-            self.starttime: int
-            self.stoptime: int
+            self.starttime: float
+            self.stoptime: float
             self.stderr: str
             self.stdout: str
             self.stopsignal: str
             self.user: str
             self.env: Dict[str, str]
+            self.priority: int = 999
+            self.depends_on: List[str] = []
+            self.readiness: Dict[str, Any] | None = None
+            self.liveness: Dict[str, Any] | None = None
+            self.max_unavailable: int | str | None = None
+            self.labels: List[str] = []
+            self.rlimits: Dict[str, Any] | None = None
+            self.nice: int | None = None
+            self.ionice: Dict[str, Any] | None = None
+            self.cpu_affinity: List[int] | str | None = None
+            self.cgroup: Dict[str, Any] | None = None
+            self.backoff: Dict[str, Any] | None = None
+            self.circuit_breaker: Dict[str, Any] | None = None
+            self.max_rss: int | str | None = None
+            self.max_cpu_percent_sustained: float | Dict[str, float] | None = None
+            self.max_open_fds: int | None = None
             self.__dict__.update(config)
 
         def __iter__(self) -> Any:
@@ -398,6 +793,14 @@ class Service:
     def __init__(
         self,
         email: Email | None = None,
+        timers: TimerWheel | None = None,
+        spawn_backend: SpawnBackend = SpawnBackend.FAST,
+        scheduler: SpawnScheduler | None = None,
+        watchdog: Watchdog | None = None,
+        events: EventBus | None = None,
+        guard: ResourceGuard | None = None,
+        cgroups: CgroupTree | None = None,
+        budget: RestartBudget | None = None,
         **config: Dict[str, Any],
     ) -> None:
         """
@@ -405,16 +808,68 @@ class Service:
         Will automatically start the service if autostart is set to True.
 
         Args:
+            email: The email notifier, if any.
+            timers: The timer wheel shared with the service handler.
+                Defaults to the wheel of the running event loop.
+            spawn_backend: The backend used to spawn the processes.
+            scheduler: The spawn scheduler limiting concurrent starts, if any.
+            watchdog: The watchdog running the liveness probes.
+                Defaults to the watchdog of the running event loop.
+            events: The event bus the lifecycle events are published to.
+                Defaults to a bus of its own.
+            guard: The guard checking the resource limits of the processes.
+                Defaults to the guard of the running event loop.
+            cgroups: The cgroup tree the service gets a group in, if any.
+            budget: The restart budget shared with the other services, if any.
             **config: The configuration parameters for the service.
         """
         self._config = self.Config(**config)
         self._processes: List[SubProcess] = []
         self._start_tasks: List[asyncio.Task] = []
         self._wait_tasks: List[asyncio.Task] = []
-        self._email: Email | None = email
+        self._events: EventBus = events if events is not None else EventBus()
+        self._email: Email | None = None
+        self._notifications: Subscription | None = None
+        self.email = email
+        self._timers: TimerWheel | None = timers
+        self._spawn_backend: SpawnBackend = spawn_backend
+        self._scheduler: SpawnScheduler | None = scheduler
+        self._plan: SpawnPlan | None = None
+        self._plan_error: SpawnPlanError | ProbeError | None = None
+        self._readiness: Probe | None = None
+        self._liveness: Probe | None = None
+        self._watchdog: Watchdog | None = watchdog
+        self._guard: ResourceGuard | None = guard
+        # The limits, and the configuration they were read from
+        self._limits: tuple[Service.Config, ResourceLimits | None] | None = None
+        self._restart_policy: tuple[Service.Config, RestartPolicy] | None = None
+        self._budget: RestartBudget | None = budget
+        self._state_counts: Dict[SubProcess.State, int] = {}
+        # Called with (service, previous, state) on every process transition
+        self.on_state_change: (
+            Callable[["Service", SubProcess.State | None, SubProcess.State | None], Any]
+            | None
+        ) = None
+        # Bumped by `stop`, so that a rolling restart in progress gives up
+        self._generation: int = 0
+        # The processes killed because they outlived the stop of their tree
+        self.leftovers: int = 0
+        # The orphaned descendants adopted, see `ServiceHandler`
+        self.orphans: int = 0
+        self._cgroup: ServiceCgroup | None = None
+        if cgroups is not None:
+            self._cgroup = cgroups.service(self._config.name)
+            self._apply_cgroup()
+        elif self._config.cgroup:
+            logger.warning(
+                f"Service {self._config.name}: cgroup limits ignored, "
+                "supervisor.cgroup_root is not set."
+            )
 
         self._init_stdout()
         self._init_stderr()
+        self._compile_plan()
+        self._applied_config: Service.Config = self._config
 
         self._create_subprocesses(num=self._config.numprocs)
 
@@ -469,7 +924,11 @@ class Service:
         logger.info(f"Deleting service {self._config.name}")
         for process in self._processes:
             await process.delete()
+        self._release_processes(self._processes)
         self._processes.clear()
+        self.email = None
+        if self._cgroup is not None:
+            self._cgroup.remove()
         logger.debug(f"Service {self._config.name} deleted.")
 
     @property
@@ -493,44 +952,230 @@ class Service:
         self._config = self.Config(**config)
         return self._config
 
-    async def reload(self) -> None:
+    def _compile_plan(self) -> None:
+        """
+        Compiles the spawn plan and the probes of the service from its configuration.
+        On failure the error is kept, and starting the service fails immediately.
+        """
+        try:
+            self._plan = SpawnPlan.compile(
+                cmd=self._config.cmd,
+                umask=self._config.umask,
+                workingdir=self._config.workingdir,
+                user=self._config.user,
+                env=self._config.env,
+                rlimits=self._config.rlimits,
+                nice=self._config.nice,
+                ionice=self._config.ionice,
+                cpu_affinity=self._config.cpu_affinity,
+                cgroup=self._cgroup.procs if self._cgroup is not None else None,
+            )
+            self._readiness = self._compile_probe(self._config.readiness)
+            self._liveness = self._compile_probe(self._config.liveness)
+            self._plan_error = None
+        except (SpawnPlanError, ProbeError) as e:
+            logger.error(f"Service {self._config.name}: invalid configuration: {e}")
+            self._plan = None
+            self._readiness = None
+            self._liveness = None
+            self._plan_error = e
+
+    def _apply_cgroup(self) -> None:
+        """
+        Writes the limits of the cgroup of the service, if it has one.
+        """
+        if self._cgroup is not None:
+            self._cgroup.apply(cgroup_limits(self._config.cgroup))
+
+    @property
+    def cgroup(self) -> ServiceCgroup | None:
+        """
+        Gets the cgroup of the service, None if it has none.
+        """
+        return self._cgroup
+
+    def _compile_probe(self, config: Dict[str, Any] | None) -> Probe | None:
+        """
+        Builds a probe of the service, bound to its working directory, env and user.
+        """
+        if not config:
+            return None
+        return Probe.from_config(config).bind(
+            workingdir=self._config.workingdir,
+            env=self._config.env,
+            user=self._config.user,
+        )
+
+    @property
+    def plan(self) -> SpawnPlan | None:
+        """
+        Gets the spawn plan of the service, None if the configuration is invalid.
+        """
+        return self._plan
+
+    async def reload(self, diff: ServiceDiff | None = None) -> None:
         """
         Reloads the service configuration.
 
-        Must be called after updating the configuration.
+        Must be called after updating the configuration. Only what changed is applied:
+        processes are replaced when the spawn plan changed, restarted when their
+        outputs changed, added or removed when numprocs changed, and left alone
+        otherwise. A configuration that cannot be spawned is rejected and the
+        previous one is kept.
+
+        Args:
+            diff: The changes to apply, computed from the previous configuration if None.
         """
+        if diff is None:
+            diff = ServiceDiff.compute(dict(self._applied_config), dict(self._config))
+        if diff.action == Action.NONE:
+            self._applied_config = self._config
+            self._refresh_processes()
+            return
+
+        if diff.action == Action.RESPAWN or {"readiness", "liveness"} & set(
+            diff.fields
+        ):
+            previous_plan, previous_error = self._plan, self._plan_error
+            previous_probes = self._readiness, self._liveness
+            self._compile_plan()
+            if self._plan_error and previous_plan:
+                logger.error(
+                    f"Service {self._config.name}: reload rejected, keeping the previous configuration."
+                )
+                self._config = self._applied_config
+                self._plan, self._plan_error = previous_plan, previous_error
+                self._readiness, self._liveness = previous_probes
+                return
+        self._applied_config = self._config
+        if "cgroup" in diff.fields:
+            # Applied in place, the processes stay in the group
+            self._apply_cgroup()
+        logger.info(f"Service {self._config.name}: reload {diff}")
+
         tasks: List[asyncio.Task] = []
-        config: dict = dict(self._config)
+        active = any(
+            process.state in (SubProcess.State.RUNNING, SubProcess.State.STARTING)
+            for process in self._processes
+        )
 
-        for _ in range(len(self._processes) - config["numprocs"]):
+        for _ in range(len(self._processes) - self._config.numprocs):
             process = self._processes.pop()
+            self._release_processes([process])
             tasks.append(asyncio.create_task(process.delete()))
+        grown = len(self._processes)
+        self._create_subprocesses(num=self._config.numprocs - len(self._processes))
+        grown = self._processes[grown:]
+
+        if diff.action in (Action.RESPAWN, Action.RESTART):
+            outputs: List[int | TextIOWrapper] = []
+            if "stdout" in diff.fields:
+                outputs.append(self.stdout)
+                self._init_stdout()
+            if "stderr" in diff.fields:
+                outputs.append(self.stderr)
+                self._init_stderr()
+            config = {
+                "cmd": self._config.cmd,
+                "umask": self._config.umask,
+                "workingdir": self._config.workingdir,
+                "stdout": self.stdout,
+                "stderr": self.stderr,
+                "user": self._config.user,
+                "env": self._config.env,
+            }
+            if self.rolling:
+                tasks.append(asyncio.create_task(self._rolling_restart(config)))
+            else:
+                for process in self._processes:
+                    tasks.append(asyncio.create_task(process.delete()))
+                self._release_processes(self._processes)
+                self._processes = []
+                self._create_subprocesses(num=self._config.numprocs)
+                tasks.append(asyncio.create_task(self.autostart()))
+            await asyncio.gather(*tasks)
+            for output in outputs:
+                if type(output) is TextIOWrapper:
+                    output.close()
+            return
 
-        self._create_subprocesses(num=len(self._processes) - config["numprocs"])
+        self._refresh_processes()
+        if "liveness" in diff.fields:
+            for process in self._processes:
+                if process.state == SubProcess.State.RUNNING:
+                    self._watch_liveness(process)
+        if self._config.autostart and "autostart" in diff.fields and not active:
+            tasks.append(asyncio.create_task(self.start()))
+        elif self._config.autostart or active:
+            for process in grown:
+                self._start_process(process)
+        await asyncio.gather(*tasks)
 
-        new_config = {
-            "cmd": config["cmd"],
-            "umask": config["umask"],
-            "workingdir": config["workingdir"],
-            "stdout": self.stdout,
-            "stderr": self.stderr,
-            "user": config["user"],
-            "env": config["env"],
-        }
+    def _refresh_processes(self) -> None:
+        """
+        Applies the settings that do not need a new process to the processes.
+        """
+        for process in self._processes:
+            process.plan = self._plan
+            process.priority = self._config.priority
+            process.readiness = self._readiness
 
-        # The processes all have the same config, so why not take it from the first one
-        if new_config != self._processes[0].config:
-            for process in self._processes:
-                tasks.append(asyncio.create_task(process.delete()))
-            self._processes = []
-            self._create_subprocesses(num=config["numprocs"])
-        else:
-            for process in self._processes:
-                process.email = self._email
+    @property
+    def applied_config(self) -> Config:
+        """
+        Gets the configuration the processes currently run with.
+        """
+        return self._applied_config
 
-        tasks.append(asyncio.create_task(self.autostart()))
+    @property
+    def email(self) -> Email | None:
+        """
+        Gets the email configuration.
+        """
+        return self._email
 
-        await asyncio.gather(*tasks)
+    @email.setter
+    def email(self, email: Email | None) -> None:
+        """
+        Sets the email configuration. The notifications are sent by a subscriber
+        to the events of the service.
+        """
+        self._email = email
+        if email is None and self._notifications is not None:
+            self._notifications.close()
+            self._notifications = None
+        elif email is not None and self._notifications is None:
+            self._notifications = self._events.subscribe(
+                kinds=(
+                    EventKind.RUNNING,
+                    EventKind.STOPPED,
+                    EventKind.EXITED,
+                    EventKind.FATAL,
+                ),
+                services=[self._config.name],
+                handler=self._notify,
+            )
+
+    async def _notify(self, event: Event) -> None:
+        """
+        Sends the email notification of a lifecycle event.
+        """
+        if self._email is None:
+            return
+        state = event.kind.name
+        if event.kind == EventKind.RUNNING:
+            await self._email.send_start(event.service, state)
+        elif event.kind == EventKind.STOPPED:
+            await self._email.send_stop(event.service, state)
+        else:
+            await self._email.send_exited(event.service, state)
+
+    @property
+    def events(self) -> EventBus:
+        """
+        Gets the event bus the lifecycle events of the processes are published to.
+        """
+        return self._events
 
     async def autostart(self) -> None:
         """
@@ -547,13 +1192,27 @@ class Service:
         Wait for the subprocess to run and autorestart if necessary.
         """
         subprocess: SubProcess = await task
-        await subprocess.wait(self._config.startretries)
-        while (
-            subprocess.state == SubProcess.State.EXITED
-            and subprocess.retries < self._config.startretries
+        await self._wait_subprocess(subprocess)
+        while subprocess.state == SubProcess.State.EXITED and (
+            subprocess.retries < self._config.startretries
+            or self.restart_policy.breaker is not None
         ):
             logger.debug(f"{self._config.name}: Checking if an autorestart is required")
-            await asyncio.sleep(subprocess.retries + 1)
+            if not subprocess.needs_restart(
+                self._config.exitcodes, self._config.autorestart
+            ):
+                logger.debug(f"{self._config.name}: No autorestart required")
+                return
+            policy = self.restart_policy
+            uptime = time.time() - (subprocess.spawned_at or time.time())
+            if policy.healthy(uptime):
+                subprocess.retries = 0
+            await policy.retry(
+                subprocess.retries + 1,
+                subprocess.timers,
+                uptime,
+                failed=subprocess.exited_unexpectedly(self._config.exitcodes),
+            )
             subprocess = await subprocess.autorestart(
                 exitcodes=self._config.exitcodes,
                 retries=self._config.startretries,
@@ -563,11 +1222,197 @@ class Service:
             if subprocess.state == SubProcess.State.EXITED:
                 logger.debug(f"{self._config.name}: No autorestart required")
                 return
-            await subprocess.wait(self._config.startretries)
+            await self._wait_subprocess(subprocess)
 
         subprocess.retries = 0
         logger.debug(f"Removing task {task} from start_tasks")
-        self._start_tasks.remove(task)
+        if task in self._start_tasks:
+            self._start_tasks.remove(task)
+
+    @property
+    def watchdog(self) -> Watchdog:
+        """
+        Gets the watchdog running the liveness probes of the service.
+        """
+        if self._watchdog is None:
+            self._watchdog = Watchdog.current()
+        return self._watchdog
+
+    @property
+    def guard(self) -> ResourceGuard:
+        """
+        Gets the guard checking the resource limits of the processes.
+        """
+        if self._guard is None:
+            self._guard = ResourceGuard.current()
+        return self._guard
+
+    @property
+    def restart_policy(self) -> RestartPolicy:
+        """
+        Gets how the processes are retried. A reload that does not change the
+        circuit breaker keeps it, with the failures counted so far.
+        """
+        if self._restart_policy is None or self._restart_policy[0] is not self._config:
+            policy = RestartPolicy.from_config(self._config, budget=self._budget)
+            if (
+                self._restart_policy is not None
+                and self._restart_policy[0].circuit_breaker
+                == self._config.circuit_breaker
+            ):
+                policy.breaker = self._restart_policy[1].breaker
+            self._restart_policy = (self._config, policy)
+        return self._restart_policy[1]
+
+    @property
+    def limits(self) -> ResourceLimits | None:
+        """
+        Gets the resource limits of each process, None if there are none.
+        """
+        if self._limits is None or self._limits[0] is not self._config:
+            self._limits = (self._config, ResourceLimits.from_config(self._config))
+        return self._limits[1]
+
+    async def _wait_subprocess(self, subprocess: SubProcess) -> None:
+        """
+        Waits for a subprocess to exit, probing its liveness and checking its
+        resource limits meanwhile.
+        """
+        running = subprocess.state == SubProcess.State.RUNNING
+        if running:
+            self._watch_liveness(subprocess)
+            # Even without limits, so that limits added by a reload apply
+            self.guard.watch(
+                subprocess,
+                subprocess.pid,
+                lambda: self.limits,
+                on_exceeded=lambda reason: self._on_limit_exceeded(subprocess, reason),
+                name=self._config.name,
+            )
+        try:
+            await subprocess.wait(self._config.startretries)
+        finally:
+            if running:
+                # Also watched if a reload added a probe meanwhile
+                self._unwatch_liveness(subprocess)
+                self.guard.unwatch(subprocess)
+
+    def _watch_liveness(self, subprocess: SubProcess) -> None:
+        """
+        Probes the liveness of a running subprocess with the current probe,
+        replacing the previous one. Stops probing it if there is none anymore.
+        """
+        if self._liveness is None:
+            self._unwatch_liveness(subprocess)
+            return
+        self.watchdog.watch(
+            subprocess,
+            self._liveness,
+            on_failure=lambda: self._on_unhealthy(subprocess),
+            threshold=self._config.liveness.get("failure_threshold", 3),
+            since=subprocess.spawned_at,
+            name=f"{self._config.name}-{subprocess.pid}",
+        )
+
+    def _unwatch_liveness(self, subprocess: SubProcess) -> None:
+        if self._watchdog is not None:
+            self._watchdog.unwatch(subprocess)
+
+    def _on_unhealthy(self, subprocess: SubProcess) -> None:
+        """
+        Restarts a subprocess that failed its liveness probe too many times.
+        """
+        logger.warning(
+            f"Service {self._config.name}: process {subprocess.pid} is unresponsive, "
+            "restarting it."
+        )
+        self._add_wait_task(self._restart_unhealthy(subprocess))
+
+    def _on_limit_exceeded(self, subprocess: SubProcess, reason: str) -> None:
+        """
+        Restarts a subprocess that exceeded one of its resource limits.
+        """
+        logger.warning(
+            f"Service {self._config.name}: process {subprocess.pid} exceeded "
+            f"{reason}, restarting it."
+        )
+        self._events.publish(
+            Event(
+                kind=EventKind.LIMIT_EXCEEDED,
+                service=self._config.name,
+                pid=subprocess.pid,
+                reason=reason,
+            )
+        )
+        self._add_wait_task(self._restart_unhealthy(subprocess))
+
+    def in_cgroup(self, pid: int) -> bool:
+        """
+        Checks whether a process is in the cgroup of the service, if it has one.
+        """
+        return self._cgroup is not None and pid in self._cgroup.pids()
+
+    def on_orphan(self, pid: int, exitcode: int | None, killed: bool) -> None:
+        """
+        Records an orphaned descendant adopted by taskmaster.
+
+        Args:
+            pid: The pid of the orphan.
+            exitcode: Its exit code if it had already exited.
+            killed: Whether it was killed.
+        """
+        self.orphans += 1
+        logger.warning(
+            f"Service {self._config.name}: adopted orphaned process {pid}"
+            f"{', killed it' if killed else ''}."
+        )
+        self._events.publish(
+            Event(
+                kind=EventKind.ORPHANED,
+                service=self._config.name,
+                pid=pid,
+                exitcode=exitcode,
+                reason="killed" if killed else None,
+            )
+        )
+
+    async def _restart_unhealthy(self, subprocess: SubProcess) -> None:
+        """
+        Stops then starts a subprocess through the normal lifecycle.
+        """
+        await subprocess.stop(
+            stopsignal=self._config.stopsignal,
+            stoptime=self._config.stoptime,
+        )
+        await self.restart_policy.admit()
+        await self._start_process(subprocess)
+
+    def _start_process(self, subprocess: SubProcess) -> asyncio.Task:
+        """
+        Starts a subprocess and watches it once started.
+
+        Returns:
+            The start task.
+        """
+        task = asyncio.create_task(
+            subprocess.start(
+                retries=self._config.startretries,
+                starttime=self._config.starttime,
+            )
+        )
+        self._start_tasks.append(task)
+        self._add_wait_task(self._on_subprocess_started(task))
+        return task
+
+    def _add_wait_task(self, coroutine: Coroutine[Any, Any, Any]) -> asyncio.Task:
+        """
+        Runs a coroutine that `wait` waits for. The task is dropped once done,
+        so restarts firing for the lifetime of the service do not pile up.
+        """
+        task = asyncio.create_task(coroutine)
+        self._wait_tasks.append(task)
+        task.add_done_callback(self._wait_tasks.remove)
+        return task
 
     def _create_subprocesses(self, num: int) -> None:
         """Batch create subprocesses.
@@ -575,6 +1420,17 @@ class Service:
         Args:
             num (int): The number of subprocesses to create.
         """
+        # The lowest indexes not taken, so that the spread affinity stays even
+        taken = {process.index for process in self._processes}
+        free = (
+            index for index in range(len(self._processes) + num) if index not in taken
+        )
+
+        # Shared by the processes, rather than a closure and a bound method each
+        def restart_policy() -> RestartPolicy:
+            return self.restart_policy
+
+        on_state_change = self._on_process_state
         for _ in range(num):
             subprocess: SubProcess = SubProcess(
                 parent_name=self._config.name,
@@ -585,43 +1441,126 @@ class Service:
                 stderr=self.stderr,
                 user=self._config.user,
                 env=self._config.env,
-                email=self._email,
+                events=self._events,
+                timers=self._timers,
+                plan=self._plan,
+                spawn_backend=self._spawn_backend,
+                scheduler=self._scheduler,
+                priority=self._config.priority,
+                readiness=self._readiness,
+                on_state_change=on_state_change,
+                index=next(free),
+                restart_policy=restart_policy,
             )
             self._processes.append(subprocess)
+            self._count_state(None, subprocess.state)
+
+    def _release_processes(self, processes: List[SubProcess]) -> None:
+        """
+        Stops counting processes that are no longer part of the service.
+        """
+        for process in processes:
+            process.on_state_change = None
+            self._count_state(process.state, None)
+
+    def _on_process_state(
+        self,
+        process: SubProcess,
+        previous: SubProcess.State,
+        state: SubProcess.State,
+    ) -> None:
+        if state == SubProcess.State.STOPPED:
+            self.leftovers += process.leftovers
+        self._count_state(previous, state)
+
+    def _count_state(
+        self, previous: SubProcess.State | None, state: SubProcess.State | None
+    ) -> None:
+        """
+        Moves a process from one state count to another (None when it joins or
+        leaves the service), and reports it to `on_state_change`.
+        """
+        if previous is not None:
+            self._state_counts[previous] -= 1
+            if not self._state_counts[previous]:
+                del self._state_counts[previous]
+        if state is not None:
+            self._state_counts[state] = self._state_counts.get(state, 0) + 1
+        if self.on_state_change is not None:
+            self.on_state_change(self, previous, state)
+
+    @property
+    def summary(self) -> ServiceSummary:
+        """
+        Gets the status of the service and of its processes.
+        """
+        return ServiceSummary(
+            name=self._config.name,
+            cmd=self._config.cmd,
+            states=tuple(process.state.value for process in self._processes),
+            counts={state.value: count for state, count in self._state_counts.items()},
+            orphans=self.orphans,
+        )
+
+    @property
+    def state_counts(self) -> Dict[SubProcess.State, int]:
+        """
+        Gets the number of processes in each state (states with no process omitted).
+        """
+        return self._state_counts
 
     async def start(self) -> None:
         """
         Starts the service.
         """
+        active = [
+            SubProcess.State.RUNNING,
+            SubProcess.State.STARTING,
+            SubProcess.State.STOPPING,
+        ]
+        self._release_processes(
+            [process for process in self._processes if process.state in active]
+        )
         self._processes = [
-            process
-            for process in self._processes
-            if process.state
-            not in [
-                SubProcess.State.RUNNING,
-                SubProcess.State.STARTING,
-                SubProcess.State.STOPPING,
-            ]
+            process for process in self._processes if process.state not in active
         ]
 
         self._create_subprocesses(num=self._config.numprocs - len(self._processes))
         self._start_tasks: List[asyncio.Task] = []
         self._wait_tasks: List[asyncio.Task] = []
+        if self._plan_error:
+            for process in self._processes:
+                process.fail(str(self._plan_error))
+            return
         for process in self._processes:
-            self._start_tasks += [
-                asyncio.create_task(
-                    process.start(
-                        retries=self._config.startretries,
-                        starttime=self._config.starttime,
-                    )
-                )
-            ]
-            self._wait_tasks += [
-                asyncio.create_task(self._on_subprocess_started(self._start_tasks[-1]))
-            ]
+            self._start_process(process)
 
         await asyncio.gather(*self._start_tasks)
 
+    @property
+    def ready(self) -> bool:
+        """
+        Whether every process of the service is running, so dependents can start.
+        """
+        return bool(self._processes) and all(
+            process.state == SubProcess.State.RUNNING for process in self._processes
+        )
+
+    @property
+    def starting(self) -> bool:
+        """
+        Whether processes of the service are being started.
+        """
+        return any(not task.done() for task in self._start_tasks)
+
+    async def wait_started(self) -> None:
+        """
+        Waits for the processes being started to be running or to have failed.
+        """
+        tasks = [task for task in self._start_tasks if not task.done()]
+        if tasks:
+            await asyncio.wait(tasks)
+
     async def wait(self) -> None:
         """
         Waits for the service to finish.
@@ -634,6 +1573,7 @@ class Service:
         """
         Stops the service.
         """
+        self._generation += 1
         for task in self._start_tasks:
             task.cancel()
 
@@ -655,15 +1595,108 @@ class Service:
             ]
 
         await asyncio.gather(*_stop_tasks)
+        if self._cgroup is not None:
+            # Processes that left the group of their parent are still in the cgroup
+            strays = self._cgroup.kill()
+            if strays:
+                logger.warning(
+                    f"Service {self._config.name}: killed {strays} leftover "
+                    "processes of its cgroup."
+                )
+                self.leftovers += strays
 
     async def restart(self) -> None:
         """
         Restarts the service.
+
+        With `max_unavailable`, the processes are replaced batch by batch instead.
         """
+        if self.rolling:
+            await self._rolling_restart()
+            return
         with contextlib.suppress(RuntimeError):
             await self.stop()
         await self.start()
 
+    @property
+    def rolling(self) -> bool:
+        """
+        Whether restarts replace the processes batch by batch (`max_unavailable` is set).
+        """
+        return self._config.max_unavailable is not None
+
+    @property
+    def max_unavailable(self) -> int:
+        """
+        Gets the number of processes a rolling restart may replace at once.
+
+        `max_unavailable` is either a count or a percentage of numprocs, at least 1.
+        """
+        value = self._config.max_unavailable
+        numprocs = max(len(self._processes), 1)
+        if isinstance(value, str):
+            return max(1, numprocs * int(value.rstrip("%")) // 100)
+        return max(1, min(value or 1, numprocs))
+
+    async def _rolling_restart(self, config: Dict[str, Any] | None = None) -> None:
+        """
+        Replaces the processes in batches of `max_unavailable`, waiting for each batch
+        to be running (or ready) before moving on, so the service never goes down.
+
+        Gives up if a process of a batch fails to start, or if the service is stopped.
+
+        Args:
+            config: The new configuration of the processes, when reloading.
+                Idle processes are then only started if the service autostarts.
+        """
+        generation = self._generation
+        size = self.max_unavailable
+        processes = list(self._processes)
+        logger.info(
+            f"Service {self._config.name}: rolling restart of {len(processes)} "
+            f"processes, {size} at a time."
+        )
+        for index in range(0, len(processes), size):
+            if self._generation != generation:
+                logger.info(f"Service {self._config.name}: rolling restart cancelled.")
+                return
+            batch = processes[index : index + size]
+            await asyncio.gather(
+                *[self._replace_process(process, config) for process in batch]
+            )
+            if any(process.state == SubProcess.State.FATAL for process in batch):
+                logger.error(
+                    f"Service {self._config.name}: rolling restart aborted, "
+                    "a process failed to start."
+                )
+                return
+        logger.info(f"Service {self._config.name}: rolling restart done.")
+
+    async def _replace_process(
+        self, process: SubProcess, config: Dict[str, Any] | None = None
+    ) -> None:
+        """
+        Stops a running process, applies the new configuration if any, and starts it.
+
+        Processes being started are left alone, they pick the new configuration up
+        on their next spawn.
+        """
+        running = process.state == SubProcess.State.RUNNING
+        if running:
+            await process.stop(
+                stopsignal=self._config.stopsignal,
+                stoptime=self._config.stoptime,
+            )
+        if config is not None:
+            process.config = config
+            process.plan = self._plan
+            process.priority = self._config.priority
+            process.readiness = self._readiness
+        if process.state in (SubProcess.State.STARTING, SubProcess.State.BACKOFF):
+            return
+        if running or config is None or self._config.autostart:
+            await self._start_process(process)
+
     @property
     def status(self) -> dict[str, SubProcess.State]:
         """
@@ -724,62 +1757,180 @@ class ServiceHandler:
             **config: The configuration parameters for the service handler.
         """
         self._config: ServiceHandler.Config = self.Config(**config)
-        self._services: List[Service] = []
+        self._services: ServiceRegistry = ServiceRegistry()
         self._email: Email | None = email
+        self._timers: TimerWheel = TimerWheel()
+        self._spawn_backend = SpawnBackend(
+            self.settings.get("spawn_backend", SpawnBackend.FAST.value)
+        )
+        self._scheduler = SpawnScheduler(
+            max_concurrent=self.settings.get("max_concurrent_starts"),
+            rate=self.settings.get("max_starts_per_second"),
+            burst=self.settings.get("start_burst"),
+            timers=self._timers,
+        )
+        self._watchdog = Watchdog(self._timers)
+        self._events = EventBus()
+        self._sampler = ResourceSampler(
+            interval=self.settings.get("sample_interval", 5), timers=self._timers
+        )
+        self._sampler.attach(self._events)
+        self._guard = ResourceGuard(self._sampler)
+        self._cgroups: CgroupTree | None = None
+        if self.settings.get("cgroup_root"):
+            self._cgroups = CgroupTree(self.settings["cgroup_root"])
+        self._budget: RestartBudget | None = None
+        if self.settings.get("max_restarts_per_second"):
+            self._budget = RestartBudget(
+                rate=self.settings["max_restarts_per_second"],
+                burst=self.settings.get("restart_burst"),
+                timers=self._timers,
+            )
+        self._subreaper: bool = False
+        # Process group (the pid of a spawned process) -> name of its service
+        self._groups: Dict[int, str] = {}
+        if self.settings.get("subreaper"):
+            self._subreaper = ChildWatcher.current().adopt_orphans(
+                self._orphan_owner, self._on_orphan
+            )
+            if self._subreaper:
+                self._events.listen(self._index_group)
+        self._autostart_began: float | None = None
 
         for service in self._config.services:
-            self._services.append(Service(email=self._email, **dict(service)))
+            self._services.add(self._create_service(service))
+
+    def _create_service(self, config: Dict[str, Any]) -> Service:
+        """
+        Creates a service sharing the resources of the handler.
+        """
+        service = Service(
+            email=self._email,
+            timers=self._timers,
+            spawn_backend=self._spawn_backend,
+            scheduler=self._scheduler,
+            watchdog=self._watchdog,
+            events=self._events,
+            guard=self._guard,
+            cgroups=self._cgroups,
+            budget=self._budget,
+            **dict(config),
+        )
+        if service.cgroup is not None:
+            self._sampler.add_cgroup(service.config.name, service.cgroup)
+        return service
+
+    async def _delete_service(self, service: Service) -> None:
+        """
+        Deletes a service, and stops sampling its cgroup.
+        """
+        await service.delete()
+        self._sampler.remove_cgroup(service.config.name)
+
+    def _index_group(self, event: Event) -> None:
+        """
+        Records the process group led by each spawned process, so that orphans
+        are attributed without going through every process of every service.
+
+        Groups of processes spawned again are kept, orphans left in them still
+        belong to the service, until the index outgrows the processes.
+        """
+        if event.kind != EventKind.SPAWNED or event.pid is None:
+            return
+        self._groups[event.pid] = event.service
+        if len(self._groups) > 2 * sum(self._services.status.counts.values()) + 64:
+            self._groups = {
+                process.pid: service.config.name
+                for service in self._services
+                for process in service._processes
+                if process.pid is not None
+            }
+
+    def _orphan_owner(self, pid: int) -> Service | None:
+        """
+        Gets the service an orphan descends from, by process group or cgroup.
+        """
+        try:
+            pgid = os.getpgid(pid)
+        except ProcessLookupError:
+            return None
+        name = self._groups.get(pgid)
+        service = self._services.get(name) if name is not None else None
+        if service is not None:
+            return service
+        for service in self._services:
+            if service.in_cgroup(pid):
+                return service
+        return None
+
+    def _on_orphan(self, pid: int, service: Service, exitcode: int | None) -> None:
+        """
+        Counts an orphan adopted by the child watcher, killing it with
+        `kill_orphans`.
+        """
+        killed = False
+        if exitcode is None and self.settings.get("kill_orphans"):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+                killed = True
+        service.on_orphan(pid, exitcode, killed)
+        self._services.status.touch(service.config.name)
+
+    @property
+    def settings(self) -> Dict[str, Any]:
+        """
+        Gets the supervisor-wide settings (the `supervisor` section of the configuration).
+        """
+        return dict(self._config).get("supervisor") or {}
 
     @property
     def status(self) -> list[dict[str, str]]:
         """
         Displays the status of all services.
+
+        Rows are only rebuilt for the services that changed since the last call,
+        and must not be modified.
         """
-        ret: list[dict[str, str]] = []
-        for service in self._services:
-            status = dict(
-                {
-                    "name": service.config.name,
-                    "cmd": service.config.cmd,
-                }
-            )
-            count = 0
-            for process in service._processes:
-                count += 1
-                status[f"process_{count}"] = process.state.value
-            ret.append(
-                status,
-            )
-        return ret
+        return [summary.row for summary in self._services.status.summaries()]
+
+    @property
+    def restart_budget(self) -> RestartBudget | None:
+        """
+        Gets the supervisor-wide restart budget, None if restarts are not limited.
+        """
+        return self._budget
+
+    @property
+    def status_model(self) -> StatusModel:
+        """
+        Gets the versioned status of the services, see `StatusModel.changes`.
+        """
+        return self._services.status
 
     async def start(self, service_names: Optional[List[str]] = None):
         """
-        Starts one or multiple services.
+        Starts one or multiple services, after their dependencies.
 
         Args:
             service_names: The name of the services to start.
         """
         if not service_names:
-            service_names = [service.config.name for service in self._services]
+            service_names = self._services.names()
 
         logger.debug(f"Starting services: {service_names}")
-        for service in self._services:
-            if service.config.name in service_names:
-                asyncio.create_task(service.start())
+        asyncio.create_task(self._start_services(self._select(service_names)))
 
     async def stop(self, service_names: Optional[List[str]] = None):
         """
-        Stops one or multiple services.
+        Stops one or multiple services, after the ones depending on them.
 
         Args:
             service_names: The name of the services to stop.
         """
         if not service_names:
-            service_names = [service.config.name for service in self._services]
+            service_names = self._services.names()
 
-        for service in self._services:
-            if service.config.name in service_names:
-                asyncio.create_task(service.stop())
+        asyncio.create_task(self._stop_services(self._select(service_names)))
 
     async def restart(self, service_names: Optional[List[str]] = None):
         """
@@ -789,19 +1940,200 @@ class ServiceHandler:
             service_names: The name of the services to restart.
         """
         if not service_names:
-            service_names = [service.config.name for service in self._services]
+            service_names = self._services.names()
 
-        for service in self._services:
-            if service.config.name in service_names:
-                asyncio.create_task(service.restart())
+        asyncio.create_task(self._restart_services(self._select(service_names)))
+
+    def _select(self, service_names: List[str]) -> List[Service]:
+        """
+        Gets the services with the given names, in configuration order.
+        """
+        return self._services.select(service_names)
+
+    @property
+    def services(self) -> ServiceRegistry:
+        """
+        Gets the services, indexed by name, label and process state.
+        """
+        return self._services
+
+    def _dependencies(self) -> Dict[str, List[str]] | None:
+        """
+        Gets the names each service depends on, None if the graph is invalid.
+        """
+        dependencies = {
+            service.config.name: list(service.config.depends_on)
+            for service in self._services
+        }
+        try:
+            topological_layers(dependencies)
+        except DependencyError as e:
+            logger.error(f"Invalid service dependencies: {e}")
+            return None
+        return dependencies
+
+    async def _start_services(self, services: List[Service]) -> None:
+        """
+        Starts services along the dependency graph.
+
+        Each service starts as soon as all its dependencies are running, so independent
+        branches start in parallel. Dependencies that are neither running nor starting
+        are started as well.
+        """
+        dependencies = self._dependencies()
+        if dependencies is None:
+            return
+
+        wanted: Dict[str, Service] = {}
+        pending = list(services)
+        while pending:
+            service = pending.pop(0)
+            if service.config.name in wanted:
+                continue
+            wanted[service.config.name] = service
+            for name in dependencies[service.config.name]:
+                dependency = self._services.get(name)
+                if not dependency.ready and not dependency.starting:
+                    pending.append(dependency)
+
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def start_after_dependencies(service: Service) -> None:
+            for name in dependencies[service.config.name]:
+                if name in tasks:
+                    await asyncio.wait([tasks[name]])
+                else:
+                    await self._services.get(name).wait_started()
+            missing = [
+                name
+                for name in dependencies[service.config.name]
+                if not self._services.get(name).ready
+            ]
+            if missing:
+                logger.error(
+                    f"Service {service.config.name} not started: "
+                    f"{', '.join(missing)} not running."
+                )
+                return
+            await service.start()
+
+        for service in sorted(
+            wanted.values(), key=lambda service: service.config.priority
+        ):
+            tasks[service.config.name] = asyncio.create_task(
+                start_after_dependencies(service)
+            )
+        await asyncio.gather(*tasks.values())
+
+    async def _stop_services(self, services: List[Service]) -> None:
+        """
+        Stops services in reverse dependency order: a service is stopped once
+        the services depending on it among `services` are stopped.
+        """
+        dependencies = self._dependencies()
+        if dependencies is None:
+            dependencies = {service.config.name: [] for service in self._services}
+        dependents = dependents_of(dependencies)
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def stop_after_dependents(service: Service) -> None:
+            waiting = [
+                tasks[name] for name in dependents[service.config.name] if name in tasks
+            ]
+            if waiting:
+                await asyncio.wait(waiting)
+            await service.stop()
+
+        for service in services:
+            tasks[service.config.name] = asyncio.create_task(
+                stop_after_dependents(service)
+            )
+        await asyncio.gather(*tasks.values())
+
+    async def _restart_services(self, services: List[Service]) -> None:
+        """
+        Restarts services. Services with `max_unavailable` are rolled in place, the
+        others are stopped in reverse dependency order, then started.
+        """
+        rolling = [service for service in services if service.rolling]
+        others = [service for service in services if not service.rolling]
+
+        async def stop_then_start() -> None:
+            if others:
+                await self._stop_services(others)
+                await self._start_services(others)
+
+        await asyncio.gather(
+            stop_then_start(), *[service.restart() for service in rolling]
+        )
 
     async def autostart(self) -> None:
         """
-        Autostart all services.
+        Autostart all services along the dependency graph, by priority (lowest first).
+
+        The first time, measures how long it takes for every autostart service
+        to be running, see `autostart_duration`.
         """
         logger.info("Autostarting services.")
-        for service in self._services:
-            asyncio.create_task(service.autostart())
+        loop = asyncio.get_running_loop()
+        first = self._autostart_began is None
+        if first:
+            self._autostart_began = loop.time()
+        autostarted = [
+            service for service in self._services if service.config.autostart
+        ]
+        await self._start_services(autostarted)
+        if not first:
+            return
+        if all(
+            process.state != SubProcess.State.FATAL
+            for service in autostarted
+            for process in service._processes
+        ):
+            duration = loop.time() - self._autostart_began
+            self.status_model.autostart_seconds = duration
+            logger.info(
+                f"All {len(autostarted)} autostart services running after "
+                f"{duration:.3f}s."
+            )
+        else:
+            logger.warning("Some autostart services failed to start.")
+
+    @property
+    def autostart_duration(self) -> float | None:
+        """
+        Gets the time from the first autostart until every autostart service was running.
+        None until then, or if one of them failed.
+        """
+        return self.status_model.autostart_seconds
+
+    @property
+    def scheduler(self) -> SpawnScheduler:
+        """
+        Gets the spawn scheduler limiting concurrent starts.
+        """
+        return self._scheduler
+
+    @property
+    def watchdog(self) -> Watchdog:
+        """
+        Gets the watchdog running the liveness probes of every service.
+        """
+        return self._watchdog
+
+    @property
+    def sampler(self) -> ResourceSampler:
+        """
+        Gets the sampler of the resources used by every process.
+        """
+        return self._sampler
+
+    @property
+    def events(self) -> EventBus:
+        """
+        Gets the event bus the lifecycle events of every process are published to.
+        """
+        return self._events
 
     @property
     def config(self) -> Config:
@@ -813,6 +2145,13 @@ class ServiceHandler:
         """
         return self._config
 
+    @property
+    def timers(self) -> TimerWheel:
+        """
+        Gets the timer wheel holding the lifecycle deadlines of every service.
+        """
+        return self._timers
+
     @config.setter
     def config(self, config: Dict[Any, Any]) -> Config:
         """
@@ -827,12 +2166,33 @@ class ServiceHandler:
         self._config = self.Config(**config)
         return self._config
 
+    def plan_reload(self, services: List[Dict[str, Any]] | None = None) -> ReloadPlan:
+        """
+        Computes what reloading would do, without doing it (dry run).
+
+        Args:
+            services: The new service configurations. Defaults to the configuration
+                set on the handler.
+
+        Returns:
+            The reload plan, from the configurations the services run with.
+        """
+        if services is None:
+            services = dict(self._config)["services"]
+        return ReloadPlan.compute(
+            [dict(service.applied_config) for service in self._services],
+            [dict(service) for service in services],
+        )
+
     async def reload(self, email: Email | None = None) -> Config:
         """
-        Sets the configuration parameters for the service and reloads them.
+        Applies the configuration set on the handler, touching only what changed.
+
+        Removed services are deleted, new ones are created (and autostarted), and each
+        remaining service applies its own diff, see `Service.reload`.
 
         Args:
-            config: The new configuration parameters as a dictionary.
+            email: The new email notifier, if any.
 
         Returns:
             The configuration parameters.
@@ -840,52 +2200,66 @@ class ServiceHandler:
         tasks: List[asyncio.Task] = []
 
         config = dict(self._config)
+        plan = self.plan_reload(config["services"])
+        logger.info(str(plan))
 
         self._email = email
-
-        # If the service is not in the new config, remove it
-        for service in self._services.copy():
-            if service.config.name not in [
-                service.get("name") for service in config["services"]
-            ]:
-                tasks.append(asyncio.create_task(service.delete()))
-                self._services.remove(service)
-
-        # If the service is still in the new config, update it
-        for service in self._services:
-            for service_config in config["services"]:
-                if service.config.name == service_config.get("name"):
-                    service.config = service_config
-                    tasks.append(asyncio.create_task(service.reload()))
-                    break
-
-        # If the service is not in the old config, add it
-        for service_config in config["services"]:
-            if service_config.get("name") not in [
-                service.config.name for service in self._services
-            ]:
-                self._services.append(
-                    Service(email=self._email, **dict(service_config))
+        services = self._services
+        configs = {
+            service_config["name"]: service_config
+            for service_config in config["services"]
+        }
+        added: List[Service] = []
+        for diff in plan.diffs:
+            if diff.action == Action.REMOVE:
+                tasks.append(
+                    asyncio.create_task(
+                        self._delete_service(services.remove(diff.name))
+                    )
                 )
-
-        tasks.append(asyncio.create_task(self.autostart()))
+            elif diff.action == Action.ADD:
+                added.append(self._create_service(configs[diff.name]))
+                services.add(added[-1])
+            else:
+                service = services.get(diff.name)
+                service.email = email
+                service.config = configs[diff.name]
+                if diff.action != Action.NONE:
+                    services.refresh(service)
+                tasks.append(asyncio.create_task(service.reload(diff)))
+
+        services.reorder(configs)
         self._config = self.Config(**config)
+        autostarted = [service for service in added if service.config.autostart]
+        if autostarted:
+            tasks.append(asyncio.create_task(self._start_services(autostarted)))
+        await asyncio.gather(*tasks)
         return self.config
 
     def flush(self, service_name: str) -> None:
         """
         Flushes the stdout and stderr buffers of the given service.
         """
-        for service in self._services:
-            if service.config.name == service_name:
-                return service.flush()
+        service = self._services.get(service_name)
+        if service is not None:
+            return service.flush()
         logger.warning(f"Service {service_name} not found.")
 
     async def delete(self) -> None:
         """
         Destructor for the ServiceHandler class.
         """
-        for service in self._services:
-            await service.delete()
+        dependencies = self._dependencies()
+        if dependencies is None:
+            layers = [self._services.names()]
+        else:
+            layers = topological_layers(dependencies)
+        for layer in reversed(layers):
+            await asyncio.gather(
+                *[self._delete_service(self._services.get(name)) for name in layer]
+            )
         self._services.clear()
+        self._sampler.close()
+        if self._subreaper:
+            ChildWatcher.current().release_orphans()
         logger.debug("ServiceHandler deleted.")
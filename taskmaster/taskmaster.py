@@ -2,15 +2,19 @@ import curses
 import asyncio
 import signal
 import argparse
+import sys
 from .utils.email import Email
 from typing import Any
 import os
 
 from .service import ServiceHandler
+from .control import ControlError, ControlServer, DEFAULT_SOCKET
+from .metrics import MetricsServer
 
 from .utils.logger import logger
 from .gui.gui import Gui
 from .utils.config import Config, generate_config
+from .utils.reload_plan import ReloadPlan
 
 need_reload = False
 need_exit = False
@@ -34,6 +38,25 @@ def init_signal() -> None:
     signal.signal(signal.SIGHUP, reload_config)
 
 
+async def start_metrics(
+    handler: ServiceHandler, config: Config
+) -> MetricsServer | None:
+    """
+    Starts serving the metrics if the configuration has a metrics section.
+    It is read once, at startup.
+    """
+    if not config.metrics:
+        return None
+    server = MetricsServer(handler, **config.metrics)
+    try:
+        await server.start()
+    except OSError as e:
+        logger.error(f"Failed to serve the metrics: {e}")
+        server.metrics.close()
+        return None
+    return server
+
+
 async def interfaces(stdscr, config) -> None:
     logger.info("Starting taskmaster.")
     logger.warning(f"PID: {os.getpid()}")
@@ -47,8 +70,9 @@ async def interfaces(stdscr, config) -> None:
         interface = Gui()
         interface.service_handler = ServiceHandler(
             email=email,
-            **dict({"services": config.services})
+            **dict({"services": config.services, "supervisor": config.supervisor}),
         )
+        metrics = await start_metrics(interface.service_handler, config)
         task = asyncio.create_task(interface.service_handler.autostart())
         interface.config = config
         interface.default()
@@ -73,12 +97,16 @@ async def interfaces(stdscr, config) -> None:
                 config = Config(config.path)
                 if config.email:
                     email = Email(config)
-                interface.service_handler.config = dict({"services": config.services})
+                interface.service_handler.config = dict(
+                    {"services": config.services, "supervisor": config.supervisor}
+                )
                 asyncio.create_task(interface.service_handler.reload(email=email))
                 interface.config = config
                 interface.configuration_success()
                 interface.default()
         interface.services_destroy()
+        if metrics:
+            await metrics.close()
         await interface.service_handler.delete()
         await asyncio.sleep(2)
         interface.end()
@@ -93,27 +121,123 @@ async def taskmaster(config: Config) -> None:
     await asyncio.gather(curses.wrapper(interfaces, config))
 
 
+async def daemon(config: Config, socket_path: str = DEFAULT_SOCKET) -> None:
+    """
+    Runs taskmaster headless in the foreground, controlled through a unix socket
+    (see `taskmasterctl`). SIGINT and SIGTERM stop it, SIGHUP reloads the
+    configuration file.
+
+    Args:
+        config: The configuration.
+        socket_path: The path of the control socket.
+    """
+    logger.info("Starting taskmaster daemon.")
+    logger.warning(f"PID: {os.getpid()}")
+    email = Email(config) if config.email else None
+    if email:
+        asyncio.create_task(email.send("hello", "Taskmaster started."))
+    handler = ServiceHandler(
+        email=email,
+        **dict({"services": config.services, "supervisor": config.supervisor}),
+    )
+
+    async def reload() -> str:
+        nonlocal config, email
+        config = Config(config.path)
+        email = Email(config) if config.email else None
+        handler.config = dict(
+            {"services": config.services, "supervisor": config.supervisor}
+        )
+        plan = handler.plan_reload()
+        await handler.reload(email=email)
+        return str(plan)
+
+    async def reload_on_signal() -> None:
+        logger.info("Reloading configuration. (SIGHUP)")
+        try:
+            await reload()
+        except Exception as e:
+            logger.error(f"Reload failed: {e}")
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGINT, stop.set)
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    loop.add_signal_handler(
+        signal.SIGHUP, lambda: asyncio.create_task(reload_on_signal())
+    )
+    server = ControlServer(handler, socket_path, reload=reload)
+    await server.start()
+    metrics = await start_metrics(handler, config)
+    task = asyncio.create_task(handler.autostart())
+    try:
+        await stop.wait()
+        logger.warning("Stopping taskmaster daemon.")
+    finally:
+        await server.close()
+        if metrics:
+            await metrics.close()
+        task.cancel()
+        await handler.delete()
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            loop.remove_signal_handler(sig)
+
+
 def main() -> None:
+    args = None
     try:
         parser = argparse.ArgumentParser()
         parser.add_argument("-f", "--file", help="Path to the configuration file")
-        parser.add_argument("-g", "--generate", help="Generate a configuration file at path", type=str)
+        parser.add_argument(
+            "-g", "--generate", help="Generate a configuration file at path", type=str
+        )
         parser.add_argument(
             "-l",
             "--loglevel",
             default="warning",
             help="Provide logging level. Example --loglevel debug, default=warning",
         )
+        parser.add_argument(
+            "-n",
+            "--dry-run",
+            help="Show what reloading the configuration file at path would change, then exit",
+            type=str,
+        )
+        parser.add_argument(
+            "-d",
+            "--daemon",
+            action="store_true",
+            help="Run without the interface, controlled with taskmasterctl",
+        )
+        parser.add_argument(
+            "-s",
+            "--socket",
+            default=DEFAULT_SOCKET,
+            help=f"Path of the control socket in daemon mode, default={DEFAULT_SOCKET}",
+        )
         args = parser.parse_args()
         if args.generate:
             generate_config(args.generate)
             return
         config = Config(args.file if args.file else "taskmaster.yml")
+        if args.dry_run:
+            print(ReloadPlan.compute(config.services, Config(args.dry_run).services))
+            return
     except Exception as e:
+        if args is not None and args.daemon:
+            print(f"Configuration error: {e}", file=sys.stderr)
+            sys.exit(1)
         interface = Gui()
         interface.configuration_error(e)
         return
     logger.setLevel(args.loglevel.upper())
+    if args.daemon:
+        try:
+            asyncio.run(daemon(config, args.socket))
+        except ControlError as e:
+            print(f"Control socket error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
     asyncio.run(taskmaster(config))
 
 
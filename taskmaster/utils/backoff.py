@@ -0,0 +1,328 @@
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Deque, Mapping
+import random
+import time
+
+from .logger import logger
+from .restart_budget import RestartBudget
+from .timer_wheel import TimerWheel
+
+LINEAR = "linear"
+EXPONENTIAL = "exponential"
+FULL_JITTER = "full"
+NO_JITTER = "none"
+
+
+@dataclass(frozen=True)
+class BackoffPolicy:
+    """
+    The delay before each retry of a process.
+
+    Attributes:
+        strategy: linear (base * attempt) or exponential (base * factor ** (attempt - 1)).
+        base: The delay of the first retry, in seconds.
+        factor: The growth of the exponential delay.
+        max: The cap of the delay, in seconds, None for no cap.
+        jitter: full to pick the delay at random between 0 and the computed one,
+            so that processes failing together do not retry together.
+        reset_after: The seconds a process has to run before failing for its
+            attempts to start over, 0 for never.
+    """
+
+    strategy: str = LINEAR
+    base: float = 1
+    factor: float = 2
+    max: float | None = None
+    jitter: str = NO_JITTER
+    reset_after: float = 0
+
+    @classmethod
+    def from_config(cls, config: Any) -> "BackoffPolicy":
+        """
+        Reads the `backoff` section of a service configuration, the default
+        linear policy (1, 2, 3... seconds) without one. Without `reset_after`,
+        the attempts start over after the `reset_after` of the circuit breaker,
+        never without one.
+        """
+        breaker = getattr(config, "circuit_breaker", None)
+        reset_after = breaker.get("reset_after", 60) if breaker else 0
+        backoff = getattr(config, "backoff", None)
+        if not backoff:
+            return cls(reset_after=reset_after)
+        return cls(
+            strategy=backoff.get("strategy", LINEAR),
+            base=backoff.get("base", 1),
+            factor=backoff.get("factor", 2),
+            max=backoff.get("max"),
+            jitter=backoff.get("jitter", NO_JITTER),
+            reset_after=backoff.get("reset_after", reset_after),
+        )
+
+    def delay(
+        self, attempt: int, uniform: Callable[[float, float], float] = random.uniform
+    ) -> float:
+        """
+        Gets the delay before a retry.
+
+        Args:
+            attempt: The number of the retry, from 1.
+            uniform: Picks the jittered delay, see `random.uniform`.
+        """
+        attempt = max(1, attempt)
+        if self.strategy == EXPONENTIAL:
+            # Not computed past the cap, factor ** attempt could overflow
+            delay = self.base
+            for _ in range(attempt - 1):
+                delay *= self.factor
+                if self.max is not None and delay >= self.max:
+                    break
+        else:
+            delay = self.base * attempt
+        if self.max is not None:
+            delay = min(delay, self.max)
+        if self.jitter == FULL_JITTER:
+            delay = uniform(0, delay)
+        return delay
+
+
+class BreakerState(Enum):
+    """
+    Enumeration for the states of a circuit breaker.
+
+    Options:
+    - CLOSED: Processes are restarted as usual.
+    - OPEN: Too many failures, restarts wait for `open_for` seconds.
+    - HALF_OPEN: One process is restarted to probe whether the failures are
+      over, the others wait for it to stay up `reset_after` seconds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops the restarts of a service in a crash loop.
+
+    It opens after `failures` failures within `window` seconds, and restarts
+    wait while it is open. After `open_for` seconds it is half-open: one
+    restart goes through as a probe. If no process fails for `reset_after`
+    seconds, the breaker closes, otherwise it opens again. A process that ran
+    for `reset_after` seconds before failing clears the failures counted so far.
+
+    The state is updated when it is read, there is no timer.
+
+    Args:
+        failures: The number of failures that opens the breaker.
+        window: The seconds failures are counted over.
+        open_for: The seconds it stays open.
+        reset_after: The seconds of healthy uptime that close it.
+        name: The name used in logs.
+        clock: Gets the current time, in seconds.
+    """
+
+    def __init__(
+        self,
+        failures: int,
+        window: float = 60,
+        open_for: float = 30,
+        reset_after: float = 60,
+        name: str = "",
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failures = failures
+        self.window = window
+        self.open_for = open_for
+        self.reset_after = reset_after
+        self.name = name
+        self._clock = clock
+        self._state: BreakerState = BreakerState.CLOSED
+        self._failures: Deque[float] = deque()
+        self._open_until: float = 0
+        # When the half-open probe was let through, None until one is
+        self._probe: float | None = None
+
+    @classmethod
+    def from_config(cls, config: Any) -> "CircuitBreaker | None":
+        """
+        Reads the `circuit_breaker` section of a service configuration.
+
+        Returns:
+            The breaker, None if the service has none.
+        """
+        breaker: Mapping[str, Any] | None = getattr(config, "circuit_breaker", None)
+        if not breaker:
+            return None
+        return cls(
+            failures=breaker["failures"],
+            window=breaker.get("window", 60),
+            open_for=breaker.get("open_for", 30),
+            reset_after=breaker.get("reset_after", 60),
+            name=getattr(config, "name", ""),
+        )
+
+    @property
+    def state(self) -> BreakerState:
+        """
+        Gets the state of the breaker.
+        """
+        self._update(self._clock())
+        return self._state
+
+    def _update(self, now: float) -> None:
+        if self._state == BreakerState.OPEN and now >= self._open_until:
+            self._state = BreakerState.HALF_OPEN
+            self._probe = None
+            logger.info(f"Service {self.name}: circuit breaker half-open.")
+        elif (
+            self._state == BreakerState.HALF_OPEN
+            and self._probe is not None
+            and now - self._probe >= self.reset_after
+        ):
+            self._state = BreakerState.CLOSED
+            self._failures.clear()
+            logger.info(f"Service {self.name}: circuit breaker closed.")
+
+    def _open(self, now: float) -> None:
+        self._state = BreakerState.OPEN
+        self._open_until = now + self.open_for
+        self._failures.clear()
+        self._probe = None
+        logger.warning(
+            f"Service {self.name}: circuit breaker open, restarts paused for "
+            f"{self.open_for} seconds."
+        )
+
+    def record_failure(self, uptime: float | None = None) -> None:
+        """
+        Records that a process failed to start, or exited.
+
+        Args:
+            uptime: How long the process ran, None if it did not start.
+        """
+        now = self._clock()
+        self._update(now)
+        if self._state == BreakerState.OPEN:
+            # Processes started before it opened, already accounted for
+            return
+        if self._state == BreakerState.HALF_OPEN:
+            self._open(now)
+            return
+        if uptime is not None and uptime >= self.reset_after:
+            self._failures.clear()
+        self._failures.append(now)
+        while self._failures and self._failures[0] < now - self.window:
+            self._failures.popleft()
+        if len(self._failures) >= self.failures:
+            self._open(now)
+
+    def retry_in(self) -> float:
+        """
+        Gets how long a restart has to wait. When it is 0 in the half-open state,
+        the restart is the probe.
+        """
+        now = self._clock()
+        self._update(now)
+        if self._state == BreakerState.OPEN:
+            return self._open_until - now
+        if self._state == BreakerState.HALF_OPEN:
+            if self._probe is None:
+                self._probe = now
+                return 0
+            return self._probe + self.reset_after - now
+        return 0
+
+    async def acquire(self, timers: TimerWheel) -> None:
+        """
+        Waits until a restart may go through.
+        """
+        while (delay := self.retry_in()) > 0:
+            await timers.sleep(delay)
+
+
+class RestartPolicy:
+    """
+    How the processes of a service are retried: the backoff between attempts,
+    the circuit breaker if any, and the supervisor-wide restart budget if any.
+
+    Without a breaker, a process is FATAL once out of `startretries`. With one,
+    it is retried as long as the breaker lets it.
+
+    Args:
+        backoff: The delay before each retry.
+        breaker: The circuit breaker shared by the processes of the service.
+        budget: The restart budget shared by every service.
+        name: The name of the service.
+        priority: The priority of the service in the restart budget queue.
+    """
+
+    def __init__(
+        self,
+        backoff: BackoffPolicy | None = None,
+        breaker: CircuitBreaker | None = None,
+        budget: RestartBudget | None = None,
+        name: str = "",
+        priority: int = 999,
+    ) -> None:
+        self.backoff = backoff or BackoffPolicy()
+        self.breaker = breaker
+        self.budget = budget
+        self.name = name
+        self.priority = priority
+
+    @classmethod
+    def from_config(
+        cls, config: Any, budget: RestartBudget | None = None
+    ) -> "RestartPolicy":
+        """
+        Reads the `backoff` and `circuit_breaker` sections of a service configuration.
+        """
+        return cls(
+            BackoffPolicy.from_config(config),
+            CircuitBreaker.from_config(config),
+            budget=budget,
+            name=getattr(config, "name", ""),
+            priority=getattr(config, "priority", 999),
+        )
+
+    def healthy(self, uptime: float) -> bool:
+        """
+        Checks whether a process ran long enough for its backoff to start over.
+        """
+        reset_after = self.backoff.reset_after
+        return reset_after > 0 and uptime >= reset_after
+
+    async def retry(
+        self,
+        attempt: int,
+        timers: TimerWheel,
+        uptime: float | None = None,
+        failed: bool = True,
+    ) -> None:
+        """
+        Records a failure, then waits until the process may be retried.
+
+        Args:
+            attempt: The number of the retry, from 1.
+            timers: The timer wheel to sleep on.
+            uptime: How long the process ran, None if it did not start.
+            failed: Whether the process failed, rather than exited as expected
+                and restarted anyway (autorestart always). Only failures count
+                towards the circuit breaker.
+        """
+        if failed and self.breaker is not None:
+            self.breaker.record_failure(uptime)
+        await timers.sleep(self.backoff.delay(attempt))
+        if self.breaker is not None:
+            await self.breaker.acquire(timers)
+        await self.admit()
+
+    async def admit(self) -> None:
+        """
+        Waits for the restart budget to let a restart through.
+        """
+        if self.budget is not None:
+            await self.budget.acquire(self.name, self.priority)
@@ -0,0 +1,254 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+import errno
+import os
+import signal
+
+from .logger import logger
+from .sizes import parse_size
+
+# The controllers the service groups use
+CONTROLLERS = ("cpu", "memory", "pids")
+# The period of cpu.max, in microseconds
+CPU_PERIOD = 100000
+UNLIMITED = "max"
+
+
+def cgroup_limits(config: Dict[str, Any] | None) -> Dict[str, str]:
+    """
+    Converts the `cgroup` section of a service to the values of the cgroup files.
+
+    Args:
+        config: cpu_max (a number of CPUs), memory_max and memory_high (sizes)
+            and pids_max, each "max" for no limit. Missing ones are unlimited.
+
+    Returns:
+        The content of each file, by file name.
+    """
+    config = config or {}
+    cpu = config.get("cpu_max", UNLIMITED)
+    limits = {
+        "cpu.max": (
+            f"{UNLIMITED} {CPU_PERIOD}"
+            if cpu == UNLIMITED
+            else f"{max(1000, int(cpu * CPU_PERIOD))} {CPU_PERIOD}"
+        ),
+    }
+    for key, file in (("memory_max", "memory.max"), ("memory_high", "memory.high")):
+        size = config.get(key, UNLIMITED)
+        limits[file] = UNLIMITED if size == UNLIMITED else str(parse_size(size))
+    limits["pids.max"] = str(config.get("pids_max", UNLIMITED))
+    return limits
+
+
+@dataclass(frozen=True)
+class CgroupUsage:
+    """
+    The resources used by the processes of a cgroup, as accounted by the kernel.
+
+    Attributes:
+        cpu_usec: The CPU time used since the group was created, in microseconds.
+        memory: The memory charged to the group (page cache included), in bytes,
+            0 without the memory controller.
+        tasks: The number of threads, 0 without the pids controller.
+        processes: The number of processes.
+    """
+
+    cpu_usec: int = 0
+    memory: int = 0
+    tasks: int = 0
+    processes: int = 0
+
+
+class ServiceCgroup:
+    """
+    The cgroup of a service: its limits, its processes and their usage.
+
+    Args:
+        path: The directory of the group.
+        controllers: The controllers enabled for the group.
+    """
+
+    def __init__(self, path: str, controllers: Tuple[str, ...] = CONTROLLERS) -> None:
+        self.path = path
+        self.controllers = controllers
+
+    def __repr__(self) -> str:
+        return f"ServiceCgroup({self.path!r})"
+
+    @property
+    def procs(self) -> str:
+        """
+        Gets the path of the file a pid is written to, to move it to the group.
+        """
+        return os.path.join(self.path, "cgroup.procs")
+
+    def _read(self, name: str) -> str | None:
+        try:
+            with open(os.path.join(self.path, name)) as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def apply(self, limits: Dict[str, str]) -> bool:
+        """
+        Writes the limits of the group. A limit whose controller is not enabled
+        is skipped, with a warning unless it is unlimited.
+
+        Args:
+            limits: The content of each file, see `cgroup_limits`.
+
+        Returns:
+            True if every limit was written.
+        """
+        applied = True
+        for name, value in limits.items():
+            if name.split(".", 1)[0] not in self.controllers:
+                if value.split()[0] != UNLIMITED:
+                    applied = False
+                    logger.warning(
+                        f"Cgroup {self.path}: {name} ignored, the controller "
+                        "is not enabled."
+                    )
+                continue
+            try:
+                with open(os.path.join(self.path, name), "w") as file:
+                    file.write(value)
+            except OSError as e:
+                applied = False
+                logger.warning(f"Cgroup {self.path}: cannot set {name}: {e}")
+        return applied
+
+    def pids(self) -> List[int]:
+        """
+        Gets the pids of the processes in the group.
+        """
+        return [int(pid) for pid in (self._read("cgroup.procs") or "").split()]
+
+    def usage(self) -> CgroupUsage:
+        """
+        Reads the usage of the group, a few small files whatever its size.
+        """
+        cpu_usec = 0
+        for line in (self._read("cpu.stat") or "").splitlines():
+            key, _, value = line.partition(" ")
+            if key == "usage_usec":
+                cpu_usec = int(value)
+                break
+        memory = self._read("memory.current")
+        tasks = self._read("pids.current")
+        return CgroupUsage(
+            cpu_usec=cpu_usec,
+            memory=int(memory) if memory else 0,
+            tasks=int(tasks) if tasks else 0,
+            processes=len(self.pids()),
+        )
+
+    def kill(self) -> int:
+        """
+        Kills every process of the group, with cgroup.kill when the kernel has it.
+
+        Returns:
+            The number of processes killed.
+        """
+        pids = self.pids()
+        if not pids:
+            return 0
+        try:
+            with open(os.path.join(self.path, "cgroup.kill"), "w") as file:
+                file.write("1")
+        except OSError:
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        return len(pids)
+
+    def remove(self) -> None:
+        """
+        Removes the group, once its processes are gone.
+        """
+        try:
+            os.rmdir(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Cgroup {self.path}: cannot remove it: {e}")
+
+
+class CgroupTree:
+    """
+    A cgroup v2 subtree under a delegated root, with a group per service.
+
+    The root is created if its parent is a cgroup v2 directory, and the cpu,
+    memory and pids controllers are enabled for its children when available.
+    If the root cannot be used, cgroups are disabled with a warning and the
+    services run without them.
+
+    Args:
+        root: The directory of the delegated root.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(root)
+        self.controllers: List[str] = []
+        self.enabled: bool = self._prepare()
+
+    def _prepare(self) -> bool:
+        parent = os.path.dirname(self.root)
+        try:
+            if not os.path.isdir(self.root):
+                if not os.path.isfile(os.path.join(parent, "cgroup.controllers")):
+                    raise OSError(
+                        errno.ENOTSUP, f"{parent} is not a cgroup v2 directory"
+                    )
+                os.mkdir(self.root)
+            path = os.path.join(self.root, "cgroup.controllers")
+            if not os.path.isfile(path):
+                raise OSError(errno.ENOTSUP, "not a cgroup v2 directory")
+            with open(path) as file:
+                available = file.read().split()
+            if not os.access(self.root, os.W_OK):
+                raise OSError(errno.EACCES, "not writable")
+        except OSError as e:
+            logger.warning(f"Cgroups disabled, cannot use {self.root}: {e}")
+            return False
+
+        for controller in CONTROLLERS:
+            if controller not in available:
+                logger.warning(
+                    f"Cgroups: the {controller} controller is not available."
+                )
+                continue
+            try:
+                with open(
+                    os.path.join(self.root, "cgroup.subtree_control"), "w"
+                ) as file:
+                    file.write(f"+{controller}")
+                self.controllers.append(controller)
+            except OSError as e:
+                logger.warning(
+                    f"Cgroups: cannot enable the {controller} controller: {e}"
+                )
+        return True
+
+    def service(self, name: str) -> ServiceCgroup | None:
+        """
+        Gets the group of a service, creating it if needed.
+
+        Returns:
+            The group, None if cgroups are disabled or it cannot be created.
+        """
+        if not self.enabled:
+            return None
+        directory = name.replace("/", "_")
+        if directory in ("", ".", ".."):
+            directory = f"_{directory}"
+        path = os.path.join(self.root, directory)
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Cgroup of {name}: cannot create {path}: {e}")
+            return None
+        return ServiceCgroup(path, tuple(self.controllers))
@@ -0,0 +1,295 @@
+from typing import Any, Callable, Dict
+import asyncio
+import contextlib
+import os
+import signal
+import weakref
+
+from .logger import logger
+from .process_tree import children, set_child_subreaper
+
+# Seconds between two sweeps for orphans still running, once adopting them
+ORPHAN_SWEEP = 1.0
+# Minimum seconds between two sweeps triggered by SIGCHLD
+ORPHAN_DEBOUNCE = 0.1
+
+
+class ChildWatcher:
+    """
+    Event-driven child exit notification.
+
+    Every watched pid gets a future that resolves with its return code
+    (negative signal number if it was killed, like `subprocess.Popen`)
+    as soon as the child exits. Children are reaped with `os.waitpid`.
+
+    Uses a pidfd per child when the kernel supports it, and falls back to a
+    single SIGCHLD handler that reaps every watched pid otherwise.
+
+    It can also adopt orphans, see `adopt_orphans`.
+    """
+
+    _watchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ChildWatcher]" = (
+        weakref.WeakKeyDictionary()
+    )
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        self._loop_ref = weakref.ref(loop or asyncio.get_running_loop())
+        self._futures: Dict[int, asyncio.Future[int]] = {}
+        self._pidfds: Dict[int, int] = {}
+        self._use_pidfd: bool = self._pidfd_supported()
+        self._sigchld_installed: bool = False
+        # Adopting orphans: who they belong to, and what to do with them
+        self._attribute: Callable[[int], Any] | None = None
+        self._on_orphan: Callable[[int, Any, int | None], None] | None = None
+        # Orphans adopted while running, with their owner, until reaped
+        self._orphans: Dict[int, Any] = {}
+        self._sweep_handle: asyncio.Handle | None = None
+        self._last_sweep: float = float("-inf")
+        self._sweep_timer: asyncio.TimerHandle | None = None
+        logger.debug(
+            f"Child watcher using {'pidfd' if self._use_pidfd else 'SIGCHLD'} backend."
+        )
+
+    @classmethod
+    def current(cls) -> "ChildWatcher":
+        """
+        Gets the child watcher bound to the running event loop, creating it if needed.
+        """
+        loop = asyncio.get_running_loop()
+        watcher = cls._watchers.get(loop)
+        if watcher is None or loop.is_closed():
+            watcher = cls(loop)
+            cls._watchers[loop] = watcher
+        return watcher
+
+    @staticmethod
+    def _pidfd_supported() -> bool:
+        """
+        Checks whether pidfd_open is available and usable on this kernel.
+        """
+        if not hasattr(os, "pidfd_open"):
+            return False
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+        except OSError:
+            return False
+        return True
+
+    @property
+    def _loop(self) -> asyncio.AbstractEventLoop:
+        loop = self._loop_ref()
+        if loop is None:
+            raise RuntimeError("The event loop of the child watcher is gone.")
+        return loop
+
+    @property
+    def backend(self) -> str:
+        """
+        Gets the name of the backend in use ("pidfd" or "sigchld").
+        """
+        return "pidfd" if self._use_pidfd else "sigchld"
+
+    def __len__(self) -> int:
+        return len(self._futures)
+
+    @property
+    def orphans(self) -> Dict[int, Any]:
+        """
+        Gets the adopted orphans still running, with their owner.
+        """
+        return dict(self._orphans)
+
+    def adopt_orphans(
+        self,
+        attribute: Callable[[int], Any],
+        on_orphan: Callable[[int, Any, int | None], None],
+        interval: float = ORPHAN_SWEEP,
+    ) -> bool:
+        """
+        Makes this process the child subreaper of its descendants, so that the
+        ones orphaned are reparented to it instead of init, and reaps them.
+
+        Orphans are looked for among the children that are not watched, on
+        SIGCHLD (at most every ORPHAN_DEBOUNCE seconds, so that exits of
+        watched children do not each cost a sweep) and every `interval`
+        seconds for the ones still running.
+        Children that are not attributed to an owner (spawned elsewhere in
+        this process) are left alone.
+
+        Args:
+            attribute: Gets the owner of an unwatched child from its pid, None if
+                it is not an orphan to adopt.
+            on_orphan: Called once per orphan with its pid, its owner and its
+                return code if it already exited (None if it is running).
+            interval: The seconds between two sweeps.
+
+        Returns:
+            False if the kernel does not support it.
+        """
+        if not set_child_subreaper(True):
+            return False
+        self._attribute = attribute
+        self._on_orphan = on_orphan
+        self._install_sigchld()
+        self._schedule_sweep(interval)
+        return True
+
+    def release_orphans(self) -> None:
+        """
+        Stops adopting orphans. The ones already adopted are reaped when they
+        exit, as long as the watcher lives.
+        """
+        if self._attribute is None:
+            return
+        set_child_subreaper(False)
+        self._attribute = None
+        self._on_orphan = None
+        if self._sweep_timer is not None:
+            self._sweep_timer.cancel()
+            self._sweep_timer = None
+
+    def _schedule_sweep(self, interval: float) -> None:
+        def sweep() -> None:
+            self.sweep_orphans()
+            self._schedule_sweep(interval)
+
+        self._sweep_timer = self._loop.call_later(interval, sweep)
+
+    def sweep_orphans(self) -> None:
+        """
+        Adopts the new orphans and reaps the ones that exited.
+        """
+        self._sweep_handle = None
+        self._last_sweep = self._loop.time()
+        for pid in children(os.getpid()):
+            if pid in self._futures:
+                continue
+            if pid in self._orphans:
+                owner = self._orphans[pid]
+            elif self._attribute is not None:
+                owner = self._attribute(pid)
+                if owner is None:
+                    continue
+            else:
+                continue
+            try:
+                reaped, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                self._orphans.pop(pid, None)
+                continue
+            returncode = os.waitstatus_to_exitcode(status) if reaped else None
+            if pid not in self._orphans and self._on_orphan is not None:
+                self._on_orphan(pid, owner, returncode)
+            if reaped:
+                self._orphans.pop(pid, None)
+            else:
+                self._orphans[pid] = owner
+
+    def watch(self, pid: int) -> asyncio.Future[int]:
+        """
+        Starts watching a child process.
+
+        Args:
+            pid: The pid of a direct child of this process.
+
+        Returns:
+            A future resolved with the return code once the child exited.
+        """
+        future = self._futures.get(pid)
+        if future is not None:
+            return future
+
+        future = self._loop.create_future()
+        self._futures[pid] = future
+
+        if self._use_pidfd:
+            try:
+                pidfd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                # Already reaped by someone else, nothing left to wait for.
+                self._resolve(pid, 255)
+                return future
+            self._pidfds[pid] = pidfd
+            self._loop.add_reader(pidfd, self._on_pidfd_ready, pid)
+        else:
+            self._install_sigchld()
+            # The child may have exited before we started watching it.
+            self._loop.call_soon(self._reap, pid)
+        return future
+
+    def _install_sigchld(self) -> None:
+        if self._sigchld_installed:
+            return
+        self._loop.add_signal_handler(signal.SIGCHLD, self._on_sigchld)
+        self._sigchld_installed = True
+
+    def _on_pidfd_ready(self, pid: int) -> None:
+        pidfd = self._pidfds.pop(pid, None)
+        if pidfd is not None:
+            self._loop.remove_reader(pidfd)
+            os.close(pidfd)
+        if not self._reap(pid):
+            # Spurious wakeup, keep watching.
+            with contextlib.suppress(ProcessLookupError):
+                self._pidfds[pid] = os.pidfd_open(pid)
+                self._loop.add_reader(self._pidfds[pid], self._on_pidfd_ready, pid)
+
+    def _on_sigchld(self) -> None:
+        if not self._use_pidfd:
+            for pid in list(self._futures):
+                self._reap(pid)
+        if (self._attribute is not None or self._orphans) and (
+            self._sweep_handle is None
+        ):
+            # A burst of exits is handled by a single sweep
+            delay = self._last_sweep + ORPHAN_DEBOUNCE - self._loop.time()
+            self._sweep_handle = self._loop.call_later(
+                max(0, delay), self.sweep_orphans
+            )
+
+    def _reap(self, pid: int) -> bool:
+        """
+        Tries to reap a watched child without blocking.
+
+        Returns:
+            True if the child has been reaped.
+        """
+        if pid not in self._futures:
+            return True
+        try:
+            reaped, status = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            logger.warning(f"Child {pid} was reaped elsewhere.")
+            self._resolve(pid, 255)
+            return True
+        if reaped == 0:
+            return False
+        self._resolve(pid, os.waitstatus_to_exitcode(status))
+        return True
+
+    def _resolve(self, pid: int, returncode: int) -> None:
+        future = self._futures.pop(pid, None)
+        if future is not None and not future.done():
+            future.set_result(returncode)
+
+    def close(self) -> None:
+        """
+        Stops watching every child and adopting orphans, and releases the pidfds.
+        """
+        self.release_orphans()
+        if self._sweep_handle is not None:
+            self._sweep_handle.cancel()
+            self._sweep_handle = None
+        self._orphans.clear()
+        for pid, pidfd in self._pidfds.items():
+            with contextlib.suppress(Exception):
+                self._loop.remove_reader(pidfd)
+            os.close(pidfd)
+        self._pidfds.clear()
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        if self._sigchld_installed:
+            with contextlib.suppress(Exception):
+                self._loop.remove_signal_handler(signal.SIGCHLD)
+            self._sigchld_installed = False
@@ -2,6 +2,10 @@ import yaml
 from .logger import logger
 from cerberus import Validator, SchemaError
 from enum import Enum
+from .dependencies import topological_layers
+from .probes import Probe, ProbeKind
+from .spawn import IOPRIO_CLASSES, RLIMITS, SPREAD
+from .backoff import EXPONENTIAL, FULL_JITTER, LINEAR, NO_JITTER
 
 keys = [
     "name",
@@ -20,6 +24,22 @@ keys = [
     "stdout",
     "stderr",
     "user",
+    "priority",
+    "depends_on",
+    "readiness",
+    "liveness",
+    "max_unavailable",
+    "labels",
+    "max_rss",
+    "max_cpu_percent_sustained",
+    "max_open_fds",
+    "rlimits",
+    "nice",
+    "ionice",
+    "cpu_affinity",
+    "cgroup",
+    "backoff",
+    "circuit_breaker",
 ]
 
 
@@ -59,6 +79,84 @@ class Signal(Enum):
     QUIT = 3
 
 
+probe_schema = {
+    "type": {
+        "type": "string",
+        "required": True,
+        "allowed": [e.value for e in ProbeKind],
+    },
+    "port": {"type": "integer", "min": 1, "max": 65535},
+    "host": {"type": "string", "minlength": 1},
+    "path": {"type": "string", "minlength": 1},
+    "command": {"type": "string", "minlength": 1},
+    "interval": {"type": "number", "min": 0.01},
+    "timeout": {"type": "number", "min": 0.01},
+    "max_age": {"type": "number", "min": 0},
+}
+
+liveness_schema = {
+    **probe_schema,
+    "failure_threshold": {"type": "integer", "min": 1},
+}
+
+rlimit_value = [
+    {"type": "integer", "min": 0},
+    {"type": "string", "regex": r"^([0-9]+(\.[0-9]+)?[KMGTkmgt]?|unlimited)$"},
+]
+
+rlimit_schema = {
+    "anyof": [
+        *rlimit_value,
+        {
+            "type": "dict",
+            "schema": {
+                "soft": {"required": True, "anyof": rlimit_value},
+                "hard": {"required": True, "anyof": rlimit_value},
+            },
+        },
+    ],
+}
+
+size_or_max = {
+    "anyof": [
+        {"type": "integer", "min": 1},
+        {"type": "string", "regex": r"^([0-9]+(\.[0-9]+)?[KMGTkmgt]?|max)$"},
+    ],
+}
+
+cgroup_schema = {
+    "cpu_max": {
+        "anyof": [
+            {"type": "number", "min": 0.01},
+            {"type": "string", "allowed": ["max"]},
+        ],
+    },
+    "memory_max": size_or_max,
+    "memory_high": size_or_max,
+    "pids_max": {
+        "anyof": [
+            {"type": "integer", "min": 1},
+            {"type": "string", "allowed": ["max"]},
+        ],
+    },
+}
+
+backoff_schema = {
+    "strategy": {"type": "string", "allowed": [LINEAR, EXPONENTIAL]},
+    "base": {"type": "number", "min": 0},
+    "factor": {"type": "number", "min": 1},
+    "max": {"type": "number", "min": 0},
+    "jitter": {"type": "string", "allowed": [NO_JITTER, FULL_JITTER]},
+    "reset_after": {"type": "number", "min": 0},
+}
+
+circuit_breaker_schema = {
+    "failures": {"type": "integer", "min": 1, "required": True},
+    "window": {"type": "number", "min": 0},
+    "open_for": {"type": "number", "min": 0},
+    "reset_after": {"type": "number", "min": 0},
+}
+
 schema = {
     "email": {
         "type": "dict",
@@ -89,6 +187,68 @@ schema = {
             },
         },
     },
+    "metrics": {
+        "type": "dict",
+        "schema": {
+            "port": {
+                "type": "integer",
+                "required": True,
+                "min": 0,
+                "max": 65535,
+            },
+            "host": {
+                "type": "string",
+                "minlength": 1,
+            },
+            "lag_interval": {
+                "type": "number",
+                "min": 0.01,
+            },
+        },
+    },
+    "supervisor": {
+        "type": "dict",
+        "schema": {
+            "spawn_backend": {
+                "type": "string",
+                "allowed": ["fast", "fork"],
+            },
+            "max_concurrent_starts": {
+                "type": "integer",
+                "min": 1,
+            },
+            "max_starts_per_second": {
+                "type": "number",
+                "min": 0,
+            },
+            "start_burst": {
+                "type": "integer",
+                "min": 1,
+            },
+            "sample_interval": {
+                "type": "number",
+                "min": 0,
+            },
+            "cgroup_root": {
+                "type": "string",
+                "minlength": 1,
+            },
+            "max_restarts_per_second": {
+                "type": "number",
+                "min": 0,
+            },
+            "restart_burst": {
+                "type": "integer",
+                "min": 1,
+            },
+            "subreaper": {
+                "type": "boolean",
+            },
+            "kill_orphans": {
+                "type": "boolean",
+            },
+        },
+    },
     "services": {
         "type": "list",
         "required": True,
@@ -108,13 +268,13 @@ schema = {
                 "numprocs": {
                     "type": "integer",
                     "min": 1,
-                    "max": 32,
+                    "max": 4096,
                     "required": True,
                 },
                 "umask": {
                     "type": "integer",
                     "min": 0,
-                    "max": 777,
+                    "max": 0o777,
                     "required": True,
                 },
                 "workingdir": {
@@ -141,14 +301,14 @@ schema = {
                     "max": 10,
                     "required": True,
                 },
-                "starttime": {"type": "integer", "min": 0, "required": True},
+                "starttime": {"type": "number", "min": 0, "required": True},
                 "stopsignal": {
                     "type": "string",
                     "required": True,
                     "allowed": [e.name for e in Signal],
                 },
                 "stoptime": {
-                    "type": "integer",
+                    "type": "number",
                     "min": 0,
                     "required": True,
                 },
@@ -167,6 +327,100 @@ schema = {
                     "type": "string",
                     "minlength": 1,
                 },
+                "priority": {
+                    "type": "integer",
+                    "min": 0,
+                },
+                "depends_on": {
+                    "type": "list",
+                    "schema": {"type": "string", "minlength": 1},
+                },
+                "readiness": {
+                    "type": "dict",
+                    "schema": probe_schema,
+                },
+                "liveness": {
+                    "type": "dict",
+                    "schema": liveness_schema,
+                },
+                "max_unavailable": {
+                    "anyof": [
+                        {"type": "integer", "min": 1},
+                        {"type": "string", "regex": r"^([1-9][0-9]?|100)%$"},
+                    ],
+                },
+                "labels": {
+                    "type": "list",
+                    "schema": {"type": "string", "minlength": 1},
+                },
+                "max_rss": {
+                    "anyof": [
+                        {"type": "integer", "min": 1},
+                        {"type": "string", "regex": r"^[0-9]+(\.[0-9]+)?[KMGTkmgt]?$"},
+                    ],
+                },
+                "max_cpu_percent_sustained": {
+                    "anyof": [
+                        {"type": "number", "min": 0},
+                        {
+                            "type": "dict",
+                            "schema": {
+                                "percent": {
+                                    "type": "number",
+                                    "min": 0,
+                                    "required": True,
+                                },
+                                "seconds": {"type": "number", "min": 0},
+                            },
+                        },
+                    ],
+                },
+                "max_open_fds": {
+                    "type": "integer",
+                    "min": 1,
+                },
+                "rlimits": {
+                    "type": "dict",
+                    "schema": {name: rlimit_schema for name in RLIMITS},
+                },
+                "nice": {
+                    "type": "integer",
+                    "min": -20,
+                    "max": 19,
+                },
+                "ionice": {
+                    "type": "dict",
+                    "schema": {
+                        "class": {
+                            "type": "string",
+                            "required": True,
+                            "allowed": list(IOPRIO_CLASSES),
+                        },
+                        "level": {"type": "integer", "min": 0, "max": 7},
+                    },
+                },
+                "cpu_affinity": {
+                    "anyof": [
+                        {
+                            "type": "list",
+                            "minlength": 1,
+                            "schema": {"type": "integer", "min": 0},
+                        },
+                        {"type": "string", "allowed": [SPREAD]},
+                    ],
+                },
+                "cgroup": {
+                    "type": "dict",
+                    "schema": cgroup_schema,
+                },
+                "backoff": {
+                    "type": "dict",
+                    "schema": backoff_schema,
+                },
+                "circuit_breaker": {
+                    "type": "dict",
+                    "schema": circuit_breaker_schema,
+                },
             },
         },
     },
@@ -192,6 +446,13 @@ class Config:
                 names = [service["name"] for service in content["services"]]
                 if len(names) != len(set(names)):
                     raise ValueError("Duplicate service names.")
+                # Check that dependencies exist and have no cycle
+                topological_layers(
+                    {
+                        service["name"]: service.get("depends_on") or []
+                        for service in content["services"]
+                    }
+                )
                 # Sort keys to have all services in the same order
                 data = content["services"]
                 _services = []
@@ -201,7 +462,26 @@ class Config:
                     service.setdefault("stderr", None)
                     service.setdefault("user", None)
                     service.setdefault("env", {})
-                    # range key in this order : name, cmd, numprocs, umask, workingdir, autostart, autorestart, exitcodes, startretries, starttime, stopsignal, stoptime, stdout, stderr, user
+                    service.setdefault("priority", 999)
+                    service.setdefault("depends_on", [])
+                    service.setdefault("readiness", None)
+                    service.setdefault("liveness", None)
+                    service.setdefault("max_unavailable", None)
+                    service.setdefault("labels", [])
+                    service.setdefault("max_rss", None)
+                    service.setdefault("max_cpu_percent_sustained", None)
+                    service.setdefault("max_open_fds", None)
+                    service.setdefault("rlimits", None)
+                    service.setdefault("nice", None)
+                    service.setdefault("ionice", None)
+                    service.setdefault("cpu_affinity", None)
+                    service.setdefault("cgroup", None)
+                    service.setdefault("backoff", None)
+                    service.setdefault("circuit_breaker", None)
+                    for probe in ("readiness", "liveness"):
+                        if service[probe] is not None:
+                            Probe.from_config(service[probe])
+                    # range key in the order of `keys`
                     _service = dict()
                     for key in keys:
                         _service[key] = service[key]
@@ -228,6 +508,14 @@ class Config:
     def services(self):
         return self.config["services"]
 
+    @property
+    def supervisor(self):
+        return self.config.get("supervisor") or {}
+
+    @property
+    def metrics(self):
+        return self.config.get("metrics")
+
     @property
     def email(self):
         if "email" not in self.config:
@@ -254,10 +542,14 @@ email:
   smtp_server: "smtp.gmail.com"
   smtp_port: 465
 
+# metrics: # Prometheus metrics at http://host:port/metrics
+#   port: 9101
+#   host: 127.0.0.1
+
 services:
   - name:
     cmd:
-    numprocs: 1 # min 1 max 32
+    numprocs: 1 # min 1 max 4096
     umask: 077
     workingdir: /tmp
     autostart: true
@@ -273,6 +565,53 @@ services:
     # stdout: /tmp/taskmaster.log
     # stderr: /tmp/taskmaster.log
     # user: xxx
+    # priority: 999
+    # depends_on:
+    #  - xxx
+    # readiness:
+    #  type: tcp # tcp, unix, file, exec
+    #  port: 8080
+    #  interval: 0.1
+    #  timeout: 1
+    # liveness:
+    #  type: file # tcp, unix, file, exec
+    #  path: /tmp/heartbeat
+    #  max_age: 10
+    #  interval: 5
+    #  failure_threshold: 3
+    # max_unavailable: 25% # rolling restarts, count or percentage
+    # labels:
+    #  - xxx
+    # max_rss: 512M # restarted when over, needs supervisor.sample_interval
+    # max_cpu_percent_sustained:
+    #  percent: 90
+    #  seconds: 60
+    # max_open_fds: 1024
+    # rlimits: # nofile, as, nproc, core
+    #  nofile: 4096 # or soft: and hard:
+    #  as: 2G
+    #  core: 0
+    # nice: 10
+    # ionice:
+    #  class: best-effort # idle, best-effort, realtime
+    #  level: 7
+    # cpu_affinity: spread # or a list of CPUs
+    # cgroup: # needs supervisor.cgroup_root
+    #  cpu_max: 1.5 # CPUs
+    #  memory_max: 1G
+    #  memory_high: 768M
+    #  pids_max: 256
+    # backoff:
+    #  strategy: exponential # linear, exponential
+    #  base: 1
+    #  max: 60
+    #  jitter: full # none, full
+    #  reset_after: 300
+    # circuit_breaker:
+    #  failures: 5
+    #  window: 60
+    #  open_for: 30
+    #  reset_after: 60
 """
             )
     except Exception as e:
@@ -0,0 +1,72 @@
+from typing import Dict, Iterable, List, Mapping
+
+
+class DependencyError(ValueError):
+    """
+    Raised when the `depends_on` keys of the services do not form a valid graph.
+    """
+
+
+def topological_layers(dependencies: Mapping[str, Iterable[str]]) -> List[List[str]]:
+    """
+    Orders services so that every service comes after its dependencies.
+
+    Services of the same layer do not depend on each other and can be started
+    in parallel. Stopping walks the layers in reverse.
+
+    Args:
+        dependencies: The names each service depends on, by service name.
+
+    Returns:
+        The layers of service names, dependencies first.
+
+    Raises:
+        DependencyError: If a dependency is unknown or if there is a cycle.
+    """
+    remaining: Dict[str, int] = {}
+    dependents: Dict[str, List[str]] = {name: [] for name in dependencies}
+    for name, needs in dependencies.items():
+        needs = set(needs)
+        for need in needs:
+            if need not in dependents:
+                raise DependencyError(
+                    f"Service {name} depends on unknown service {need}."
+                )
+            dependents[need].append(name)
+        remaining[name] = len(needs)
+
+    layers: List[List[str]] = []
+    layer = [name for name, count in remaining.items() if count == 0]
+    while layer:
+        layers.append(layer)
+        following: List[str] = []
+        for name in layer:
+            del remaining[name]
+            for dependent in dependents[name]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    following.append(dependent)
+        layer = following
+
+    if remaining:
+        raise DependencyError(
+            f"Dependency cycle between services: {', '.join(sorted(remaining))}."
+        )
+    return layers
+
+
+def dependents_of(dependencies: Mapping[str, Iterable[str]]) -> Dict[str, List[str]]:
+    """
+    Inverts the dependency graph.
+
+    Args:
+        dependencies: The names each service depends on, by service name.
+
+    Returns:
+        The names of the services depending on each service, by service name.
+    """
+    dependents: Dict[str, List[str]] = {name: [] for name in dependencies}
+    for name, needs in dependencies.items():
+        for need in set(needs):
+            dependents.setdefault(need, []).append(name)
+    return dependents
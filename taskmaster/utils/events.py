@@ -0,0 +1,324 @@
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+)
+import asyncio
+import fnmatch
+import time
+
+from .logger import logger
+
+
+class EventKind(Enum):
+    """
+    Enumeration for the lifecycle events of a process.
+
+    Options:
+    - SPAWNED: The process was spawned, it is starting.
+    - RUNNING: The process is running (started for starttime, or ready).
+    - BACKOFF: Spawning the process failed, it will be retried.
+    - EXITED: The process exited on its own, see `exitcode`.
+    - FATAL: The process could not be started.
+    - STOPPING: The process was sent its stop signal.
+    - STOPPED: The process was stopped.
+    - LIMIT_EXCEEDED: The process exceeded a resource limit, see `reason`. It is
+      restarted.
+    - ORPHANED: A descendant of a process of the service was orphaned and adopted
+      by taskmaster, see `pid` (the orphan), `exitcode` if it had already exited
+      and `reason` ("killed" if it was killed).
+    """
+
+    SPAWNED = "spawned"
+    RUNNING = "running"
+    BACKOFF = "backoff"
+    EXITED = "exited"
+    FATAL = "fatal"
+    STOPPING = "stopping"
+    STOPPED = "stopped"
+    LIMIT_EXCEEDED = "limit_exceeded"
+    ORPHANED = "orphaned"
+
+
+@dataclass(frozen=True)
+class Event:
+    """
+    A lifecycle event of a process.
+
+    Attributes:
+        kind: What happened.
+        service: The name of the service of the process.
+        pid: The pid of the process, if it was spawned.
+        exitcode: The exit code of the process, once it exited.
+        timestamp: When it happened, as returned by time.time.
+        previous: The previous event of the process (STOPPED before the first spawn).
+        reason: Why it happened, for LIMIT_EXCEEDED and ORPHANED.
+        leftovers: The processes of its group killed because they outlived it,
+            for STOPPED.
+    """
+
+    kind: EventKind
+    service: str
+    pid: int | None = None
+    exitcode: int | None = None
+    timestamp: float = field(default_factory=time.time)
+    previous: EventKind | None = None
+    reason: str | None = None
+    leftovers: int | None = None
+
+
+class DropPolicy(Enum):
+    """
+    Enumeration for what a subscription does with an event when its queue is full.
+
+    Options:
+    - DROP_OLDEST: Drop the oldest queued event to make room (keeps the latest state).
+    - DROP_NEWEST: Drop the new event (keeps the history from the first missed one).
+    """
+
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+
+class Subscription:
+    """
+    A bounded queue of events, read with `get` or `async for`.
+
+    Publishing never waits for subscribers: when the queue is full, events are
+    dropped according to the policy and counted in `dropped`.
+
+    With a handler, the events are consumed by a task calling it for each event,
+    started with the first event.
+    """
+
+    def __init__(
+        self,
+        bus: "EventBus",
+        maxsize: int,
+        policy: DropPolicy,
+        kinds: Set[EventKind] | None,
+        services: Set[str] | None,
+        handler: Callable[[Event], Awaitable[Any]] | None,
+        patterns: Set[str] | None = None,
+    ) -> None:
+        self._bus = bus
+        self._maxsize = maxsize
+        self._policy = policy
+        self.kinds = kinds
+        self.services = services
+        self.patterns = patterns
+        # Service name -> whether it matches the patterns
+        self._matches: Dict[str, bool] = {}
+        self._handler = handler
+        self._queue: Deque[Event] = deque()
+        self._waiter: asyncio.Future | None = None
+        self._task: asyncio.Task | None = None
+        self._closed: bool = False
+        self.dropped: int = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def matches(self, service: str) -> bool:
+        """
+        Checks whether the name of a service matches the patterns, if any.
+        """
+        if self.patterns is None:
+            return True
+        matches = self._matches.get(service)
+        if matches is None:
+            matches = self._matches[service] = any(
+                fnmatch.fnmatchcase(service, pattern) for pattern in self.patterns
+            )
+        return matches
+
+    def _deliver(self, event: Event) -> None:
+        """
+        Queues an event, dropping one if the queue is full.
+        """
+        if len(self._queue) >= self._maxsize:
+            self.dropped += 1
+            if self._policy == DropPolicy.DROP_NEWEST:
+                return
+            self._queue.popleft()
+        self._queue.append(event)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        if self._handler is not None and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._consume())
+
+    async def get(self) -> Event | None:
+        """
+        Waits for the next event.
+
+        Returns:
+            The event, None once the subscription is closed.
+        """
+        while not self._queue:
+            if self._closed:
+                return None
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._queue.popleft()
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> Event:
+        event = await self.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    def close(self) -> None:
+        """
+        Stops receiving events. Queued events can still be read.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._bus.unsubscribe(self)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _consume(self) -> None:
+        async for event in self:
+            try:
+                await self._handler(event)
+            except Exception as e:
+                logger.error(f"Event handler failed on {event.kind.value}: {e}")
+
+
+class EventBus:
+    """
+    Publishes the lifecycle events of the processes to their subscribers.
+
+    Subscriptions to given services are indexed by service name, so publishing
+    an event only visits the subscriptions interested in its service, the ones
+    to every service and the ones to glob patterns (whose matches are cached).
+
+    Listeners are called synchronously with every event, for consumers that
+    must not miss any and only do cheap bookkeeping (counters).
+
+    Args:
+        history: The number of recent events kept in `history`.
+    """
+
+    def __init__(self, history: int = 1000) -> None:
+        self._all: List[Subscription] = []
+        self._by_service: Dict[str, List[Subscription]] = {}
+        self._by_pattern: List[Subscription] = []
+        self._listeners: List[Callable[[Event], Any]] = []
+        self.history: Deque[Event] = deque(maxlen=history)
+
+    def subscribe(
+        self,
+        maxsize: int = 1000,
+        policy: DropPolicy = DropPolicy.DROP_OLDEST,
+        kinds: Optional[Iterable[EventKind]] = None,
+        services: Optional[Iterable[str]] = None,
+        handler: Callable[[Event], Awaitable[Any]] | None = None,
+        patterns: Optional[Iterable[str]] = None,
+    ) -> Subscription:
+        """
+        Subscribes to events.
+
+        Args:
+            maxsize: The maximum number of queued events.
+            policy: What to do with an event when the queue is full.
+            kinds: The kinds of events to receive. Defaults to all of them.
+            services: The names of the services to receive events of.
+                Defaults to all of them.
+            handler: A coroutine function consuming the events, if any.
+            patterns: Glob patterns (fnmatch) of the services to receive events
+                of, instead of `services`.
+
+        Returns:
+            The subscription, to read events from and to close.
+        """
+        subscription = Subscription(
+            bus=self,
+            maxsize=max(1, maxsize),
+            policy=policy,
+            kinds=set(kinds) if kinds is not None else None,
+            services=set(services) if services is not None else None,
+            handler=handler,
+            patterns=set(patterns) if patterns is not None else None,
+        )
+        if subscription.patterns is not None:
+            self._by_pattern.append(subscription)
+        elif subscription.services is None:
+            self._all.append(subscription)
+        else:
+            for service in subscription.services:
+                self._by_service.setdefault(service, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Removes a subscription. Use `Subscription.close` instead.
+        """
+        if subscription.patterns is not None:
+            if subscription in self._by_pattern:
+                self._by_pattern.remove(subscription)
+            return
+        if subscription.services is None:
+            if subscription in self._all:
+                self._all.remove(subscription)
+            return
+        for service in subscription.services:
+            subscriptions = self._by_service.get(service, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._by_service.pop(service, None)
+
+    def listen(self, listener: Callable[[Event], Any]) -> None:
+        """
+        Calls a function with every event, when it is published.
+        """
+        self._listeners.append(listener)
+
+    def unlisten(self, listener: Callable[[Event], Any]) -> None:
+        """
+        Stops calling a function added with `listen`.
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def publish(self, event: Event) -> None:
+        """
+        Delivers an event to its subscribers, without waiting for them.
+        """
+        self.history.append(event)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Event listener failed on {event.kind.value}: {e}")
+        for subscriptions in (self._all, self._by_service.get(event.service, ())):
+            for subscription in subscriptions:
+                if subscription.kinds is None or event.kind in subscription.kinds:
+                    subscription._deliver(event)
+        for subscription in self._by_pattern:
+            if subscription.kinds is None or event.kind in subscription.kinds:
+                if subscription.matches(event.service):
+                    subscription._deliver(event)
@@ -0,0 +1,209 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Mapping
+import asyncio
+import time
+import weakref
+
+from .logger import logger
+from .resources import Resources, ResourceSampler
+from .sizes import format_size, parse_size
+
+# How long the CPU must stay over max_cpu_percent_sustained by default, in seconds
+CPU_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    """
+    The resource limits of each process of a service.
+
+    Attributes:
+        max_rss: The resident memory, in bytes.
+        max_cpu_percent: The CPU percent (100 for one core) not to stay over...
+        cpu_seconds: ...for this many seconds.
+        max_open_fds: The number of open file descriptors.
+    """
+
+    max_rss: int | None = None
+    max_cpu_percent: float | None = None
+    cpu_seconds: float = CPU_SECONDS
+    max_open_fds: int | None = None
+
+    @classmethod
+    def from_config(cls, config: Any) -> "ResourceLimits | None":
+        """
+        Reads the limits of a service configuration.
+
+        Returns:
+            The limits, None if the service has none.
+        """
+        max_rss = getattr(config, "max_rss", None)
+        cpu = getattr(config, "max_cpu_percent_sustained", None)
+        max_open_fds = getattr(config, "max_open_fds", None)
+        if max_rss is None and cpu is None and max_open_fds is None:
+            return None
+        if isinstance(cpu, Mapping):
+            max_cpu_percent = cpu["percent"]
+            cpu_seconds = cpu.get("seconds", CPU_SECONDS)
+        else:
+            max_cpu_percent, cpu_seconds = cpu, CPU_SECONDS
+        return cls(
+            max_rss=parse_size(max_rss) if max_rss is not None else None,
+            max_cpu_percent=max_cpu_percent,
+            cpu_seconds=cpu_seconds,
+            max_open_fds=max_open_fds,
+        )
+
+
+class ResourceGuard:
+    """
+    Checks the processes against the resource limits of their service after each
+    pass of a resource sampler.
+
+    Like the watchdog, a watched process only costs an entry: the checks run from
+    the sampler listener, not from a task per process. When a limit is exceeded,
+    the process is unwatched and its callback is called with the reason;
+    restarting it is up to the caller.
+
+    Args:
+        sampler: The sampler of the processes.
+    """
+
+    class Watch:
+        """
+        A watched process.
+        """
+
+        __slots__ = ("name", "pid", "limits", "on_exceeded", "cpu_since", "tracked")
+
+        def __init__(
+            self,
+            name: str,
+            pid: int,
+            limits: Callable[[], ResourceLimits | None],
+            on_exceeded: Callable[[str], Any],
+            tracked: bool,
+        ) -> None:
+            self.name = name
+            self.pid = pid
+            self.limits = limits
+            self.on_exceeded = on_exceeded
+            # Since when the CPU is over the limit
+            self.cpu_since: float | None = None
+            # Whether the guard made the sampler track the process
+            self.tracked = tracked
+
+    _guards: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ResourceGuard]" = (
+        weakref.WeakKeyDictionary()
+    )
+
+    def __init__(self, sampler: ResourceSampler) -> None:
+        self._sampler = sampler
+        self._watches: Dict[Hashable, ResourceGuard.Watch] = {}
+        sampler.listen(self._check)
+
+    @classmethod
+    def current(cls) -> "ResourceGuard":
+        """
+        Gets the guard shared by the running event loop, with a sampler of its own,
+        creating it if needed.
+
+        Used by services that are not owned by a ServiceHandler.
+        """
+        loop = asyncio.get_running_loop()
+        guard = cls._guards.get(loop)
+        if guard is None:
+            guard = cls(ResourceSampler())
+            cls._guards[loop] = guard
+        return guard
+
+    @property
+    def sampler(self) -> ResourceSampler:
+        return self._sampler
+
+    def __len__(self) -> int:
+        return len(self._watches)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._watches
+
+    def watch(
+        self,
+        key: Hashable,
+        pid: int,
+        limits: Callable[[], ResourceLimits | None],
+        on_exceeded: Callable[[str], Any],
+        name: str,
+    ) -> None:
+        """
+        Starts checking a process against limits.
+
+        Args:
+            key: Identifies the watched process, given back to `unwatch`.
+            pid: The pid of the process, sampled by the sampler.
+            limits: Gets the current limits (they may change on reload), None
+                for none.
+            on_exceeded: Called once with the reason when a limit is exceeded.
+            name: The name of the service of the process.
+        """
+        self.unwatch(key)
+        tracked = pid not in self._sampler
+        if tracked:
+            self._sampler.track(pid, name)
+        self._watches[key] = self.Watch(name, pid, limits, on_exceeded, tracked)
+
+    def unwatch(self, key: Hashable) -> None:
+        """
+        Stops checking a process. Unwatching a process that is not watched does nothing.
+        """
+        watch = self._watches.pop(key, None)
+        if watch is not None and watch.tracked:
+            self._sampler.untrack(watch.pid)
+
+    def _check(self, sampler: ResourceSampler) -> None:
+        now = time.monotonic()
+        for key, watch in list(self._watches.items()):
+            limits = watch.limits()
+            usage = sampler.process(watch.pid)
+            if limits is None or usage is None:
+                continue
+            reason = self._exceeded(watch, limits, usage, now)
+            if reason is None:
+                continue
+            self.unwatch(key)
+            try:
+                watch.on_exceeded(reason)
+            except Exception as e:
+                logger.error(f"Resource limit handler of {watch.name} failed: {e}")
+
+    @staticmethod
+    def _exceeded(
+        watch: "ResourceGuard.Watch",
+        limits: ResourceLimits,
+        usage: Resources,
+        now: float,
+    ) -> str | None:
+        """
+        Gets why a process exceeds its limits, None if it does not.
+        """
+        if limits.max_rss is not None and usage.rss > limits.max_rss:
+            return (
+                f"max_rss: {format_size(usage.rss)} resident, "
+                f"over {format_size(limits.max_rss)}"
+            )
+        if limits.max_open_fds is not None and usage.fds > limits.max_open_fds:
+            return f"max_open_fds: {usage.fds} open, over {limits.max_open_fds}"
+        if (
+            limits.max_cpu_percent is None
+            or usage.cpu_percent <= limits.max_cpu_percent
+        ):
+            watch.cpu_since = None
+            return None
+        if watch.cpu_since is None:
+            watch.cpu_since = now
+        if now - watch.cpu_since >= limits.cpu_seconds:
+            return (
+                f"max_cpu_percent_sustained: {usage.cpu_percent:.0f}% CPU "
+                f"for {now - watch.cpu_since:.0f}s, over {limits.max_cpu_percent}%"
+            )
+        return None
@@ -0,0 +1,206 @@
+from dataclasses import dataclass, replace
+from enum import Enum
+from typing import Any, Dict, Mapping
+import asyncio
+import contextlib
+import os
+import signal
+import subprocess
+import time
+
+from .child_watcher import ChildWatcher
+from .spawn import SpawnPlan, SpawnPlanError, spawn
+from .timer_wheel import TimerWheel
+
+
+class ProbeError(ValueError):
+    """
+    Raised when a probe configuration is invalid.
+    """
+
+
+class ProbeKind(Enum):
+    """
+    Enumeration for probe kinds.
+
+    Options:
+    - TCP: Connect to a TCP port.
+    - UNIX: Connect to a unix socket.
+    - FILE: Check that a file exists (and was touched since the process started,
+      or in the last `max_age` seconds for heartbeats).
+    - EXEC: Run a command, exit code 0 passes.
+    """
+
+    TCP = "tcp"
+    UNIX = "unix"
+    FILE = "file"
+    EXEC = "exec"
+
+
+@dataclass(frozen=True)
+class Probe:
+    """
+    A check run against a process of a service.
+
+    Attributes:
+        kind: What to check.
+        port: The TCP port, for tcp probes.
+        host: The TCP host, for tcp probes.
+        path: The socket or file path, for unix and file probes.
+        command: The command line, for exec probes.
+        interval: The time between two checks, in seconds.
+        timeout: The time a single check may take, in seconds.
+        max_age: For file probes, the maximum age of the file, in seconds.
+        plan: The spawn plan of the command, once bound to a service.
+    """
+
+    kind: ProbeKind
+    port: int | None = None
+    host: str = "127.0.0.1"
+    path: str | None = None
+    command: str | None = None
+    interval: float = 0.1
+    timeout: float = 1.0
+    max_age: float | None = None
+    plan: SpawnPlan | None = None
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "Probe":
+        """
+        Builds a probe from its configuration section.
+
+        Raises:
+            ProbeError: If the keys needed by the kind of probe are missing.
+        """
+        try:
+            kind = ProbeKind(config.get("type"))
+        except ValueError:
+            raise ProbeError(f"Invalid probe type {config.get('type')!r}.")
+        required = {
+            ProbeKind.TCP: "port",
+            ProbeKind.UNIX: "path",
+            ProbeKind.FILE: "path",
+            ProbeKind.EXEC: "command",
+        }[kind]
+        if config.get(required) is None:
+            raise ProbeError(f"{kind.value} probe requires {required}.")
+        options: Dict[str, Any] = {
+            key: config[key]
+            for key in (
+                "port",
+                "host",
+                "path",
+                "command",
+                "interval",
+                "timeout",
+                "max_age",
+            )
+            if config.get(key) is not None
+        }
+        return cls(kind=kind, **options)
+
+    def bind(
+        self,
+        workingdir: str | None = None,
+        env: Dict[str, Any] | None = None,
+        user: str | None = None,
+    ) -> "Probe":
+        """
+        Compiles the command of an exec probe in the context of its service.
+
+        Raises:
+            SpawnPlanError: If the command cannot be spawned.
+        """
+        if self.kind != ProbeKind.EXEC:
+            return self
+        plan = SpawnPlan.compile(
+            cmd=self.command, workingdir=workingdir, env=env, user=user
+        )
+        return replace(self, plan=plan)
+
+    async def check(
+        self, since: float | None = None, timers: TimerWheel | None = None
+    ) -> bool:
+        """
+        Runs the probe once.
+
+        Args:
+            since: For file probes, the time (as returned by time.time) the file
+                must have been modified after.
+            timers: The timer wheel enforcing the timeout.
+
+        Returns:
+            True if the probe passed.
+        """
+        if self.kind == ProbeKind.FILE:
+            return self.check_file(since)
+
+        timers = timers or TimerWheel.current()
+        if self.kind == ProbeKind.EXEC:
+            return await self._exec(timers)
+
+        if self.kind == ProbeKind.TCP:
+            connect = asyncio.open_connection(self.host, self.port)
+        else:
+            connect = asyncio.open_unix_connection(self.path)
+        task = asyncio.ensure_future(connect)
+        try:
+            done = await timers.wait(task, timeout=self.timeout)
+        finally:
+            if not task.done():
+                task.cancel()
+        if not done or task.exception() is not None:
+            return False
+        _, writer = task.result()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    def check_file(self, since: float | None = None) -> bool:
+        """
+        Runs a file probe, which does not need to wait.
+
+        Args:
+            since: The time (as returned by time.time) the file must have been
+                modified after.
+
+        Returns:
+            True if the probe passed.
+        """
+        if self.max_age is not None:
+            since = max(since or 0, time.time() - self.max_age)
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        # Some filesystems only store whole seconds
+        return since is None or mtime >= int(since)
+
+    async def _exec(self, timers: TimerWheel) -> bool:
+        """
+        Spawns the command of the probe and waits at most `timeout` for it.
+        """
+        plan = self.plan
+        try:
+            if plan is None:
+                plan = SpawnPlan.compile(cmd=self.command)
+            child = spawn(plan, subprocess.DEVNULL, subprocess.DEVNULL)
+        except (OSError, SpawnPlanError):
+            return False
+        exit = ChildWatcher.current().watch(child.pid)
+        try:
+            done = await timers.wait(exit, timeout=self.timeout)
+        finally:
+            if not exit.done():
+                # The whole group it leads, a hung check may have forked
+                with contextlib.suppress(ProcessLookupError):
+                    os.killpg(child.pid, signal.SIGKILL)
+                # Reaped before returning, not left behind at every interval
+                await exit
+        if not done:
+            return False
+        child.set_returncode(exit.result())
+        return child.returncode == 0
@@ -0,0 +1,114 @@
+from typing import List
+import ctypes
+import os
+import signal
+
+from .logger import logger
+
+PR_SET_CHILD_SUBREAPER = 36
+
+
+def signal_group(pgid: int, sig: int) -> bool:
+    """
+    Sends a signal to every process of a process group.
+
+    Returns:
+        False if the group has no process left.
+    """
+    try:
+        os.killpg(pgid, sig)
+        return True
+    except ProcessLookupError:
+        return False
+
+
+def group_alive(pgid: int) -> bool:
+    """
+    Checks whether a process group still has processes (zombies included).
+    """
+    return signal_group(pgid, 0)
+
+
+def _in_group(pid: int, pgid: int) -> bool:
+    """
+    Checks whether a process is alive (not a zombie) and in a process group.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as file:
+            stat = file.read()
+    except OSError:
+        return False
+    # The command name may hold spaces, the fields start after it
+    fields = stat[stat.rindex(b")") + 2 :].split()
+    return fields[0] != b"Z" and int(fields[2]) == pgid
+
+
+def group_members(pgid: int) -> List[int]:
+    """
+    Gets the pids of the live (not zombie) processes of a process group.
+
+    Walks /proc, so it is not meant for polling, see `still_in_group`.
+    """
+    return [
+        int(entry)
+        for entry in os.listdir("/proc")
+        if entry.isdigit() and _in_group(int(entry), pgid)
+    ]
+
+
+def still_in_group(pids: List[int], pgid: int) -> List[int]:
+    """
+    Gets the processes of a list still alive in a process group, reading only
+    their own /proc entries.
+    """
+    return [pid for pid in pids if _in_group(pid, pgid)]
+
+
+def kill_group(pgid: int) -> List[int]:
+    """
+    Kills the live processes of a process group.
+
+    Returns:
+        The pids of the processes killed.
+    """
+    members = group_members(pgid)
+    if members:
+        signal_group(pgid, signal.SIGKILL)
+    return members
+
+
+def children(pid: int) -> List[int]:
+    """
+    Gets the children of a process, zombies included, from the children list of
+    each of its threads.
+    """
+    pids: List[int] = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return pids
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as file:
+                pids.extend(int(child) for child in file.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def set_child_subreaper(enabled: bool = True) -> bool:
+    """
+    Makes this process the child subreaper of its descendants: the ones whose
+    parent exits are reparented to it instead of init.
+
+    Returns:
+        False if the kernel does not support it.
+    """
+    try:
+        prctl = ctypes.CDLL(None, use_errno=True).prctl
+        if prctl(PR_SET_CHILD_SUBREAPER, int(enabled), 0, 0, 0) != 0:
+            raise OSError(ctypes.get_errno(), "prctl failed")
+    except (AttributeError, OSError) as e:
+        logger.warning(f"Cannot set the child subreaper attribute: {e}")
+        return False
+    return True
@@ -0,0 +1,185 @@
+from typing import TYPE_CHECKING, Dict, Hashable, Iterable, Iterator, List
+
+from .status import ServiceSummary, StatusModel
+
+if TYPE_CHECKING:
+    from ..service import Service
+
+
+class ServiceRegistry:
+    """
+    The services of a service handler, indexed by name, in configuration order.
+
+    Secondary indexes map each label to its services, and each process state to
+    the services having at least one process in that state. The state index is
+    kept up to date from the transitions the services report, so no lookup needs
+    to walk every service. The same transitions keep the status model up to date.
+    """
+
+    def __init__(self, services: Iterable["Service"] = ()) -> None:
+        self._services: Dict[str, "Service"] = {}
+        self._positions: Dict[str, int] = {}
+        self._labels: Dict[str, Dict[str, None]] = {}
+        # The labels each service is indexed under, to unindex them on change
+        self._labels_of: Dict[str, List[str]] = {}
+        self._states: Dict[Hashable, Dict[str, None]] = {}
+        self._next_position: int = 0
+        self._status = StatusModel(self._summarize)
+        for service in services:
+            self.add(service)
+
+    def __len__(self) -> int:
+        return len(self._services)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._services
+
+    def __iter__(self) -> Iterator["Service"]:
+        return iter(self._services.values())
+
+    def add(self, service: "Service") -> None:
+        """
+        Adds a service after the others, replacing the service with the same name.
+        """
+        name = service.config.name
+        self.remove(name)
+        self._services[name] = service
+        self._positions[name] = self._next_position
+        self._next_position += 1
+        self._index_labels(service)
+        for state in service.state_counts:
+            self._states.setdefault(state, {})[name] = None
+        service.on_state_change = self._on_state_change
+        self._status.add(name, service.state_counts)
+
+    def remove(self, name: str) -> "Service | None":
+        """
+        Removes a service.
+
+        Returns:
+            The removed service, None if there is no service with this name.
+        """
+        service = self._services.pop(name, None)
+        if service is None:
+            return None
+        del self._positions[name]
+        self._unindex_labels(service)
+        for state in service.state_counts:
+            self._discard(self._states, state, name)
+        service.on_state_change = None
+        self._status.remove(name, service.state_counts)
+        return service
+
+    def get(self, name: str) -> "Service | None":
+        """
+        Gets a service by name, None if there is none.
+        """
+        return self._services.get(name)
+
+    def names(self) -> List[str]:
+        """
+        Gets the names of the services, in configuration order.
+        """
+        return list(self._services)
+
+    def select(self, names: Iterable[str]) -> List["Service"]:
+        """
+        Gets the services with the given names, in configuration order.
+        Unknown names are ignored.
+        """
+        return self._ordered(name for name in set(names) if name in self._services)
+
+    def with_label(self, label: str) -> List["Service"]:
+        """
+        Gets the services with the given label, in configuration order.
+        """
+        return self._ordered(self._labels.get(label, ()))
+
+    def in_state(self, state: Hashable) -> List["Service"]:
+        """
+        Gets the services having at least one process in the given state,
+        in configuration order.
+        """
+        return self._ordered(self._states.get(state, ()))
+
+    def reorder(self, names: Iterable[str]) -> None:
+        """
+        Sets the configuration order. Services missing from `names` go last.
+        """
+        order = list(dict.fromkeys(name for name in names if name in self._services))
+        listed = set(order)
+        order += [name for name in self._services if name not in listed]
+        self._services = {name: self._services[name] for name in order}
+        self._positions = {name: position for position, name in enumerate(order)}
+        self._next_position = len(order)
+        self._status.reorder(order)
+
+    def refresh(self, service: "Service") -> None:
+        """
+        Updates the label index and the status after the configuration of a
+        service changed.
+        """
+        self._unindex_labels(service)
+        self._index_labels(service)
+        self._status.touch(service.config.name)
+
+    @property
+    def status(self) -> StatusModel:
+        """
+        Gets the status model of the services.
+        """
+        return self._status
+
+    def clear(self) -> None:
+        """
+        Removes every service.
+        """
+        for name in list(self._services):
+            self.remove(name)
+
+    def _ordered(self, names: Iterable[str]) -> List["Service"]:
+        return [
+            self._services[name]
+            for name in sorted(names, key=self._positions.__getitem__)
+        ]
+
+    def _index_labels(self, service: "Service") -> None:
+        name = service.config.name
+        labels = list(service.config.labels or [])
+        for label in labels:
+            self._labels.setdefault(label, {})[name] = None
+        self._labels_of[name] = labels
+
+    def _unindex_labels(self, service: "Service") -> None:
+        name = service.config.name
+        for label in self._labels_of.pop(name, []):
+            self._discard(self._labels, label, name)
+
+    def _on_state_change(
+        self,
+        service: "Service",
+        previous: Hashable | None,
+        state: Hashable | None,
+    ) -> None:
+        """
+        Called by a service after its state counts changed.
+        """
+        name = service.config.name
+        counts = service.state_counts
+        if previous is not None and previous not in counts:
+            self._discard(self._states, previous, name)
+        if state is not None:
+            self._states.setdefault(state, {})[name] = None
+        self._status.transition(name, previous, state)
+
+    def _summarize(self, name: str) -> ServiceSummary:
+        return self._services[name].summary
+
+    @staticmethod
+    def _discard(index: Dict[Hashable, Dict[str, None]], key: Hashable, name: str):
+        names = index.get(key)
+        if names is None:
+            return
+        names.pop(name, None)
+        if not names:
+            del index[key]
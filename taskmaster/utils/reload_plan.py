@@ -0,0 +1,159 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Mapping, Tuple
+
+# Fields baked into the spawn plan: the processes must be replaced
+RESPAWN_FIELDS = (
+    "cmd",
+    "umask",
+    "workingdir",
+    "user",
+    "env",
+    "rlimits",
+    "nice",
+    "ionice",
+    "cpu_affinity",
+)
+# Fields the running processes inherited: they must be restarted
+RESTART_FIELDS = ("stdout", "stderr")
+# Fields applied by adding or removing processes
+SCALE_FIELDS = ("numprocs",)
+
+
+class Action(Enum):
+    """
+    Enumeration for what a reload does to a service, from the most to the least disruptive.
+
+    Options:
+    - REMOVE: The service is not in the new configuration, delete it.
+    - ADD: The service is new, create it (and autostart it).
+    - RESPAWN: The spawn plan changed, replace the processes.
+    - RESTART: The outputs changed, restart the processes.
+    - SCALE: Only numprocs changed, add or remove processes.
+    - UPDATE: Apply the new settings in place, processes are untouched.
+    - NONE: Nothing changed.
+    """
+
+    REMOVE = "remove"
+    ADD = "add"
+    RESPAWN = "respawn"
+    RESTART = "restart"
+    SCALE = "scale"
+    UPDATE = "update"
+    NONE = "none"
+
+
+@dataclass(frozen=True)
+class ServiceDiff:
+    """
+    The changes of one service between two configurations.
+
+    Attributes:
+        name: The name of the service.
+        action: The most disruptive action the changes need.
+        fields: The names of the changed keys.
+        numprocs: The old and new numprocs, if it changed.
+    """
+
+    name: str
+    action: Action
+    fields: Tuple[str, ...] = ()
+    numprocs: Tuple[int, int] | None = None
+
+    @classmethod
+    def compute(cls, old: Mapping[str, Any], new: Mapping[str, Any]) -> "ServiceDiff":
+        """
+        Compares two configurations of the same service.
+
+        Keys are compared by value, so unchanged output paths or env dicts are never
+        mistaken for changes. Missing keys, None and empty lists or dicts are equal.
+        """
+        keys = [key for key in {**old, **new} if key != "name"]
+        fields = tuple(
+            key for key in keys if _normalize(old.get(key)) != _normalize(new.get(key))
+        )
+        numprocs = None
+        if "numprocs" in fields:
+            numprocs = (old.get("numprocs"), new.get("numprocs"))
+
+        if any(field in RESPAWN_FIELDS for field in fields):
+            action = Action.RESPAWN
+        elif any(field in RESTART_FIELDS for field in fields):
+            action = Action.RESTART
+        elif any(field in SCALE_FIELDS for field in fields):
+            action = Action.SCALE
+        elif fields:
+            action = Action.UPDATE
+        else:
+            action = Action.NONE
+        return cls(name=new["name"], action=action, fields=fields, numprocs=numprocs)
+
+    def __str__(self) -> str:
+        line = f"{self.name}: {self.action.value}"
+        details = [field for field in self.fields if field != "numprocs"]
+        if self.numprocs is not None:
+            details.append(f"numprocs {self.numprocs[0]} -> {self.numprocs[1]}")
+        if details:
+            line += f" ({', '.join(details)})"
+        return line
+
+
+@dataclass(frozen=True)
+class ReloadPlan:
+    """
+    What a reload does to every service, in the order of the new configuration
+    (removed services last).
+
+    Attributes:
+        diffs: The diff of every service.
+    """
+
+    diffs: Tuple[ServiceDiff, ...]
+
+    @classmethod
+    def compute(
+        cls,
+        old: Iterable[Mapping[str, Any]],
+        new: Iterable[Mapping[str, Any]],
+    ) -> "ReloadPlan":
+        """
+        Compares two lists of service configurations, matching services by name.
+
+        Args:
+            old: The configurations currently applied.
+            new: The configurations to apply.
+        """
+        previous: Dict[str, Mapping[str, Any]] = {
+            service["name"]: service for service in old
+        }
+        diffs: List[ServiceDiff] = []
+        for service in new:
+            before = previous.pop(service["name"], None)
+            if before is None:
+                diffs.append(ServiceDiff(name=service["name"], action=Action.ADD))
+            else:
+                diffs.append(ServiceDiff.compute(before, service))
+        for name in previous:
+            diffs.append(ServiceDiff(name=name, action=Action.REMOVE))
+        return cls(diffs=tuple(diffs))
+
+    @property
+    def changes(self) -> List[ServiceDiff]:
+        """
+        Gets the diffs of the services that need something done.
+        """
+        return [diff for diff in self.diffs if diff.action != Action.NONE]
+
+    def __str__(self) -> str:
+        changes = self.changes
+        if not changes:
+            return "Reload plan: nothing to do."
+        lines = [f"Reload plan: {len(changes)} of {len(self.diffs)} services change."]
+        lines += [f"  {diff}" for diff in changes]
+        return "\n".join(lines)
+
+
+def _normalize(value: Any) -> Any:
+    if value == {} or value == []:
+        return None
+    return value
@@ -0,0 +1,414 @@
+from array import array
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+import asyncio
+import os
+import resource
+import time
+
+from .cgroups import ServiceCgroup
+from .events import Event, EventBus, EventKind
+from .logger import logger
+from .sizes import format_size
+from .timer_wheel import TimerWheel
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+# The events after which a process is gone
+GONE = (EventKind.EXITED, EventKind.FATAL, EventKind.STOPPED, EventKind.BACKOFF)
+# The processes sampled per iteration of the event loop
+CHUNK = 256
+
+
+@dataclass(frozen=True)
+class Resources:
+    """
+    The resources used by a process, or summed over the processes of a service.
+
+    Attributes:
+        cpu_percent: The CPU used since the previous sample, 100 for one core.
+        rss: The resident memory, in bytes.
+        fds: The number of open file descriptors.
+        threads: The number of threads.
+        processes: The number of processes sampled.
+    """
+
+    cpu_percent: float = 0
+    rss: int = 0
+    fds: int = 0
+    threads: int = 0
+    processes: int = 0
+
+
+class ResourceSampler:
+    """
+    Samples the CPU, memory, file descriptors and threads of every tracked process
+    in one pass every `interval` seconds, from /proc.
+
+    The samples live in compact arrays, one slot per process (a removed process
+    takes the last slot, so they stay dense), and the per-service sums are
+    computed once per pass. The /proc files of the first `max_open` processes are
+    kept open and read with pread, saving an open and a close per file per pass.
+
+    A scheduled pass samples a chunk of processes per iteration of the event
+    loop. Nothing runs while no process is tracked. Listeners are called after
+    each pass.
+
+    The usage of a service with a cgroup is read from the cgroup instead, a few
+    files whatever its number of processes: its processes are not tracked from
+    the lifecycle events (file descriptors are then only counted for the ones
+    tracked explicitly, such as by the resource guard).
+
+    Args:
+        interval: The seconds between two passes.
+        timers: The timer wheel scheduling the passes.
+        max_open: The number of processes whose /proc files are kept open
+            (two descriptors each). Defaults to using at most an eighth of the
+            descriptor limit.
+        fds: Whether to count the file descriptors (a directory listing per process).
+    """
+
+    def __init__(
+        self,
+        interval: float = 5,
+        timers: TimerWheel | None = None,
+        max_open: int | None = None,
+        fds: bool = True,
+    ) -> None:
+        self._interval = interval
+        self._timers = timers
+        if max_open is None:
+            max_open = resource.getrlimit(resource.RLIMIT_NOFILE)[0] // 16
+        self._max_open = max_open
+        self._count_fds = fds
+        self._timer: TimerWheel.Timer | None = None
+        self._listeners: List[Callable[["ResourceSampler"], Any]] = []
+        self._events: EventBus | None = None
+        self.version: int = 0
+        self._last_pass: float | None = None
+        self._per_tick: float = 0
+        self._elapsed: float = 0
+        # Service name -> its cgroup, and the CPU time it had used at the last pass
+        self._cgroups: Dict[str, ServiceCgroup] = {}
+        self._cgroup_usec: Dict[str, int] = {}
+        self._sampling: bool = False
+
+        # pid -> slot
+        self._slots: Dict[int, int] = {}
+        # Service name <-> id
+        self._service_ids: Dict[str, int] = {}
+        self._service_names: List[str] = []
+        # One entry per slot
+        self._pids = array("i")
+        self._service = array("i")
+        self._stat_fds: List[int] = []
+        self._statm_fds: List[int] = []
+        self._ticks = array("q")
+        self._cpu = array("d")
+        self._rss = array("q")
+        self._fds = array("i")
+        self._threads = array("i")
+        self._opened: int = 0
+        # Service name -> its processes summed, at the last pass
+        self._totals: Dict[str, Resources] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self._slots
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    @property
+    def timers(self) -> TimerWheel:
+        if self._timers is None:
+            self._timers = TimerWheel.current()
+        return self._timers
+
+    def attach(self, events: EventBus) -> None:
+        """
+        Tracks the processes spawned and gone, from the lifecycle events.
+        """
+        self._events = events
+        events.listen(self._on_event)
+
+    def listen(self, listener: Callable[["ResourceSampler"], Any]) -> None:
+        """
+        Calls a function with the sampler after each pass.
+        """
+        self._listeners.append(listener)
+
+    def unlisten(self, listener: Callable[["ResourceSampler"], Any]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def add_cgroup(self, service: str, cgroup: ServiceCgroup) -> None:
+        """
+        Reads the usage of a service from its cgroup, instead of sampling each of
+        its processes.
+        """
+        self._cgroups[service] = cgroup
+        self._cgroup_usec[service] = cgroup.usage().cpu_usec
+        self._schedule()
+
+    def remove_cgroup(self, service: str) -> None:
+        self._cgroups.pop(service, None)
+        self._cgroup_usec.pop(service, None)
+        self._totals.pop(service, None)
+        if not self._slots and not self._cgroups:
+            self._unschedule()
+
+    def _on_event(self, event: Event) -> None:
+        if event.pid is None or event.service in self._cgroups:
+            return
+        if event.kind in (EventKind.SPAWNED, EventKind.RUNNING):
+            if event.pid not in self._slots:
+                self.track(event.pid, event.service)
+        elif event.kind in GONE:
+            self.untrack(event.pid)
+
+    def track(self, pid: int, service: str) -> None:
+        """
+        Starts sampling a process.
+
+        Args:
+            pid: The pid of the process.
+            service: The name of its service.
+        """
+        if pid in self._slots:
+            self.untrack(pid)
+        service_id = self._service_ids.get(service)
+        if service_id is None:
+            service_id = self._service_ids[service] = len(self._service_names)
+            self._service_names.append(service)
+        stat, statm = -1, -1
+        if self._opened < self._max_open:
+            try:
+                stat = os.open(f"/proc/{pid}/stat", os.O_RDONLY | os.O_CLOEXEC)
+                statm = os.open(f"/proc/{pid}/statm", os.O_RDONLY | os.O_CLOEXEC)
+                self._opened += 1
+            except OSError:
+                if stat >= 0:
+                    os.close(stat)
+                stat, statm = -1, -1
+        self._slots[pid] = len(self._pids)
+        self._pids.append(pid)
+        self._service.append(service_id)
+        self._stat_fds.append(stat)
+        self._statm_fds.append(statm)
+        self._ticks.append(-1)
+        self._cpu.append(0)
+        self._rss.append(0)
+        self._fds.append(0)
+        self._threads.append(0)
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._timer is None and not self._sampling and self._interval > 0:
+            self._timer = self.timers.call_later(self._interval, self._on_due)
+
+    def _unschedule(self) -> None:
+        if self._timer is not None:
+            self.timers.cancel(self._timer)
+            self._timer = None
+
+    def untrack(self, pid: int) -> None:
+        """
+        Stops sampling a process. Untracking an unknown pid does nothing.
+        """
+        slot = self._slots.pop(pid, None)
+        if slot is None:
+            return
+        if self._stat_fds[slot] >= 0:
+            os.close(self._stat_fds[slot])
+            os.close(self._statm_fds[slot])
+            self._opened -= 1
+        last = len(self._pids) - 1
+        if slot != last:
+            # Move the last process to the free slot
+            for column in self._columns():
+                column[slot] = column[last]
+            self._slots[self._pids[slot]] = slot
+        for column in self._columns():
+            column.pop()
+        if not self._slots and not self._cgroups:
+            self._unschedule()
+
+    def _columns(self) -> List[Any]:
+        return [
+            self._pids,
+            self._service,
+            self._stat_fds,
+            self._statm_fds,
+            self._ticks,
+            self._cpu,
+            self._rss,
+            self._fds,
+            self._threads,
+        ]
+
+    def _on_due(self) -> None:
+        """
+        Runs a pass, `CHUNK` processes per iteration of the event loop so that a
+        pass over thousands of processes does not stall it.
+        """
+        self._timer = None
+        self._sampling = True
+        self._begin()
+        self._continue(0)
+
+    def _continue(self, start: int) -> None:
+        end = min(start + CHUNK, len(self._pids))
+        try:
+            self._sample_slots(start, end)
+        except Exception as e:
+            logger.error(f"Resource sampling failed: {e}")
+        if end < len(self._pids):
+            asyncio.get_running_loop().call_soon(self._continue, end)
+            return
+        self._sampling = False
+        self._finish()
+        if self._slots or self._cgroups:
+            self._schedule()
+
+    @staticmethod
+    def _read(fd: int, path: str) -> bytes:
+        if fd >= 0:
+            return os.pread(fd, 1024, 0)
+        with open(path, "rb", buffering=0) as file:
+            return file.read(1024)
+
+    def sample(self) -> None:
+        """
+        Samples every tracked process at once, then sums them per service and
+        calls the listeners.
+        """
+        self._begin()
+        self._sample_slots(0, len(self._pids))
+        self._finish()
+
+    def _begin(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_pass if self._last_pass is not None else 0
+        self._last_pass = now
+        self._elapsed = elapsed
+        self._per_tick = 100 / (elapsed * CLOCK_TICKS) if elapsed > 0 else 0
+
+    def _sample_slots(self, start: int, end: int) -> None:
+        per_tick = self._per_tick
+        pids, ticks, cpu = self._pids, self._ticks, self._cpu
+        rss, fds, threads = self._rss, self._fds, self._threads
+        stat_fds, statm_fds = self._stat_fds, self._statm_fds
+        for slot in range(start, end):
+            pid = pids[slot]
+            try:
+                stat = self._read(stat_fds[slot], f"/proc/{pid}/stat")
+                statm = self._read(statm_fds[slot], f"/proc/{pid}/statm")
+                if self._count_fds:
+                    fds[slot] = len(os.listdir(f"/proc/{pid}/fd"))
+            except OSError:
+                # Gone, until its exit is reported
+                cpu[slot] = 0
+                continue
+            # The command name may hold spaces, the fields start after it
+            fields = stat[stat.rindex(b")") + 2 :].split()
+            total = int(fields[11]) + int(fields[12])
+            previous = ticks[slot]
+            cpu[slot] = (total - previous) * per_tick if previous >= 0 else 0
+            ticks[slot] = total
+            threads[slot] = int(fields[17])
+            rss[slot] = int(statm.split()[1]) * PAGE_SIZE
+
+    def _finish(self) -> None:
+        self._aggregate()
+        self.version += 1
+        for listener in list(self._listeners):
+            try:
+                listener(self)
+            except Exception as e:
+                logger.error(f"Resource listener failed: {e}")
+
+    def _aggregate(self) -> None:
+        count = len(self._service_names)
+        cpu, rss = array("d", bytes(8 * count)), array("q", bytes(8 * count))
+        fds, threads = array("q", bytes(8 * count)), array("q", bytes(8 * count))
+        processes = array("q", bytes(8 * count))
+        service = self._service
+        for slot in range(len(service)):
+            index = service[slot]
+            cpu[index] += self._cpu[slot]
+            rss[index] += self._rss[slot]
+            fds[index] += self._fds[slot]
+            threads[index] += self._threads[slot]
+            processes[index] += 1
+        self._totals = {
+            name: Resources(
+                cpu_percent=cpu[index],
+                rss=rss[index],
+                fds=fds[index],
+                threads=threads[index],
+                processes=processes[index],
+            )
+            for index, name in enumerate(self._service_names)
+            if processes[index] and name not in self._cgroups
+        }
+        for name, cgroup in self._cgroups.items():
+            try:
+                usage = cgroup.usage()
+            except (OSError, ValueError) as e:
+                logger.error(f"Reading the usage of {cgroup} failed: {e}")
+                continue
+            used = usage.cpu_usec - self._cgroup_usec.get(name, usage.cpu_usec)
+            self._cgroup_usec[name] = usage.cpu_usec
+            # The processes tracked explicitly, for what the group does not account
+            index = self._service_ids.get(name)
+            tracked = index is not None and processes[index] > 0
+            self._totals[name] = Resources(
+                cpu_percent=(used / 10000 / self._elapsed if self._elapsed > 0 else 0),
+                rss=usage.memory or (rss[index] if tracked else 0),
+                fds=fds[index] if tracked else 0,
+                threads=usage.tasks or (threads[index] if tracked else 0),
+                processes=usage.processes,
+            )
+
+    def process(self, pid: int) -> Resources | None:
+        """
+        Gets the last sample of a process, None if it is not tracked.
+        """
+        slot = self._slots.get(pid)
+        if slot is None:
+            return None
+        return Resources(
+            cpu_percent=self._cpu[slot],
+            rss=self._rss[slot],
+            fds=self._fds[slot],
+            threads=self._threads[slot],
+            processes=1,
+        )
+
+    def service(self, name: str) -> Resources:
+        """
+        Gets the resources of a service, summed over its processes at the last pass.
+        """
+        return self._totals.get(name, Resources())
+
+    def services(self) -> Dict[str, Resources]:
+        """
+        Gets the resources of every service with sampled processes.
+        """
+        return dict(self._totals)
+
+    def close(self) -> None:
+        """
+        Stops sampling and closes the /proc files.
+        """
+        self._cgroups.clear()
+        self._cgroup_usec.clear()
+        if self._events is not None:
+            self._events.unlisten(self._on_event)
+            self._events = None
+        for pid in list(self._slots):
+            self.untrack(pid)
@@ -0,0 +1,51 @@
+from typing import Dict
+
+from .timer_wheel import TimerWheel
+from .token_bucket import TokenBucket, TokenQueue
+
+
+class RestartBudget:
+    """
+    Supervisor-wide budget of restarts, so that services crashing together
+    (a shared dependency going down) do not all restart at once.
+
+    Every restart takes a token from a bucket refilled at `rate` per second,
+    holding at most `burst`. Restarts over budget are queued and served by
+    priority, lowest first, then in arrival order, as tokens come back.
+
+    Args:
+        rate: The number of restarts per second.
+        burst: The maximum burst of restarts. Default is `rate`, at least 1.
+        timers: The timer wheel used to wait for tokens.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int | None = None,
+        timers: TimerWheel | None = None,
+    ) -> None:
+        self._bucket = TokenBucket(rate, burst)
+        self._queue = TokenQueue(self._bucket, timers, label="Restart budget")
+        # Service name -> restarts that had to wait for a token
+        self.throttled: Dict[str, int] = {}
+
+    @property
+    def waiting(self) -> int:
+        """
+        Gets the number of restarts queued for a token.
+        """
+        return self._queue.waiting
+
+    async def acquire(self, name: str, priority: int = 999) -> None:
+        """
+        Waits for a restart token.
+
+        Args:
+            name: The name of the service restarting a process.
+            priority: The priority of the service, lower is served first.
+        """
+        if not self._queue and not self._bucket.take():
+            return
+        self.throttled[name] = self.throttled.get(name, 0) + 1
+        await self._queue.wait(priority)
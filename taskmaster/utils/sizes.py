@@ -0,0 +1,30 @@
+import re
+
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(size: int | str) -> int:
+    """
+    Parses a size in bytes, an integer or a string with a K, M, G or T suffix
+    (powers of 1024), such as "512M".
+
+    Raises:
+        ValueError: If the size is invalid.
+    """
+    if isinstance(size, int):
+        return size
+    match = re.fullmatch(r"([0-9]+(?:\.[0-9]+)?)([KMGT]?)", str(size).strip().upper())
+    if match is None:
+        raise ValueError(f"Invalid size {size!r}.")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def format_size(size: float) -> str:
+    """
+    Formats a size in bytes for humans, such as 12.3M.
+    """
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024 or unit == "G":
+            break
+        size /= 1024
+    return f"{size:.0f}B" if unit == "B" else f"{size:.1f}{unit}"
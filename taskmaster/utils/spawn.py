@@ -0,0 +1,524 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from io import TextIOWrapper
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Tuple
+import ctypes
+import os
+import platform
+import pwd
+import resource
+import shlex
+import shutil
+import signal
+import subprocess
+
+from .sizes import parse_size
+from .logger import logger
+
+# The resource limits that can be configured, by configuration key
+RLIMITS = {
+    "nofile": resource.RLIMIT_NOFILE,
+    "as": resource.RLIMIT_AS,
+    "nproc": resource.RLIMIT_NPROC,
+    "core": resource.RLIMIT_CORE,
+}
+# The I/O scheduling classes, see ioprio_set(2)
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+# The number of the ioprio_set system call, which Python does not wrap
+SYS_IOPRIO_SET = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "riscv64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+    "s390x": 282,
+}.get(platform.machine())
+# CPU affinity pinning process i of a service to the i-th available CPU, modulo
+SPREAD = "spread"
+
+
+class SpawnPlanError(ValueError):
+    """
+    Raised when a service configuration cannot be turned into a spawn plan.
+    """
+
+
+@dataclass(frozen=True)
+class SpawnPlan:
+    """
+    Everything needed to spawn a process of a service, resolved once per config load.
+
+    Attributes:
+        argv: The shlex-parsed command line.
+        executable: The absolute path of the executable.
+        cwd: The absolute working directory, if any.
+        env: The environment of the supervisor merged with the service env.
+        umask: The umask of the process.
+        user: The user to run the process as, if any.
+        uid: The uid of `user`, None if no privilege change is needed.
+        gid: The primary gid of `user`, None if no privilege change is needed.
+        groups: The supplementary groups of `user`, None if no privilege change is needed.
+        rlimits: The (resource, soft, hard) limits to set.
+        nice: The niceness of the process, None to inherit it.
+        ioprio: The I/O priority of the process (class and level, encoded), None
+            to inherit it.
+        cpus: The CPUs the process may run on, None to inherit them.
+        spread: Whether each process is pinned to one of `cpus` by its index instead.
+        cgroup: The cgroup.procs file of the cgroup to place the process in, if any.
+    """
+
+    argv: Tuple[str, ...]
+    executable: str
+    cwd: str | None = None
+    env: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    umask: int = 0
+    user: str | None = None
+    uid: int | None = None
+    gid: int | None = None
+    groups: Tuple[int, ...] | None = None
+    rlimits: Tuple[Tuple[int, int, int], ...] = ()
+    nice: int | None = None
+    ioprio: int | None = None
+    cpus: Tuple[int, ...] | None = None
+    spread: bool = False
+    cgroup: str | None = None
+
+    @classmethod
+    def compile(
+        cls,
+        cmd: str | None,
+        umask: int | None = None,
+        workingdir: str | None = None,
+        user: str | None = None,
+        env: Dict[str, Any] | None = None,
+        rlimits: Dict[str, Any] | None = None,
+        nice: int | None = None,
+        ionice: Dict[str, Any] | None = None,
+        cpu_affinity: List[int] | str | None = None,
+        cgroup: str | None = None,
+    ) -> "SpawnPlan":
+        """
+        Builds a spawn plan from the configuration of a service.
+
+        Args:
+            cmd: The command line.
+            umask: The umask of the process.
+            workingdir: The working directory of the process.
+            user: The user to run the process as.
+            env: The additional environment variables.
+            rlimits: The resource limits, by name (nofile, as, nproc, core): a
+                value for both the soft and hard limits, or a dict of both.
+            nice: The niceness of the process, from -20 to 19.
+            ionice: The I/O scheduling class and level of the process.
+            cpu_affinity: The CPUs the process may run on, or "spread".
+            cgroup: The cgroup.procs file of the cgroup of the process.
+
+        Raises:
+            SpawnPlanError: If the command, the working directory, the user or
+                a resource setting is invalid.
+        """
+        if not cmd:
+            raise SpawnPlanError("Command is not provided.")
+        try:
+            argv = tuple(shlex.split(cmd))
+        except ValueError as e:
+            raise SpawnPlanError(f"Invalid command {cmd!r}: {e}")
+        if not argv:
+            raise SpawnPlanError("Command is empty.")
+
+        if umask is None:
+            umask = 0
+        if type(umask) is not int or not 0 <= umask <= 0o777:
+            raise SpawnPlanError(f"Invalid umask {umask!r}.")
+
+        cwd = None
+        if workingdir:
+            cwd = os.path.abspath(workingdir)
+            if not os.path.isdir(cwd):
+                raise SpawnPlanError(f"Working directory {workingdir} does not exist.")
+
+        merged_env = dict(os.environ)
+        merged_env.update({str(key): str(value) for key, value in (env or {}).items()})
+
+        executable = cls._resolve_executable(argv[0], cwd, merged_env)
+
+        uid = gid = groups = None
+        if user:
+            try:
+                entry = pwd.getpwnam(user)
+            except KeyError:
+                raise SpawnPlanError(f"Unknown user {user}.")
+            if entry.pw_uid != os.geteuid():
+                uid = entry.pw_uid
+                gid = entry.pw_gid
+                groups = tuple(os.getgrouplist(user, entry.pw_gid))
+
+        cpus, spread = cls._resolve_affinity(cpu_affinity)
+        return cls(
+            argv=argv,
+            executable=executable,
+            cwd=cwd,
+            env=MappingProxyType(merged_env),
+            umask=umask,
+            user=user,
+            uid=uid,
+            gid=gid,
+            groups=groups,
+            rlimits=cls._resolve_rlimits(rlimits or {}),
+            nice=cls._resolve_nice(nice),
+            ioprio=cls._resolve_ioprio(ionice),
+            cpus=cpus,
+            spread=spread,
+            cgroup=cgroup,
+        )
+
+    @property
+    def has_resources(self) -> bool:
+        """
+        Whether the plan sets resource limits, priorities, an affinity or a cgroup,
+        which must be applied in the child before exec.
+        """
+        return (
+            self.cgroup is not None
+            or bool(self.rlimits)
+            or self.nice is not None
+            or self.ioprio is not None
+            or self.cpus is not None
+        )
+
+    def cpus_of(self, index: int) -> Tuple[int, ...] | None:
+        """
+        Gets the CPUs the process of a service with the given index may run on.
+        """
+        if self.spread and self.cpus:
+            return (self.cpus[index % len(self.cpus)],)
+        return self.cpus
+
+    @staticmethod
+    def _resolve_rlimits(rlimits: Dict[str, Any]) -> Tuple[Tuple[int, int, int], ...]:
+        def value(limit: Any) -> int:
+            if limit == "unlimited":
+                return resource.RLIM_INFINITY
+            try:
+                return parse_size(limit)
+            except ValueError as e:
+                raise SpawnPlanError(f"Invalid resource limit: {e}")
+
+        resolved = []
+        for name, limit in rlimits.items():
+            if name not in RLIMITS:
+                raise SpawnPlanError(f"Unknown resource limit {name}.")
+            if isinstance(limit, Mapping):
+                soft, hard = value(limit["soft"]), value(limit["hard"])
+            else:
+                soft = hard = value(limit)
+            infinity = resource.RLIM_INFINITY
+            if hard != infinity and (soft == infinity or soft > hard):
+                raise SpawnPlanError(
+                    f"Resource limit {name}: the soft limit is over the hard one."
+                )
+            resolved.append((RLIMITS[name], soft, hard))
+        return tuple(resolved)
+
+    @staticmethod
+    def _resolve_nice(nice: int | None) -> int | None:
+        if nice is not None and (type(nice) is not int or not -20 <= nice <= 19):
+            raise SpawnPlanError(f"Invalid nice {nice!r}, from -20 to 19.")
+        return nice
+
+    @staticmethod
+    def _resolve_ioprio(ionice: Dict[str, Any] | None) -> int | None:
+        if not ionice:
+            return None
+        ioclass = IOPRIO_CLASSES.get(ionice.get("class"))
+        if ioclass is None:
+            raise SpawnPlanError(f"Invalid ionice class {ionice.get('class')!r}.")
+        level = ionice.get("level", 4)
+        if type(level) is not int or not 0 <= level <= 7:
+            raise SpawnPlanError(f"Invalid ionice level {level!r}, from 0 to 7.")
+        if SYS_IOPRIO_SET is None:
+            raise SpawnPlanError(f"ionice is not supported on {platform.machine()}.")
+        return ioclass << IOPRIO_CLASS_SHIFT | level
+
+    @staticmethod
+    def _resolve_affinity(
+        cpu_affinity: List[int] | str | None,
+    ) -> Tuple[Tuple[int, ...] | None, bool]:
+        if cpu_affinity is None:
+            return None, False
+        available = sorted(os.sched_getaffinity(0))
+        if cpu_affinity == SPREAD:
+            return tuple(available), True
+        if isinstance(cpu_affinity, str) or not cpu_affinity:
+            raise SpawnPlanError(f"Invalid CPU affinity {cpu_affinity!r}.")
+        for cpu in cpu_affinity:
+            if cpu not in available:
+                raise SpawnPlanError(f"CPU {cpu} is not available.")
+        return tuple(sorted(set(cpu_affinity))), False
+
+    @staticmethod
+    def _resolve_executable(name: str, cwd: str | None, env: Dict[str, str]) -> str:
+        """
+        Resolves the executable like execvpe would, relative to the working directory.
+        """
+        if os.sep in name:
+            path = os.path.normpath(os.path.join(cwd or os.getcwd(), name))
+            if not os.path.isfile(path):
+                raise SpawnPlanError(f"Command {name} not found.")
+        else:
+            path = shutil.which(name, path=env.get("PATH", os.defpath))
+            if path is None:
+                raise SpawnPlanError(f"Command {name} not found in PATH.")
+            path = os.path.abspath(path)
+        if not os.access(path, os.X_OK):
+            raise SpawnPlanError(f"Command {name} is not executable.")
+        return path
+
+
+class SpawnBackend(Enum):
+    """
+    Enumeration for spawn backends.
+
+    Options:
+    - FAST: posix_spawn when the plan allows it, otherwise subprocess, which
+      uses vfork when it can.
+    - FORK: Always fork then exec.
+    """
+
+    FAST = "fast"
+    FORK = "fork"
+
+
+class SpawnPath(Enum):
+    """
+    The way a process was actually spawned.
+
+    Options:
+    - POSIX_SPAWN: posix_spawn.
+    - FORK_EXEC: subprocess, which picked vfork or fork, it does not tell which.
+    - FORK: subprocess, with a setup in the child or privileges to drop, which
+      rule vfork out.
+    """
+
+    POSIX_SPAWN = "posix_spawn"
+    FORK_EXEC = "fork_exec"
+    FORK = "fork"
+
+
+class ChildProcess:
+    """
+    A handle on a spawned child.
+
+    Attributes:
+        pid: The pid of the child.
+        path: The way the child was spawned.
+        returncode: The return code once the child has been reaped, None before.
+    """
+
+    __slots__ = ("pid", "path", "returncode", "_popen")
+
+    def __init__(
+        self, pid: int, path: SpawnPath, popen: subprocess.Popen | None = None
+    ) -> None:
+        self.pid = pid
+        self.path = path
+        self.returncode: int | None = None
+        self._popen = popen
+
+    def set_returncode(self, returncode: int) -> None:
+        """
+        Records the return code once the child has been reaped elsewhere.
+        """
+        self.returncode = returncode
+        if self._popen is not None:
+            # Keeps Popen from polling (and warning about) a child it did not reap.
+            self._popen.returncode = returncode
+
+
+Output = int | TextIOWrapper | None
+
+_umask: int | None = None
+
+
+def _current_umask() -> int:
+    global _umask
+    if _umask is None:
+        _umask = os.umask(0)
+        os.umask(_umask)
+    return _umask
+
+
+def can_posix_spawn(plan: SpawnPlan) -> bool:
+    """
+    Checks whether a plan can be spawned with posix_spawn.
+
+    posix_spawn cannot change the working directory, the umask or the user,
+    so they must already match the ones of taskmaster, nor apply resource settings.
+    """
+    return (
+        hasattr(os, "posix_spawn")
+        and plan.uid is None
+        and not plan.has_resources
+        and plan.umask == _current_umask()
+        and (plan.cwd is None or plan.cwd == os.getcwd())
+    )
+
+
+def _file_actions(stdout: Output, stderr: Output) -> List[tuple]:
+    actions: List[tuple] = []
+    for output, target in ((stdout, 1), (stderr, 2)):
+        if output is None:
+            continue
+        if output == subprocess.DEVNULL:
+            actions.append((os.POSIX_SPAWN_OPEN, target, os.devnull, os.O_WRONLY, 0))
+        elif isinstance(output, int):
+            actions.append((os.POSIX_SPAWN_DUP2, output, target))
+        else:
+            actions.append((os.POSIX_SPAWN_DUP2, output.fileno(), target))
+    return actions
+
+
+_syscall: Callable[..., int] | None = None
+
+
+def _child_setup(plan: SpawnPlan, index: int) -> Callable[[], None]:
+    """
+    Builds the function applying the resource settings of a plan in the child,
+    between fork and exec.
+
+    Privileges are dropped after, so that a lower niceness or a higher hard
+    limit can still be set when running as root.
+
+    Args:
+        plan: The spawn plan.
+        index: The index of the process in its service, for the spread affinity.
+    """
+    global _syscall
+    if plan.ioprio is not None and _syscall is None:
+        # Resolved in the parent, the child should not load libraries
+        _syscall = ctypes.CDLL(None, use_errno=True).syscall
+    syscall = _syscall
+    cpus = plan.cpus_of(index)
+
+    def setup() -> None:
+        if plan.cgroup is not None:
+            # Before anything else, so that everything it forks is accounted
+            fd = os.open(plan.cgroup, os.O_WRONLY)
+            try:
+                os.write(fd, b"0")
+            finally:
+                os.close(fd)
+        for limit, soft, hard in plan.rlimits:
+            resource.setrlimit(limit, (soft, hard))
+        if plan.nice is not None:
+            os.setpriority(os.PRIO_PROCESS, 0, plan.nice)
+        if plan.ioprio is not None:
+            if syscall(SYS_IOPRIO_SET, IOPRIO_WHO_PROCESS, 0, plan.ioprio) != 0:
+                raise OSError(ctypes.get_errno(), "ioprio_set failed")
+        if cpus is not None:
+            os.sched_setaffinity(0, cpus)
+        if plan.uid is not None:
+            os.setgroups(list(plan.groups or ()))
+            os.setgid(plan.gid)
+            os.setuid(plan.uid)
+
+    return setup
+
+
+def _fork_only() -> None:
+    """
+    Does nothing in the child, but giving subprocess a `preexec_fn` is what
+    keeps it from using vfork.
+    """
+
+
+def spawn(
+    plan: SpawnPlan,
+    stdout: Output = subprocess.DEVNULL,
+    stderr: Output = subprocess.DEVNULL,
+    backend: SpawnBackend = SpawnBackend.FAST,
+    index: int = 0,
+) -> ChildProcess:
+    """
+    Spawns a process from its plan.
+
+    With the fast backend, posix_spawn is used when the plan allows it. Otherwise
+    subprocess is used, which relies on vfork when it can, that is unless
+    privileges must be dropped or resource settings applied in the child.
+    Features that need a full fork fall back to it transparently.
+
+    Each child leads a new session, hence a new process group whose id is its
+    pid, so that the processes it forks can be signaled along with it.
+
+    The child is not reaped, see ChildWatcher.
+
+    Args:
+        plan: The spawn plan.
+        stdout: Where to redirect the standard output.
+        stderr: Where to redirect the standard error.
+        backend: The spawn backend.
+        index: The index of the process in its service.
+
+    Returns:
+        The handle on the child, telling which path was taken.
+    """
+    if backend == SpawnBackend.FAST and can_posix_spawn(plan):
+        pid = os.posix_spawn(
+            plan.executable,
+            plan.argv,
+            plan.env,
+            file_actions=_file_actions(stdout, stderr),
+            setsigdef=(signal.SIGPIPE, signal.SIGXFSZ),
+            setsid=True,
+        )
+        child = ChildProcess(pid, SpawnPath.POSIX_SPAWN)
+    else:
+        child = _popen(plan, stdout, stderr, backend, index)
+    logger.debug(
+        f"Spawned {plan.argv[0]} with pid {child.pid} using {child.path.value}."
+    )
+    return child
+
+
+def _popen(
+    plan: SpawnPlan,
+    stdout: Output,
+    stderr: Output,
+    backend: SpawnBackend,
+    index: int = 0,
+) -> ChildProcess:
+    """
+    Spawns a process with subprocess, which may use vfork unless given a
+    `preexec_fn` or privileges to drop. The fork backend gives it one that does
+    nothing, instead of changing how subprocess works for the whole process.
+    """
+    # The child setup drops the privileges itself, after the resource settings
+    privileges: Dict[str, Any] = dict(
+        user=plan.uid, group=plan.gid, extra_groups=plan.groups
+    )
+    setup: Callable[[], None] | None = None
+    if plan.has_resources:
+        setup = _child_setup(plan, index)
+        privileges = {}
+    elif backend == SpawnBackend.FORK:
+        setup = _fork_only
+    popen = subprocess.Popen(
+        plan.argv,
+        executable=plan.executable,
+        cwd=plan.cwd,
+        env=plan.env,
+        stdout=stdout,
+        stderr=stderr,
+        umask=plan.umask,
+        preexec_fn=setup,
+        start_new_session=True,
+        **privileges,
+    )
+    forked = setup is not None or plan.uid is not None
+    path = SpawnPath.FORK if forked else SpawnPath.FORK_EXEC
+    return ChildProcess(popen.pid, path, popen)
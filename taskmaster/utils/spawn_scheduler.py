@@ -0,0 +1,102 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from .timer_wheel import TimerWheel
+from .token_bucket import TokenBucket, TokenQueue
+
+
+class SpawnScheduler:
+    """
+    Global admission control for process starts.
+
+    A start holds a slot from the moment it is spawned until it is RUNNING or has
+    failed. At most `max_concurrent` slots are handed out at once, at most `rate`
+    per second (with bursts of `burst`). Waiting starts are served by priority,
+    lowest first, then in arrival order.
+
+    Without limits, slots are granted immediately.
+
+    Args:
+        max_concurrent (int | None): The maximum number of concurrent starts.
+        rate (float | None): The maximum number of starts per second.
+        burst (int | None): The maximum burst of starts. Default is `rate`.
+        timers (TimerWheel | None): The timer wheel used to wait for tokens.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int | None = None,
+        rate: float | None = None,
+        burst: int | None = None,
+        timers: TimerWheel | None = None,
+    ) -> None:
+        if max_concurrent is not None and max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1.")
+        self._max_concurrent = max_concurrent
+        self._bucket = TokenBucket(rate, burst) if rate else None
+        self._active: int = 0
+        self._queue = TokenQueue(
+            self._bucket,
+            timers,
+            admit=self._has_slot,
+            on_grant=self._take_slot,
+            on_revoke=self.release,
+            label="Start rate limit",
+        )
+
+    @property
+    def limited(self) -> bool:
+        """
+        Whether starts are limited at all.
+        """
+        return self._max_concurrent is not None or self._bucket is not None
+
+    @property
+    def active(self) -> int:
+        """
+        Gets the number of starts holding a slot.
+        """
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        """
+        Gets the number of starts waiting for a slot.
+        """
+        return self._queue.waiting
+
+    async def acquire(self, priority: int = 999) -> None:
+        """
+        Waits for a start slot. Must be followed by `release`.
+
+        Args:
+            priority: The priority of the start, lower is served first.
+        """
+        if not self.limited:
+            self._active += 1
+            return
+        await self._queue.wait(priority)
+
+    def release(self) -> None:
+        """
+        Gives a start slot back.
+        """
+        self._active -= 1
+        self._queue.dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 999) -> AsyncIterator[None]:
+        """
+        Holds a start slot for the duration of the context.
+        """
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _has_slot(self) -> bool:
+        return self._max_concurrent is None or self._active < self._max_concurrent
+
+    def _take_slot(self) -> None:
+        self._active += 1
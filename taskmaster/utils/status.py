@@ -0,0 +1,234 @@
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Callable, Dict, Hashable, List, Tuple
+
+# The `process_N` keys of the status rows, built once for every service
+_PROCESS_KEYS: List[str] = []
+
+
+def process_keys(count: int) -> List[str]:
+    """
+    Gets the `process_1` to `process_<count>` keys of a status row.
+    """
+    for index in range(len(_PROCESS_KEYS), count):
+        _PROCESS_KEYS.append(f"process_{index + 1}")
+    return _PROCESS_KEYS[:count]
+
+
+@dataclass(frozen=True)
+class ServiceSummary:
+    """
+    The status of one service.
+
+    Attributes:
+        name: The name of the service.
+        cmd: The command of the service.
+        states: The state of each process, in order.
+        counts: The number of processes in each state.
+        orphans: The number of orphaned descendants adopted.
+    """
+
+    name: str
+    cmd: str
+    states: Tuple[str, ...] = ()
+    counts: Dict[str, int] = field(default_factory=dict)
+    orphans: int = 0
+
+    @cached_property
+    def row(self) -> Dict[str, str]:
+        """
+        Gets the summary as a status row: name, cmd, `process_N` states and
+        `orphans` if any were adopted. Built once, must not be modified.
+        """
+        row = {"name": self.name, "cmd": self.cmd}
+        row.update(zip(process_keys(len(self.states)), self.states))
+        if self.orphans:
+            row["orphans"] = str(self.orphans)
+        return row
+
+
+@dataclass(frozen=True)
+class StatusDelta:
+    """
+    What changed in the status since a version.
+
+    Attributes:
+        version: The current version, to ask for the next delta.
+        changed: The summaries of the services that changed, oldest change first.
+        order: The names of every service in order, if services were added,
+            removed or reordered. Services missing from it are gone.
+    """
+
+    version: int
+    changed: Tuple[ServiceSummary, ...] = ()
+    order: Tuple[str, ...] | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.changed) or self.order is not None
+
+
+class StatusModel:
+    """
+    The status of every service, updated on state transitions instead of being
+    rebuilt on every read.
+
+    Every change bumps the version. Readers keep the version they last saw and
+    ask for the delta since then: finding what changed only walks the services
+    that changed, and the model holds one entry per service whatever the
+    number of transitions.
+
+    Args:
+        summarize: Builds the summary of a service from its name. Summaries are
+            only rebuilt when read after the service changed.
+    """
+
+    def __init__(self, summarize: Callable[[str], ServiceSummary]) -> None:
+        self._summarize = summarize
+        self._version: int = 0
+        # Name -> version of its last change, oldest change first
+        self._changed: Dict[str, int] = {}
+        # Name -> summary, None until rebuilt after a change
+        self._summaries: Dict[str, ServiceSummary | None] = {}
+        self._order_version: int = 0
+        self._counts: Dict[Hashable, int] = {}
+        self._autostart_seconds: float | None = None
+
+    @property
+    def version(self) -> int:
+        """
+        Gets the current version.
+        """
+        return self._version
+
+    @property
+    def counts(self) -> Dict[Hashable, int]:
+        """
+        Gets the number of processes in each state, over every service.
+        """
+        return dict(self._counts)
+
+    @property
+    def autostart_seconds(self) -> float | None:
+        """
+        Gets the seconds from the first autostart until every autostart service
+        was running, None until then or if one of them failed.
+        """
+        return self._autostart_seconds
+
+    @autostart_seconds.setter
+    def autostart_seconds(self, seconds: float | None) -> None:
+        """
+        Sets the seconds the first autostart took.
+        """
+        self._autostart_seconds = seconds
+        self._version += 1
+
+    def add(self, name: str, counts: Dict[Hashable, int]) -> None:
+        """
+        Adds a service after the others.
+
+        Args:
+            name: The name of the service.
+            counts: The number of processes of the service in each state.
+        """
+        for state, count in counts.items():
+            self._count(state, count)
+        self._summaries[name] = None
+        self._order_version = self._touch(name)
+
+    def remove(self, name: str, counts: Dict[Hashable, int]) -> None:
+        """
+        Removes a service.
+
+        Args:
+            name: The name of the service.
+            counts: The number of processes of the service in each state.
+        """
+        for state, count in counts.items():
+            self._count(state, -count)
+        self._summaries.pop(name, None)
+        self._changed.pop(name, None)
+        self._version += 1
+        self._order_version = self._version
+
+    def reorder(self, names: List[str]) -> None:
+        """
+        Sets the order of the services.
+        """
+        self._summaries = {name: self._summaries.get(name) for name in names}
+        self._version += 1
+        self._order_version = self._version
+
+    def transition(
+        self, name: str, previous: Hashable | None, state: Hashable | None
+    ) -> None:
+        """
+        Records that a process of a service went from one state to another
+        (None when it joins or leaves the service).
+        """
+        if previous is not None:
+            self._count(previous, -1)
+        if state is not None:
+            self._count(state, 1)
+        self.touch(name)
+
+    def touch(self, name: str) -> None:
+        """
+        Records that the summary of a service changed.
+        """
+        if name in self._summaries:
+            self._summaries[name] = None
+            self._touch(name)
+
+    def summary(self, name: str) -> ServiceSummary | None:
+        """
+        Gets the summary of a service, None if there is no such service.
+        """
+        if name not in self._summaries:
+            return None
+        summary = self._summaries[name]
+        if summary is None:
+            summary = self._summaries[name] = self._summarize(name)
+        return summary
+
+    def summaries(self) -> List[ServiceSummary]:
+        """
+        Gets the summaries of every service, in order.
+        """
+        return [self.summary(name) for name in self._summaries]
+
+    def changes(self, since: int = -1) -> StatusDelta:
+        """
+        Gets what changed after a version.
+
+        Args:
+            since: The version the reader last saw, -1 (or any unknown version)
+                for everything.
+        """
+        if since < 0 or since > self._version:
+            return StatusDelta(
+                version=self._version,
+                changed=tuple(self.summaries()),
+                order=tuple(self._summaries),
+            )
+        names: List[str] = []
+        for name in reversed(self._changed):
+            if self._changed[name] <= since:
+                break
+            names.append(name)
+        return StatusDelta(
+            version=self._version,
+            changed=tuple(self.summary(name) for name in reversed(names)),
+            order=tuple(self._summaries) if self._order_version > since else None,
+        )
+
+    def _touch(self, name: str) -> int:
+        self._version += 1
+        self._changed.pop(name, None)
+        self._changed[name] = self._version
+        return self._version
+
+    def _count(self, state: Hashable, count: int) -> None:
+        self._counts[state] = self._counts.get(state, 0) + count
+        if not self._counts[state]:
+            del self._counts[state]
@@ -0,0 +1,231 @@
+from typing import Any, Callable, Dict, List
+import asyncio
+import math
+import weakref
+
+from .logger import logger
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel holding every lifecycle deadline (starttime, stoptime, backoff).
+
+    Inserting and cancelling a timer are O(1): a timer lives in the slot of the tick
+    it expires on, and slots are dicts. A single event loop callback drives the wheel,
+    and it is only armed while timers are pending, so an idle supervisor does not wake
+    up no matter how many processes it manages.
+
+    Timers never fire early; they fire at most one `resolution` late.
+
+    Args:
+        resolution (float): The duration of a tick in seconds. Default is 0.01.
+        slots (int): The number of slots of the wheel. Default is 512.
+    """
+
+    class Timer:
+        """
+        A handle on a scheduled callback.
+        """
+
+        __slots__ = ("tick", "callback", "args", "cancelled")
+
+        def __init__(
+            self, tick: int, callback: Callable[..., Any], args: tuple
+        ) -> None:
+            self.tick = tick
+            self.callback = callback
+            self.args = args
+            self.cancelled = False
+
+    _wheels: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TimerWheel]" = (
+        weakref.WeakKeyDictionary()
+    )
+
+    def __init__(self, resolution: float = 0.01, slots: int = 512) -> None:
+        if resolution <= 0:
+            raise ValueError("Resolution must be greater than 0.")
+        if slots <= 0:
+            raise ValueError("Slots must be greater than 0.")
+        self._resolution = resolution
+        self._slots: List[Dict[TimerWheel.Timer, None]] = [{} for _ in range(slots)]
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._origin: float = 0.0
+        self._tick: int = 0
+        self._count: int = 0
+        self._handle: asyncio.TimerHandle | None = None
+        self._handle_tick: int | None = None
+
+    @classmethod
+    def current(cls) -> "TimerWheel":
+        """
+        Gets the timer wheel shared by the running event loop, creating it if needed.
+
+        Used by services and processes that are not owned by a ServiceHandler.
+        """
+        loop = asyncio.get_running_loop()
+        wheel = cls._wheels.get(loop)
+        if wheel is None:
+            wheel = cls()
+            cls._wheels[loop] = wheel
+        return wheel
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def resolution(self) -> float:
+        """
+        Gets the duration of a tick in seconds.
+        """
+        return self._resolution
+
+    def _bind(self) -> asyncio.AbstractEventLoop:
+        """
+        Binds the wheel to the running loop on first use.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._count:
+                raise RuntimeError("Timer wheel is bound to another event loop.")
+            self._loop = loop
+            self._origin = loop.time()
+            self._tick = 0
+            self._handle = None
+            self._handle_tick = None
+        return loop
+
+    def _now_tick(self) -> int:
+        return int((self._loop.time() - self._origin) / self._resolution)
+
+    def call_later(
+        self, delay: float, callback: Callable[..., Any], *args: Any
+    ) -> "TimerWheel.Timer":
+        """
+        Schedules a callback.
+
+        Args:
+            delay: The delay in seconds.
+            callback: The function to call.
+            *args: The arguments of the callback.
+
+        Returns:
+            The timer handle, to be given to `cancel`.
+        """
+        loop = self._bind()
+        deadline = loop.time() + max(delay, 0) - self._origin
+        tick = max(math.ceil(deadline / self._resolution), self._tick + 1)
+        timer = self.Timer(tick, callback, args)
+        self._slots[tick % len(self._slots)][timer] = None
+        self._count += 1
+        if self._handle_tick is None or tick < self._handle_tick:
+            self._arm(tick)
+        return timer
+
+    def cancel(self, timer: "TimerWheel.Timer") -> None:
+        """
+        Cancels a timer. Cancelling a timer that already fired does nothing.
+        """
+        if timer.cancelled:
+            return
+        timer.cancelled = True
+        slot = self._slots[timer.tick % len(self._slots)]
+        if timer in slot:
+            del slot[timer]
+            self._count -= 1
+
+    def _arm(self, tick: int) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle_tick = tick
+        self._handle = self._loop.call_at(
+            self._origin + tick * self._resolution, self._advance
+        )
+
+    def _advance(self) -> None:
+        """
+        Fires every timer expired since the last advance and re-arms the wheel.
+        """
+        self._handle = None
+        self._handle_tick = None
+        now = max(self._now_tick(), self._tick)
+        size = len(self._slots)
+        first = self._tick + 1 if now - self._tick < size else now - size + 1
+        expired: List[TimerWheel.Timer] = []
+        for tick in range(first, now + 1):
+            slot = self._slots[tick % size]
+            if not slot:
+                continue
+            for timer in [timer for timer in slot if timer.tick <= now]:
+                del slot[timer]
+                self._count -= 1
+                expired.append(timer)
+        self._tick = now
+
+        for timer in sorted(expired, key=lambda timer: timer.tick):
+            timer.cancelled = True
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                logger.error(f"Timer callback {timer.callback} failed: {e}")
+
+        if self._count and self._handle is None:
+            self._arm(self._next_tick())
+
+    def _next_tick(self) -> int:
+        """
+        Finds the next tick that has a slot holding timers.
+        """
+        size = len(self._slots)
+        for offset in range(1, size + 1):
+            slot = self._slots[(self._tick + offset) % size]
+            if slot:
+                return min(self._tick + offset, min(timer.tick for timer in slot))
+        return self._tick + size
+
+    async def sleep(self, delay: float) -> None:
+        """
+        Sleeps using the wheel instead of a dedicated event loop timer.
+
+        Args:
+            delay: The delay in seconds.
+        """
+        future = self._bind().create_future()
+        timer = self.call_later(delay, _wake, future)
+        try:
+            await future
+        finally:
+            self.cancel(timer)
+
+    async def wait(self, future: asyncio.Future, timeout: float | None = None) -> bool:
+        """
+        Waits for a future to complete, at most `timeout` seconds.
+        The future is never cancelled.
+
+        Args:
+            future: The future to wait for.
+            timeout: The maximum time to wait, in seconds. Waits forever if None.
+
+        Returns:
+            True if the future is done.
+        """
+        if future.done():
+            return True
+        waiter = self._bind().create_future()
+        timer = None if timeout is None else self.call_later(timeout, _wake, waiter)
+
+        def on_done(_: asyncio.Future) -> None:
+            _wake(waiter)
+
+        future.add_done_callback(on_done)
+        try:
+            await waiter
+        finally:
+            if timer is not None:
+                self.cancel(timer)
+            future.remove_done_callback(on_done)
+        return future.done()
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,165 @@
+from typing import Any, Callable, List, Tuple
+import asyncio
+import heapq
+import itertools
+import time
+
+from .logger import logger
+from .timer_wheel import TimerWheel
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Args:
+        rate (float): The number of tokens added per second.
+        burst (float): The maximum number of tokens the bucket holds. Default is `rate`, at least 1.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        if rate <= 0:
+            raise ValueError("Rate must be greater than 0.")
+        self._rate = rate
+        self._burst = burst if burst is not None else max(rate, 1)
+        if self._burst < 1:
+            raise ValueError("Burst must be at least 1.")
+        self._tokens = self._burst
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """
+        Gets the number of tokens added per second.
+        """
+        return self._rate
+
+    @property
+    def burst(self) -> float:
+        """
+        Gets the maximum number of tokens.
+        """
+        return self._burst
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self._burst, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        """
+        Gets the number of tokens currently available.
+        """
+        self._refill()
+        return self._tokens
+
+    def take(self) -> float:
+        """
+        Takes a token if one is available.
+
+        Returns:
+            0 if a token was taken, otherwise the delay in seconds until one is available.
+        """
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self._rate
+
+
+class TokenQueue:
+    """
+    Waiters granted one by one by priority, lowest first, then in arrival order,
+    as far as a token bucket and an admission check allow.
+
+    Args:
+        bucket: The bucket every grant takes a token from, None for no rate limit.
+        timers: The timer wheel used to wait for tokens.
+        admit: Whether one more waiter may be granted now, None for always.
+        on_grant: Called for each waiter granted.
+        on_revoke: Called for a waiter granted, but cancelled before it resumed.
+        label: What is limited, in logs.
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket | None = None,
+        timers: TimerWheel | None = None,
+        admit: Callable[[], bool] | None = None,
+        on_grant: Callable[[], Any] | None = None,
+        on_revoke: Callable[[], Any] | None = None,
+        label: str = "Rate limit",
+    ) -> None:
+        self._bucket = bucket
+        self._timers = timers
+        self._admit = admit
+        self._on_grant = on_grant
+        self._on_revoke = on_revoke
+        self._label = label
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._refill_timer: TimerWheel.Timer | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self._queue)
+
+    @property
+    def waiting(self) -> int:
+        """
+        Gets the number of waiters not granted yet.
+        """
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    async def wait(self, priority: int = 999) -> None:
+        """
+        Waits to be granted.
+
+        Args:
+            priority: The priority of the waiter, lower is served first.
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future))
+        self.dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and self._on_revoke:
+                self._on_revoke()
+            raise
+
+    def dispatch(self) -> None:
+        """
+        Grants the waiters, as far as the admission check and the tokens allow.
+        """
+        while self._queue:
+            if self._queue[0][2].done():
+                heapq.heappop(self._queue)
+                continue
+            if self._admit is not None and not self._admit():
+                return
+            if self._bucket is not None:
+                delay = self._bucket.take()
+                if delay:
+                    self._wait_for_token(delay)
+                    return
+            _, _, future = heapq.heappop(self._queue)
+            if self._on_grant is not None:
+                self._on_grant()
+            future.set_result(None)
+
+    def _wait_for_token(self, delay: float) -> None:
+        if self._refill_timer is not None:
+            return
+        timers = self._timers or TimerWheel.current()
+
+        def refill() -> None:
+            self._refill_timer = None
+            self.dispatch()
+
+        logger.debug(
+            f"{self._label} reached, {self.waiting} waiting, next in {delay:.3f}s."
+        )
+        self._refill_timer = timers.call_later(delay, refill)
@@ -0,0 +1,191 @@
+from typing import Any, Callable, Dict, Hashable, List, Set
+import asyncio
+import weakref
+
+from .logger import logger
+from .probes import Probe, ProbeKind
+from .timer_wheel import TimerWheel
+
+
+class Watchdog:
+    """
+    Runs the liveness probes of every process from a single scheduler.
+
+    Each watched process only costs a timer on the wheel: nothing runs between two
+    checks, so thousands of probes do not need thousands of long-lived tasks.
+    Probes due in the same tick are flushed together. File probes are checked
+    inline, the others only hold a task for the duration of the check.
+
+    After `threshold` consecutive failures, the process is unwatched and its
+    failure callback is called; restarting it is up to the caller.
+
+    Args:
+        timers (TimerWheel | None): The timer wheel scheduling the probes.
+    """
+
+    class Watch:
+        """
+        A watched process.
+        """
+
+        __slots__ = (
+            "name",
+            "probe",
+            "on_failure",
+            "threshold",
+            "failures",
+            "since",
+            "timer",
+        )
+
+        def __init__(
+            self,
+            name: str,
+            probe: Probe,
+            on_failure: Callable[[], Any],
+            threshold: int,
+            since: float | None,
+        ) -> None:
+            self.name = name
+            self.probe = probe
+            self.on_failure = on_failure
+            self.threshold = threshold
+            self.failures = 0
+            self.since = since
+            self.timer: TimerWheel.Timer | None = None
+
+    _watchdogs: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Watchdog]" = (
+        weakref.WeakKeyDictionary()
+    )
+
+    def __init__(self, timers: TimerWheel | None = None) -> None:
+        self._timers = timers
+        self._watches: Dict[Hashable, Watchdog.Watch] = {}
+        self._due: List[Hashable] = []
+        self._batches: Set[asyncio.Future] = set()
+
+    @classmethod
+    def current(cls) -> "Watchdog":
+        """
+        Gets the watchdog shared by the running event loop, creating it if needed.
+
+        Used by services that are not owned by a ServiceHandler.
+        """
+        loop = asyncio.get_running_loop()
+        watchdog = cls._watchdogs.get(loop)
+        if watchdog is None:
+            watchdog = cls()
+            cls._watchdogs[loop] = watchdog
+        return watchdog
+
+    def __len__(self) -> int:
+        return len(self._watches)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._watches
+
+    @property
+    def timers(self) -> TimerWheel:
+        """
+        Gets the timer wheel scheduling the probes.
+        """
+        if self._timers is None:
+            self._timers = TimerWheel.current()
+        return self._timers
+
+    def watch(
+        self,
+        key: Hashable,
+        probe: Probe,
+        on_failure: Callable[[], Any],
+        threshold: int = 3,
+        since: float | None = None,
+        name: str | None = None,
+    ) -> None:
+        """
+        Starts probing a process every `probe.interval` seconds.
+
+        Args:
+            key: Identifies the watched process, given back to `unwatch`.
+            probe: The liveness probe.
+            on_failure: Called once after `threshold` consecutive failures.
+            threshold: The number of consecutive failures tolerated.
+            since: The start time of the process, see Probe.check.
+            name: The name of the process in logs. Defaults to `key`.
+        """
+        self.unwatch(key)
+        watch = self.Watch(name or str(key), probe, on_failure, threshold, since)
+        watch.timer = self.timers.call_later(probe.interval, self._on_due, key)
+        self._watches[key] = watch
+
+    def unwatch(self, key: Hashable) -> None:
+        """
+        Stops probing a process. Unwatching a process that is not watched does nothing.
+        """
+        watch = self._watches.pop(key, None)
+        if watch is not None and watch.timer is not None:
+            self.timers.cancel(watch.timer)
+
+    def _on_due(self, key: Hashable) -> None:
+        """
+        Queues the probe of a process, to be checked with the others due in this tick.
+        """
+        watch = self._watches.get(key)
+        if watch is None:
+            return
+        watch.timer = None
+        if not self._due:
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._due.append(key)
+
+    def _flush(self) -> None:
+        """
+        Checks the queued probes: file probes right away, the others together.
+        """
+        due, self._due = self._due, []
+        pending: List[Any] = []
+        for key in due:
+            watch = self._watches.get(key)
+            if watch is None:
+                continue
+            if watch.probe.kind == ProbeKind.FILE:
+                self._record(key, watch, watch.probe.check_file(watch.since))
+            else:
+                pending.append(self._check(key, watch))
+        if pending:
+            batch = asyncio.gather(*pending)
+            self._batches.add(batch)
+            batch.add_done_callback(self._batches.discard)
+
+    async def _check(self, key: Hashable, watch: "Watchdog.Watch") -> None:
+        try:
+            passed = await watch.probe.check(since=watch.since, timers=self.timers)
+        except Exception as e:
+            logger.debug(f"Liveness probe of {watch.name} raised: {e}")
+            passed = False
+        self._record(key, watch, passed)
+
+    def _record(self, key: Hashable, watch: "Watchdog.Watch", passed: bool) -> None:
+        """
+        Counts the result of a probe, then either reschedules it or reports the failure.
+        """
+        if self._watches.get(key) is not watch:
+            return
+        if passed:
+            watch.failures = 0
+        else:
+            watch.failures += 1
+            logger.warning(
+                f"Liveness probe of {watch.name} failed "
+                f"({watch.failures}/{watch.threshold})."
+            )
+            if watch.failures >= watch.threshold:
+                self.unwatch(key)
+                try:
+                    watch.on_failure()
+                except Exception as e:
+                    logger.error(
+                        f"Liveness failure handler of {watch.name} failed: {e}"
+                    )
+                return
+        watch.timer = self.timers.call_later(watch.probe.interval, self._on_due, key)
@@ -0,0 +1,207 @@
+import unittest
+import asyncio
+
+from taskmaster.service import Service, SubProcess
+from taskmaster.utils.backoff import (
+    BackoffPolicy,
+    BreakerState,
+    CircuitBreaker,
+    RestartPolicy,
+)
+from taskmaster.utils.config import Config
+from taskmaster.utils.events import EventKind
+from taskmaster.utils.timer_wheel import TimerWheel
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestBackoffPolicy(unittest.TestCase):
+    def test_linear_by_default(self):
+        policy = BackoffPolicy()
+        self.assertEqual([policy.delay(attempt) for attempt in (1, 2, 3)], [1, 2, 3])
+
+    def test_exponential_with_cap(self):
+        policy = BackoffPolicy(strategy="exponential", base=0.5, factor=2, max=3)
+        self.assertEqual(
+            [policy.delay(attempt) for attempt in range(1, 6)], [0.5, 1, 2, 3, 3]
+        )
+        # Capped before it grows out of range
+        self.assertEqual(policy.delay(100000), 3)
+
+    def test_full_jitter(self):
+        policy = BackoffPolicy(strategy="exponential", base=1, max=60, jitter="full")
+        self.assertEqual(policy.delay(3, uniform=lambda low, high: (low, high)), (0, 4))
+        delays = {policy.delay(10) for _ in range(50)}
+        self.assertGreater(len(delays), 1)
+        self.assertTrue(all(0 <= delay <= 60 for delay in delays))
+
+    def test_from_config(self):
+        config = Config("./tests/config_templates/valid/backoff.yaml").services[0]
+        policy = RestartPolicy.from_config(type("Config", (), config))
+        self.assertEqual(
+            policy.backoff,
+            BackoffPolicy(
+                strategy="exponential",
+                base=0.5,
+                max=30,
+                jitter="full",
+                reset_after=10,
+            ),
+        )
+        self.assertEqual(
+            (
+                policy.breaker.failures,
+                policy.breaker.window,
+                policy.breaker.open_for,
+                policy.breaker.reset_after,
+            ),
+            (5, 60, 30, 120),
+        )
+        default = RestartPolicy.from_config(type("Config", (), {}))
+        self.assertEqual(default.backoff, BackoffPolicy())
+        self.assertIsNone(default.breaker)
+
+    def test_healthy_without_breaker(self):
+        config = {"backoff": {"reset_after": 5}}
+        policy = RestartPolicy.from_config(type("Config", (), config))
+        self.assertIsNone(policy.breaker)
+        self.assertFalse(policy.healthy(4))
+        self.assertTrue(policy.healthy(5))
+        # Attempts never start over by default
+        policy = RestartPolicy.from_config(type("Config", (), {}))
+        self.assertFalse(policy.healthy(3600))
+        # Unless there is a breaker
+        config = {"circuit_breaker": {"failures": 3, "reset_after": 20}}
+        policy = RestartPolicy.from_config(type("Config", (), config))
+        self.assertTrue(policy.healthy(20))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker(
+            failures=3, window=10, open_for=5, reset_after=20, clock=self.clock
+        )
+
+    def fail(self, times=1, uptime=None):
+        for _ in range(times):
+            self.breaker.record_failure(uptime)
+
+    def test_opens_after_failures_in_window(self):
+        self.fail(2)
+        self.clock.now += 11
+        # The first two are out of the window
+        self.fail(2)
+        self.assertEqual(self.breaker.state, BreakerState.CLOSED)
+        self.assertEqual(self.breaker.retry_in(), 0)
+        self.fail()
+        self.assertEqual(self.breaker.state, BreakerState.OPEN)
+        self.assertEqual(self.breaker.retry_in(), 5)
+
+    def test_half_open_probe(self):
+        self.fail(3)
+        self.clock.now += 5
+        self.assertEqual(self.breaker.state, BreakerState.HALF_OPEN)
+        # One probe, the others wait for it to stay up
+        self.assertEqual(self.breaker.retry_in(), 0)
+        self.assertEqual(self.breaker.retry_in(), 20)
+        self.clock.now += 20
+        self.assertEqual(self.breaker.state, BreakerState.CLOSED)
+        self.assertEqual(self.breaker.retry_in(), 0)
+
+    def test_failed_probe_opens_again(self):
+        self.fail(3)
+        self.clock.now += 5
+        self.assertEqual(self.breaker.retry_in(), 0)
+        self.clock.now += 1
+        self.fail(uptime=1)
+        self.assertEqual(self.breaker.state, BreakerState.OPEN)
+        self.assertEqual(self.breaker.retry_in(), 5)
+
+    def test_reset_after_healthy_uptime(self):
+        self.fail(2)
+        self.fail(uptime=20)
+        self.fail()
+        self.assertEqual(self.breaker.state, BreakerState.CLOSED)
+
+    def test_acquire(self):
+        async def acquire():
+            breaker = CircuitBreaker(failures=1, open_for=0.1, reset_after=0.1)
+            breaker.record_failure()
+            timers = TimerWheel()
+            began = asyncio.get_running_loop().time()
+            await breaker.acquire(timers)
+            elapsed = asyncio.get_running_loop().time() - began
+            self.assertEqual(breaker.state, BreakerState.HALF_OPEN)
+            return elapsed
+
+        self.assertGreaterEqual(asyncio.run(acquire()), 0.09)
+
+
+class TestServiceCircuitBreaker(unittest.IsolatedAsyncioTestCase):
+    async def test_crash_loop(self):
+        config = Config("./tests/config_templates/valid/test_reload.yml").services[0]
+        config.update(
+            cmd="sh -c 'sleep 0.05; exit 1'",
+            numprocs=1,
+            starttime=0,
+            autorestart="always",
+            startretries=1,
+            backoff={"base": 0.01},
+            circuit_breaker={
+                "failures": 3,
+                "window": 10,
+                "open_for": 1,
+                "reset_after": 0.5,
+            },
+        )
+        service = Service(**config)
+        spawns = []
+        service.events.listen(
+            lambda event: event.kind == EventKind.SPAWNED and spawns.append(event)
+        )
+        await service.start()
+        await asyncio.sleep(0.6)
+        self.assertEqual(len(spawns), 3)
+        self.assertEqual(service.restart_policy.breaker.state, BreakerState.OPEN)
+        # Past startretries, but not given up on
+        self.assertNotEqual(service._processes[0].state, SubProcess.State.FATAL)
+        await asyncio.sleep(0.8)
+        # The half-open probe
+        self.assertEqual(len(spawns), 4)
+        await service.stop()
+
+    async def test_expected_exits_are_not_failures(self):
+        config = Config("./tests/config_templates/valid/test_reload.yml").services[0]
+        config.update(
+            cmd="sh -c 'sleep 0.05; exit 0'",
+            numprocs=1,
+            starttime=0,
+            autorestart="always",
+            exitcodes=[0],
+            startretries=1,
+            backoff={"base": 0.01},
+            circuit_breaker={"failures": 2, "window": 10},
+        )
+        service = Service(**config)
+        spawns = []
+        service.events.listen(
+            lambda event: event.kind == EventKind.SPAWNED and spawns.append(event)
+        )
+        await service.start()
+        await asyncio.sleep(0.4)
+        # Restarted every time, the breaker never opened
+        self.assertGreaterEqual(len(spawns), 4)
+        self.assertEqual(service.restart_policy.breaker.state, BreakerState.CLOSED)
+        self.assertEqual(len(service.restart_policy.breaker._failures), 0)
+        await service.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+import asyncio
+import os
+import tempfile
+
+from taskmaster.service import ServiceHandler
+from taskmaster.utils.cgroups import CgroupTree, ServiceCgroup, cgroup_limits
+from taskmaster.utils.config import Config
+
+
+def cgroup2_mount():
+    """
+    Gets a writable cgroup v2 mount point, None if there is none.
+    """
+    with open("/proc/mounts") as mounts:
+        for line in mounts:
+            fields = line.split()
+            if fields[2] == "cgroup2" and os.access(fields[1], os.W_OK):
+                return fields[1]
+    return None
+
+
+class TestCgroupLimits(unittest.TestCase):
+    def test_cgroup_limits(self):
+        self.assertEqual(
+            cgroup_limits(
+                {
+                    "cpu_max": 1.5,
+                    "memory_max": "1G",
+                    "memory_high": 1024,
+                    "pids_max": 64,
+                }
+            ),
+            {
+                "cpu.max": "150000 100000",
+                "memory.max": str(1 << 30),
+                "memory.high": "1024",
+                "pids.max": "64",
+            },
+        )
+        self.assertEqual(
+            cgroup_limits(None),
+            {
+                "cpu.max": "max 100000",
+                "memory.max": "max",
+                "memory.high": "max",
+                "pids.max": "max",
+            },
+        )
+
+
+class TestServiceCgroup(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self, name):
+        with open(os.path.join(self.path, name)) as file:
+            return file.read()
+
+    def test_apply(self):
+        cgroup = ServiceCgroup(self.path)
+        self.assertTrue(cgroup.apply(cgroup_limits({"memory_max": "512M"})))
+        self.assertEqual(self.read("memory.max"), str(512 << 20))
+        self.assertEqual(self.read("cpu.max"), "max 100000")
+
+    def test_apply_without_controllers(self):
+        cgroup = ServiceCgroup(os.path.join(self.path), controllers=("cpu",))
+        with self.assertLogs(level="WARNING") as logs:
+            self.assertFalse(cgroup.apply(cgroup_limits({"pids_max": 10})))
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("pids.max", logs.output[0])
+        self.assertEqual(os.listdir(self.path), ["cpu.max"])
+        # Unlimited is what a group without the controller gets anyway
+        self.assertTrue(cgroup.apply(cgroup_limits({"cpu_max": 2})))
+
+    def test_usage(self):
+        for name, content in (
+            ("cpu.stat", "usage_usec 2500\nuser_usec 2000\nsystem_usec 500\n"),
+            ("memory.current", "4096\n"),
+            ("cgroup.procs", "12\n34\n"),
+        ):
+            with open(os.path.join(self.path, name), "w") as file:
+                file.write(content)
+        usage = ServiceCgroup(self.path).usage()
+        self.assertEqual(usage.cpu_usec, 2500)
+        self.assertEqual(usage.memory, 4096)
+        self.assertEqual(usage.tasks, 0)
+        self.assertEqual(usage.processes, 2)
+        self.assertEqual(ServiceCgroup(self.path).pids(), [12, 34])
+
+    def test_not_a_cgroup(self):
+        with self.assertLogs(level="WARNING"):
+            tree = CgroupTree(os.path.join(self.path, "taskmaster"))
+        self.assertFalse(tree.enabled)
+        self.assertIsNone(tree.service("web"))
+        self.assertEqual(os.listdir(self.path), [])
+
+
+@unittest.skipIf(cgroup2_mount() is None, "no writable cgroup v2 hierarchy")
+class TestHandlerCgroups(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.root = os.path.join(cgroup2_mount(), f"taskmaster-test-{os.getpid()}")
+
+    async def asyncTearDown(self):
+        if not os.path.isdir(self.root):
+            return
+        # Left over by a failure
+        for group in os.listdir(self.root):
+            path = os.path.join(self.root, group)
+            if os.path.isdir(path):
+                with open(os.path.join(path, "cgroup.kill"), "w") as file:
+                    file.write("1")
+                while ServiceCgroup(path).pids():
+                    await asyncio.sleep(0.01)
+                os.rmdir(path)
+        os.rmdir(self.root)
+
+    async def test_processes_in_service_group(self):
+        config = Config("./tests/config_templates/valid/service_handler_reference.yaml")
+        handler = ServiceHandler(
+            email=None,
+            services=config.services,
+            supervisor={"cgroup_root": self.root, "sample_interval": 0.05},
+        )
+        service = handler.services.get("sleep all")
+        self.assertEqual(service.cgroup.path, os.path.join(self.root, "sleep all"))
+        await handler.start(["sleep all"])
+        await asyncio.sleep(0.2)
+        pids = sorted(process.pid for process in service._processes)
+        self.assertEqual(sorted(service.cgroup.pids()), pids)
+        for pid in pids:
+            with open(f"/proc/{pid}/cgroup") as file:
+                self.assertIn("/sleep all\n", file.read())
+        # Accounted from the group, not per process
+        self.assertEqual(len(handler.sampler), 0)
+        self.assertEqual(handler.sampler.service("sleep all").processes, 2)
+
+        await service.stop()
+        await handler.delete()
+        self.assertEqual(os.listdir(self.root).count("sleep all"), 0)
+        self.assertNotIn("sleep all", handler.sampler.services())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import asyncio
+import os
+import signal
+import subprocess
+
+from taskmaster.utils.child_watcher import ORPHAN_DEBOUNCE, ChildWatcher
+from taskmaster.utils.process_tree import children
+
+
+class TestChildWatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_current_is_shared(self):
+        self.assertIs(ChildWatcher.current(), ChildWatcher.current())
+
+    async def test_exit_code(self):
+        watcher = ChildWatcher()
+        process = subprocess.Popen(["sh", "-c", "exit 3"])
+        self.assertEqual(await asyncio.wait_for(watcher.watch(process.pid), 1), 3)
+        self.assertEqual(len(watcher), 0)
+
+    async def test_killed_by_signal(self):
+        watcher = ChildWatcher()
+        process = subprocess.Popen(["sleep", "5"])
+        future = watcher.watch(process.pid)
+        await asyncio.sleep(0.05)
+        self.assertFalse(future.done())
+        process.send_signal(signal.SIGTERM)
+        self.assertEqual(await asyncio.wait_for(future, 1), -signal.SIGTERM)
+
+    async def test_exited_before_watch(self):
+        watcher = ChildWatcher()
+        process = subprocess.Popen(["true"])
+        await asyncio.sleep(0.1)
+        self.assertEqual(await asyncio.wait_for(watcher.watch(process.pid), 1), 0)
+
+    async def test_sigchld_backend(self):
+        watcher = ChildWatcher()
+        watcher._use_pidfd = False
+        self.assertEqual(watcher.backend, "sigchld")
+        fast = subprocess.Popen(["true"])
+        slow = subprocess.Popen(["sh", "-c", "sleep 0.2; exit 4"])
+        fast_future = watcher.watch(fast.pid)
+        slow_future = watcher.watch(slow.pid)
+        self.assertEqual(await asyncio.wait_for(fast_future, 1), 0)
+        self.assertFalse(slow_future.done())
+        self.assertEqual(await asyncio.wait_for(slow_future, 1), 4)
+        watcher.close()
+
+
+class TestOrphans(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.watcher = ChildWatcher()
+        self.orphans = []
+        self.pgids = set()
+
+    async def asyncTearDown(self):
+        for pid in self.watcher.orphans:
+            os.kill(pid, signal.SIGKILL)
+        await asyncio.sleep(0.05)
+        self.watcher.close()
+
+    def attribute(self, pid):
+        return "owner" if os.getpgid(pid) in self.pgids else None
+
+    async def orphan(self, cmd):
+        self.assertTrue(
+            self.watcher.adopt_orphans(
+                self.attribute,
+                lambda *orphan: self.orphans.append(orphan),
+                interval=60,
+            )
+        )
+        process = subprocess.Popen(["sh", "-c", cmd], start_new_session=True)
+        self.pgids.add(process.pid)
+        self.assertEqual(await asyncio.wait_for(self.watcher.watch(process.pid), 1), 0)
+
+    async def test_sigchld_sweeps_are_debounced(self):
+        sweeps = []
+        self.watcher.adopt_orphans(self.attribute, self.orphans.append, interval=60)
+        sweep = self.watcher.sweep_orphans
+        self.watcher.sweep_orphans = lambda: sweeps.append(sweep())
+        for _ in range(5):
+            process = subprocess.Popen(["true"])
+            await asyncio.wait_for(self.watcher.watch(process.pid), 1)
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(ORPHAN_DEBOUNCE)
+        # 5 exits 10ms apart, one sweep every ORPHAN_DEBOUNCE seconds instead of 5
+        self.assertGreaterEqual(len(sweeps), 1)
+        self.assertLessEqual(len(sweeps), 3)
+
+    async def test_running_orphan(self):
+        foreign = subprocess.Popen(["sleep", "5"])
+        await self.orphan("sleep 5 & exit 0")
+        await asyncio.sleep(0.05)
+        self.watcher.sweep_orphans()
+        self.assertEqual(len(self.orphans), 1)
+        pid, owner, returncode = self.orphans[0]
+        self.assertEqual((owner, returncode), ("owner", None))
+        self.assertEqual(self.watcher.orphans, {pid: "owner"})
+        # Reported once, reaped on exit
+        self.watcher.sweep_orphans()
+        os.kill(pid, signal.SIGKILL)
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(self.orphans), 1)
+        self.assertEqual(self.watcher.orphans, {})
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+        # Children spawned elsewhere are left alone
+        self.assertIsNone(foreign.poll())
+        foreign.kill()
+        foreign.wait()
+
+    async def test_orphan_on_sigchld(self):
+        await self.orphan("(sleep 0.1; exit 5) & exit 0")
+        # Adopted when the exit of its parent is handled, reaped on its own exit
+        await asyncio.sleep(0.3)
+        self.assertEqual(len(self.orphans), 1)
+        pid, owner, returncode = self.orphans[0]
+        self.assertEqual((owner, returncode), ("owner", None))
+        self.assertEqual(self.watcher.orphans, {})
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+    async def test_release(self):
+        self.watcher.adopt_orphans(self.attribute, self.orphans.append)
+        self.watcher.release_orphans()
+        process = subprocess.Popen(
+            ["sh", "-c", "sleep 5 & echo $!"],
+            stdout=subprocess.PIPE,
+            start_new_session=True,
+        )
+        self.pgids.add(process.pid)
+        pid = int(process.stdout.readline())
+        process.wait()
+        process.stdout.close()
+        await asyncio.sleep(0.05)
+        self.watcher.sweep_orphans()
+        self.assertEqual(self.orphans, [])
+        # Reparented to init, as without a subreaper
+        self.assertNotIn(pid, children(os.getpid()))
+        os.kill(pid, signal.SIGKILL)
@@ -1,6 +1,6 @@
 import unittest
 import os
-from taskmaster.utils.config import Config
+from taskmaster.utils.config import Config, validator
 from cerberus import SchemaError
 
 
@@ -48,7 +48,14 @@ class TestConfig(unittest.TestCase):
 
     def test_valid_umask_max(self):
         config = Config("./tests/config_templates/valid/umask_max.yaml")
-        self.assertEqual(config.services[0]["umask"], 777)
+        self.assertEqual(config.services[0]["umask"], 0o777)
+
+    def test_invalid_umask_max(self):
+        # Read as decimal, so not a umask
+        with self.assertRaises(SchemaError):
+            Config("./tests/config_templates/invalid/umask_max.yaml")
+        errors = validator.errors["services"][0][0][0]
+        self.assertEqual(set(errors), {"umask"})
 
     def test_valid_numprocs_min(self):
         config = Config("./tests/config_templates/valid/numprocs_min.yaml")
@@ -56,7 +63,13 @@ class TestConfig(unittest.TestCase):
 
     def test_valid_numprocs_max(self):
         config = Config("./tests/config_templates/valid/numprocs_max.yaml")
-        self.assertEqual(config.services[0]["numprocs"], 32)
+        self.assertEqual(config.services[0]["numprocs"], 4096)
+
+    def test_invalid_numprocs_max(self):
+        with self.assertRaises(SchemaError):
+            Config("./tests/config_templates/invalid/numprocs_max.yaml")
+        errors = validator.errors["services"][0][0][0]
+        self.assertEqual(set(errors), {"numprocs"})
 
     def test_valid_starttime_min(self):
         config = Config("./tests/config_templates/valid/starttime_min.yaml")
@@ -66,6 +79,10 @@ class TestConfig(unittest.TestCase):
         config = Config("./tests/config_templates/valid/starttime_max.yaml")
         self.assertEqual(config.services[0]["starttime"], 100000000)
 
+    def test_valid_starttime_subsecond(self):
+        config = Config("./tests/config_templates/valid/starttime_subsecond.yaml")
+        self.assertEqual(config.services[0]["starttime"], 0.5)
+
     def test_valid_startretries_min(self):
         config = Config("./tests/config_templates/valid/startretries_min.yaml")
         self.assertEqual(config.services[0]["startretries"], 1)
@@ -184,3 +201,111 @@ class TestConfig(unittest.TestCase):
             config = Config("./tests/config_templates/invalid/email.yaml")
         except SchemaError as e:
             self.assertIn("Invalid configuration file.", str(e))
+
+    def test_valid_depends_on(self):
+        config = Config("./tests/config_templates/valid/depends_on.yaml")
+        self.assertEqual(config.services[0]["depends_on"], ["database", "cache"])
+        self.assertEqual(config.services[1]["depends_on"], [])
+
+    def test_invalid_depends_on_cycle(self):
+        with self.assertRaises(ValueError):
+            Config("./tests/config_templates/invalid/depends_on_cycle.yaml")
+
+    def test_invalid_depends_on_unknown(self):
+        with self.assertRaises(ValueError):
+            Config("./tests/config_templates/invalid/depends_on_unknown.yaml")
+
+    def test_valid_readiness(self):
+        config = Config("./tests/config_templates/valid/readiness.yaml")
+        self.assertEqual(
+            config.services[0]["readiness"],
+            {"type": "tcp", "port": 8080, "interval": 0.05},
+        )
+
+    def test_invalid_readiness(self):
+        with self.assertRaises(ValueError):
+            Config("./tests/config_templates/invalid/readiness.yaml")
+
+    def test_valid_liveness(self):
+        config = Config("./tests/config_templates/valid/liveness.yaml")
+        self.assertEqual(config.services[0]["liveness"]["failure_threshold"], 3)
+        self.assertIsNone(config.services[0]["readiness"])
+
+    def test_valid_max_unavailable(self):
+        config = Config("./tests/config_templates/valid/max_unavailable.yaml")
+        self.assertEqual(config.services[0]["max_unavailable"], "25%")
+
+    def test_invalid_max_unavailable(self):
+        with self.assertRaises(SchemaError):
+            Config("./tests/config_templates/invalid/max_unavailable.yaml")
+
+    def test_valid_labels(self):
+        config = Config("./tests/config_templates/valid/labels.yaml")
+        self.assertEqual(config.services[0]["labels"], ["web", "critical"])
+
+    def test_valid_limits(self):
+        config = Config("./tests/config_templates/valid/limits.yaml")
+        self.assertEqual(config.services[0]["max_rss"], "512M")
+        self.assertEqual(
+            config.services[0]["max_cpu_percent_sustained"],
+            {"percent": 90, "seconds": 30},
+        )
+        self.assertEqual(config.services[0]["max_open_fds"], 1024)
+
+    def test_invalid_limits(self):
+        with self.assertRaises(SchemaError):
+            Config("./tests/config_templates/invalid/limits.yaml")
+
+    def test_valid_resources(self):
+        config = Config("./tests/config_templates/valid/resources.yaml")
+        service = config.services[0]
+        self.assertEqual(
+            service["rlimits"]["nproc"], {"soft": 512, "hard": "unlimited"}
+        )
+        self.assertEqual(service["nice"], 10)
+        self.assertEqual(service["ionice"], {"class": "idle"})
+        self.assertEqual(service["cpu_affinity"], "spread")
+
+    def test_invalid_resources(self):
+        with self.assertRaises(SchemaError):
+            Config("./tests/config_templates/invalid/resources.yaml")
+        errors = validator.errors["services"][0][0][0]
+        self.assertEqual(set(errors), {"rlimits", "nice", "cpu_affinity"})
+
+    def test_valid_cgroup(self):
+        config = Config("./tests/config_templates/valid/cgroup.yaml")
+        self.assertEqual(config.services[0]["cgroup"]["memory_high"], "max")
+        self.assertEqual(config.supervisor["cgroup_root"], "/sys/fs/cgroup/taskmaster")
+
+    def test_invalid_cgroup(self):
+        with self.assertRaises(SchemaError):
+            Config("./tests/config_templates/invalid/cgroup.yaml")
+        errors = validator.errors["services"][0][0][0]["cgroup"][0]
+        self.assertEqual(set(errors), {"cpu_max", "memory_max"})
+
+    def test_valid_subreaper(self):
+        config = Config("./tests/config_templates/valid/subreaper.yaml")
+        self.assertEqual(config.supervisor, {"subreaper": True, "kill_orphans": True})
+
+    def test_valid_backoff(self):
+        config = Config("./tests/config_templates/valid/backoff.yaml")
+        self.assertEqual(config.services[0]["backoff"]["strategy"], "exponential")
+        self.assertEqual(
+            config.services[0]["circuit_breaker"], {"failures": 5, "reset_after": 120}
+        )
+
+    def test_invalid_backoff(self):
+        with self.assertRaises(SchemaError):
+            Config("./tests/config_templates/invalid/backoff.yaml")
+        errors = validator.errors["services"][0][0][0]
+        self.assertEqual(set(errors["backoff"][0]), {"strategy", "factor"})
+        self.assertEqual(set(errors["circuit_breaker"][0]), {"failures"})
+
+    def test_valid_metrics(self):
+        config = Config("./tests/config_templates/valid/metrics.yaml")
+        self.assertEqual(config.metrics, {"port": 9101, "lag_interval": 0.5})
+        self.assertIsNone(Config("./tests/config_templates/valid/labels.yaml").metrics)
+
+    def test_invalid_metrics(self):
+        with self.assertRaises(SchemaError):
+            Config("./tests/config_templates/invalid/metrics.yaml")
@@ -0,0 +1,175 @@
+import unittest
+import asyncio
+import os
+import tempfile
+
+from taskmaster.control import ControlClient, ControlError, ControlServer
+from taskmaster.service import ServiceHandler
+from taskmaster.utils.config import Config
+from taskmaster.utils.events import Event, EventKind
+
+
+class TestControl(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        config = Config("./tests/config_templates/valid/service_handler_reference.yaml")
+        self.handler = ServiceHandler(email=None, services=config.services)
+        self.reloads = 0
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "taskmaster.sock")
+
+        async def reload():
+            self.reloads += 1
+            return "Nothing to reload."
+
+        self.server = ControlServer(self.handler, self.path, reload=reload)
+        await self.server.start()
+        self.client = await ControlClient().connect(self.path)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+        await self.handler.delete()
+        self.directory.cleanup()
+
+    async def test_status(self):
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        status = await self.client.request("status")
+        self.assertEqual(status["counts"], {"Stopped": 5})
+        self.assertEqual(
+            [row["name"] for row in status["services"]], ["sleep all", "echo OUIII"]
+        )
+        status = await self.client.request("status", services=["echo OUIII"])
+        self.assertEqual(status["services"], [self.handler.status[1]])
+        self.assertNotIn("autostart_seconds", status)
+        self.handler.status_model.autostart_seconds = 0.25
+        status = await self.client.request("status")
+        self.assertEqual(status["autostart_seconds"], 0.25)
+
+    async def test_socket_in_use(self):
+        other = ControlServer(self.handler, self.path, reload=None)
+        with self.assertRaisesRegex(ControlError, "in use"):
+            await other.start()
+        # The running server keeps its socket
+        self.assertIn("services", await self.client.request("status"))
+
+    async def test_stale_socket(self):
+        await self.client.close()
+        await self.server.close()
+        with open(self.path, "w"):
+            pass
+        umask = os.umask(0)
+        try:
+            await self.server.start()
+            # The umask of the process is restored
+            self.assertEqual(os.umask(0), 0)
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.client = await ControlClient().connect(self.path)
+        self.assertIn("services", await self.client.request("status"))
+
+    async def test_pipelined_requests(self):
+        futures = [
+            self.client.send("start", services=["echo OUIII"]),
+            self.client.send("status", services=["sleep all"]),
+            self.client.send("reload"),
+        ]
+        responses = await asyncio.wait_for(asyncio.gather(*futures), 5)
+        self.assertTrue(all(response["ok"] for response in responses))
+        self.assertEqual(responses[1]["result"]["services"][0]["name"], "sleep all")
+        self.assertEqual(responses[2]["result"], "Nothing to reload.")
+        self.assertEqual(self.reloads, 1)
+        status = await self.client.request("status", services=["echo OUIII"])
+        self.assertEqual(
+            status["services"][0],
+            {
+                "name": "echo OUIII",
+                "cmd": "echo OUIII",
+                "process_1": "Exited",
+                "process_2": "Exited",
+                "process_3": "Exited",
+            },
+        )
+
+    async def test_errors(self):
+        with self.assertRaisesRegex(ControlError, "Unknown command"):
+            await self.client.request("explode")
+        with self.assertRaisesRegex(ControlError, "Unknown services: nope"):
+            await self.client.request("stop", services=["nope"])
+        with self.assertRaisesRegex(ControlError, "list of names"):
+            await self.client.request("stop", services="sleep all")
+
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        writer.write(b"{not json\n[]\n")
+        self.assertIn(b"Invalid JSON", await reader.readline())
+        self.assertIn(b"must be an object", await reader.readline())
+        writer.close()
+        await writer.wait_closed()
+
+        # The connection still works after failed requests
+        self.assertIn("counts", await self.client.request("status"))
+
+    async def test_subscribe_events(self):
+        stream = await self.client.subscribe(services=["echo*"], kinds=["exited"])
+        everything = await self.client.subscribe(services=["sleep all"])
+        await self.client.request("start", services=["echo OUIII"])
+        await asyncio.sleep(0.5)
+        messages = [await asyncio.wait_for(anext(stream), 1) for _ in range(3)]
+        self.assertEqual(
+            {(m["event"]["service"], m["event"]["kind"]) for m in messages},
+            {("echo OUIII", "exited")},
+        )
+        self.assertEqual(messages[0]["event"]["exitcode"], 0)
+        await stream.close()
+        await everything.close()
+        self.assertEqual([message async for message in everything], [])
+        self.assertEqual(self.handler.events._by_pattern, [])
+        self.assertEqual(self.handler.events._by_service, {})
+
+    async def test_status_deltas(self):
+        stream = await self.client.subscribe(
+            services=["echo OUIII"], events=False, interval=0.05, states=True
+        )
+        first = (await asyncio.wait_for(anext(stream), 1))["delta"]
+        self.assertEqual(first["order"], ["echo OUIII"])
+        self.assertEqual(first["changed"][0]["counts"], {"Stopped": 3})
+        await self.client.request("start", services=["sleep all"])
+        await self.client.request("start", services=["echo OUIII"])
+        delta = {}
+        while delta.get("changed", [{}])[0].get("counts") != {"Exited": 3}:
+            delta = (await asyncio.wait_for(anext(stream), 2))["delta"]
+            self.assertNotIn("order", delta)
+            self.assertEqual(
+                [entry["name"] for entry in delta["changed"]], ["echo OUIII"]
+            )
+        self.assertEqual(delta["changed"][0]["states"], ["Exited"] * 3)
+
+    async def test_slow_client_is_bounded(self):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        writer.write(b'{"id": 1, "cmd": "subscribe", "buffer": 5}\n')
+        await writer.drain()
+        response = await reader.readline()
+        self.assertIn(b'"ok": true', response)
+        # Publishing never waits for the client: its buffer drops the oldest
+        for pid in range(10000):
+            self.handler.events.publish(
+                Event(kind=EventKind.SPAWNED, service="sleep all", pid=pid)
+            )
+        messages = [await reader.readline() for _ in range(5)]
+        self.assertIn(b'"pid": 9995', messages[0])
+        self.assertIn(b'"dropped": 9995', messages[0])
+        self.assertIn(b'"pid": 9999', messages[-1])
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_subscribe_errors(self):
+        with self.assertRaisesRegex(ControlError, "kinds"):
+            await self.client.subscribe(kinds=["nope"])
+        with self.assertRaisesRegex(ControlError, "interval"):
+            await self.client.subscribe(interval=0)
+        with self.assertRaisesRegex(ControlError, "Unknown stream"):
+            await self.client.request("unsubscribe", stream=42)
+
+
+if __name__ == "__main__":
+    unittest.main()
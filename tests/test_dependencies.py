@@ -0,0 +1,48 @@
+import unittest
+
+from taskmaster.utils.dependencies import (
+    DependencyError,
+    dependents_of,
+    topological_layers,
+)
+
+
+class TestDependencies(unittest.TestCase):
+    def test_layers(self):
+        layers = topological_layers(
+            {
+                "web": ["database", "cache"],
+                "worker": ["database"],
+                "database": [],
+                "cache": [],
+            }
+        )
+        self.assertEqual(
+            [sorted(layer) for layer in layers],
+            [["cache", "database"], ["web", "worker"]],
+        )
+
+    def test_chain(self):
+        layers = topological_layers({"c": ["b"], "b": ["a"], "a": []})
+        self.assertEqual(layers, [["a"], ["b"], ["c"]])
+
+    def test_cycle(self):
+        with self.assertRaises(DependencyError) as e:
+            topological_layers({"a": ["b"], "b": ["a"], "c": []})
+        self.assertIn("a, b", str(e.exception))
+
+    def test_self_dependency(self):
+        with self.assertRaises(DependencyError):
+            topological_layers({"a": ["a"]})
+
+    def test_unknown(self):
+        with self.assertRaises(DependencyError):
+            topological_layers({"a": ["nonexistent"]})
+
+    def test_dependents(self):
+        self.assertEqual(
+            dependents_of(
+                {"web": ["database"], "worker": ["database"], "database": []}
+            ),
+            {"web": [], "worker": [], "database": ["web", "worker"]},
+        )
@@ -0,0 +1,110 @@
+import unittest
+import asyncio
+
+from taskmaster.service import ServiceHandler
+from taskmaster.utils.config import Config
+from taskmaster.utils.events import DropPolicy, Event, EventBus, EventKind
+
+
+class TestEventBus(unittest.IsolatedAsyncioTestCase):
+    async def test_filters(self):
+        bus = EventBus()
+        everything = bus.subscribe()
+        web = bus.subscribe(services=["web"])
+        running = bus.subscribe(kinds=[EventKind.RUNNING])
+        bus.publish(Event(kind=EventKind.SPAWNED, service="web", pid=1))
+        bus.publish(Event(kind=EventKind.RUNNING, service="db", pid=2))
+        self.assertEqual(len(everything), 2)
+        self.assertEqual((await web.get()).service, "web")
+        self.assertEqual(len(web), 0)
+        self.assertEqual((await running.get()).pid, 2)
+        self.assertEqual(len(bus.history), 2)
+
+    async def test_patterns(self):
+        bus = EventBus()
+        workers = bus.subscribe(patterns=["worker-*", "db"])
+        for service in ["worker-1", "web", "db", "worker-2"]:
+            bus.publish(Event(kind=EventKind.SPAWNED, service=service))
+        self.assertEqual(
+            [(await workers.get()).service for _ in range(len(workers))],
+            ["worker-1", "db", "worker-2"],
+        )
+        workers.close()
+        bus.publish(Event(kind=EventKind.SPAWNED, service="worker-3"))
+        self.assertEqual(len(workers), 0)
+
+    async def test_drop_policies(self):
+        bus = EventBus()
+        oldest = bus.subscribe(maxsize=2, policy=DropPolicy.DROP_OLDEST)
+        newest = bus.subscribe(maxsize=2, policy=DropPolicy.DROP_NEWEST)
+        for pid in range(5):
+            bus.publish(Event(kind=EventKind.SPAWNED, service="web", pid=pid))
+        self.assertEqual(oldest.dropped, 3)
+        self.assertEqual(newest.dropped, 3)
+        self.assertEqual([(await oldest.get()).pid for _ in range(2)], [3, 4])
+        self.assertEqual([(await newest.get()).pid for _ in range(2)], [0, 1])
+
+    async def test_wait_and_close(self):
+        bus = EventBus()
+        subscription = bus.subscribe()
+        received = []
+
+        async def read():
+            async for event in subscription:
+                received.append(event.pid)
+
+        task = asyncio.create_task(read())
+        await asyncio.sleep(0)
+        bus.publish(Event(kind=EventKind.SPAWNED, service="web", pid=1))
+        await asyncio.sleep(0)
+        subscription.close()
+        bus.publish(Event(kind=EventKind.SPAWNED, service="web", pid=2))
+        await asyncio.wait_for(task, 1)
+        self.assertEqual(received, [1])
+
+    async def test_handler(self):
+        bus = EventBus()
+        received = []
+
+        async def handler(event):
+            received.append(event.kind)
+            if event.kind == EventKind.BACKOFF:
+                raise RuntimeError("handler failure")
+
+        subscription = bus.subscribe(handler=handler)
+        bus.publish(Event(kind=EventKind.BACKOFF, service="web"))
+        bus.publish(Event(kind=EventKind.FATAL, service="web"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(received, [EventKind.BACKOFF, EventKind.FATAL])
+        subscription.close()
+
+
+class TestLifecycleEvents(unittest.IsolatedAsyncioTestCase):
+    async def test_process_events(self):
+        config = Config("./tests/config_templates/valid/service_handler_reference.yaml")
+        handler = ServiceHandler(email=None, services=config.services)
+        subscription = handler.events.subscribe(services=["echo OUIII"])
+        asyncio.create_task(handler.start(["echo OUIII"]))
+        await asyncio.sleep(0.5)
+        count = len(subscription)
+        events = [await subscription.get() for _ in range(count)]
+        by_pid = {}
+        for event in events:
+            by_pid.setdefault(event.pid, []).append(event)
+        self.assertEqual(len(by_pid), 3)
+        for pid, process_events in by_pid.items():
+            self.assertIsNotNone(pid)
+            self.assertEqual(
+                [event.kind for event in process_events],
+                [EventKind.SPAWNED, EventKind.RUNNING, EventKind.EXITED],
+            )
+            self.assertIsNone(process_events[0].exitcode)
+            self.assertEqual(process_events[-1].exitcode, 0)
+            self.assertLessEqual(
+                process_events[0].timestamp, process_events[-1].timestamp
+            )
+        await handler.delete()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+import asyncio
+import subprocess
+import sys
+
+from taskmaster.service import ServiceHandler
+from taskmaster.utils.config import Config
+from taskmaster.utils.events import EventKind
+from taskmaster.utils.limits import ResourceGuard, ResourceLimits, parse_size
+from taskmaster.utils.resources import ResourceSampler
+
+MEMORY_HOG = (
+    f'{sys.executable} -c "import time; x = bytearray(64 << 20); time.sleep(30)"'
+)
+
+
+class TestResourceLimits(unittest.TestCase):
+    def test_parse_size(self):
+        self.assertEqual(parse_size(4096), 4096)
+        self.assertEqual(parse_size("512"), 512)
+        self.assertEqual(parse_size("512M"), 512 << 20)
+        self.assertEqual(parse_size("1.5k"), 1536)
+        self.assertEqual(parse_size("2G"), 2 << 30)
+        with self.assertRaises(ValueError):
+            parse_size("512 MB")
+
+    def test_from_config(self):
+        config = Config("./tests/config_templates/valid/limits.yaml")
+        service = type("Service", (), config.services[0])
+        self.assertEqual(
+            ResourceLimits.from_config(service),
+            ResourceLimits(
+                max_rss=512 << 20,
+                max_cpu_percent=90,
+                cpu_seconds=30,
+                max_open_fds=1024,
+            ),
+        )
+        cpu = type("Service", (), {"max_cpu_percent_sustained": 50})
+        self.assertEqual(
+            ResourceLimits.from_config(cpu), ResourceLimits(max_cpu_percent=50)
+        )
+        labels = Config("./tests/config_templates/valid/labels.yaml")
+        self.assertIsNone(
+            ResourceLimits.from_config(type("Service", (), labels.services[0]))
+        )
+
+
+class TestResourceGuard(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.processes = []
+        self.sampler = ResourceSampler(interval=0)
+        self.guard = ResourceGuard(self.sampler)
+        self.reasons = []
+
+    async def asyncTearDown(self):
+        self.sampler.close()
+        for process in self.processes:
+            process.kill()
+            process.wait()
+
+    def watch(self, limits, code="import time; time.sleep(30)"):
+        process = subprocess.Popen([sys.executable, "-c", code])
+        self.processes.append(process)
+        self.guard.watch(
+            process,
+            process.pid,
+            lambda: limits,
+            on_exceeded=self.reasons.append,
+            name="test",
+        )
+        return process
+
+    async def test_memory_and_fds(self):
+        self.watch(ResourceLimits(max_rss=1 << 20))
+        self.watch(ResourceLimits(max_open_fds=1))
+        self.watch(ResourceLimits(max_rss=1 << 30, max_open_fds=1000))
+        self.assertEqual(len(self.sampler), 3)
+        self.sampler.sample()
+        self.assertEqual(len(self.reasons), 2)
+        self.assertRegex(self.reasons[0], r"^max_rss: [0-9.]+M resident, over 1\.0M$")
+        self.assertRegex(self.reasons[1], r"^max_open_fds: [0-9]+ open, over 1$")
+        # Exceeded processes are no longer watched, nor sampled for the guard
+        self.assertEqual(len(self.guard), 1)
+        self.assertEqual(len(self.sampler), 1)
+        self.sampler.sample()
+        self.assertEqual(len(self.reasons), 2)
+
+    async def test_sustained_cpu(self):
+        busy = self.watch(
+            ResourceLimits(max_cpu_percent=20, cpu_seconds=0.2), "while True: pass"
+        )
+        self.watch(ResourceLimits(max_cpu_percent=50, cpu_seconds=0))
+        # Past the start of the interpreters
+        await asyncio.sleep(0.2)
+        self.sampler.sample()
+        for _ in range(2):
+            await asyncio.sleep(0.15)
+            self.sampler.sample()
+        self.assertEqual(self.reasons, [])
+        await asyncio.sleep(0.15)
+        self.sampler.sample()
+        self.assertEqual(len(self.reasons), 1)
+        self.assertRegex(
+            self.reasons[0],
+            r"^max_cpu_percent_sustained: [0-9]+% CPU for 0s, over 20%$",
+        )
+        self.assertNotIn(busy, self.guard)
+
+    async def test_unwatch(self):
+        process = self.watch(ResourceLimits(max_rss=1))
+        self.guard.unwatch(process)
+        self.guard.unwatch(process)
+        self.sampler.sample()
+        self.assertEqual(self.reasons, [])
+        self.assertEqual(len(self.sampler), 0)
+
+
+class TestHandlerLimits(unittest.IsolatedAsyncioTestCase):
+    async def test_restart_over_limit(self):
+        config = Config("./tests/config_templates/valid/service_handler_reference.yaml")
+        service = dict(config.services[0])
+        service.update(
+            cmd=MEMORY_HOG, numprocs=1, starttime=0.1, stoptime=1, max_rss="32M"
+        )
+        handler = ServiceHandler(
+            email=None, services=[service], supervisor={"sample_interval": 0.05}
+        )
+        subscription = handler.events.subscribe(
+            kinds=[EventKind.SPAWNED, EventKind.LIMIT_EXCEEDED]
+        )
+        await handler.start(["sleep all"])
+        events = [await asyncio.wait_for(subscription.get(), 5) for _ in range(3)]
+        self.assertEqual(
+            [event.kind for event in events],
+            [EventKind.SPAWNED, EventKind.LIMIT_EXCEEDED, EventKind.SPAWNED],
+        )
+        self.assertEqual(events[1].pid, events[0].pid)
+        self.assertEqual(events[1].service, "sleep all")
+        self.assertTrue(events[1].reason.startswith("max_rss: "))
+        # Stopped then started again through the normal lifecycle
+        self.assertEqual(events[2].previous, EventKind.STOPPED)
+        subscription.close()
+        await handler.services.get("sleep all").stop()
+        self.assertEqual(len(handler.sampler), 0)
+        await handler.delete()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import asyncio
+
+from taskmaster.metrics import Histogram, Metrics, MetricsServer
+from taskmaster.service import ServiceHandler
+from taskmaster.utils.config import Config
+from taskmaster.utils.events import Event, EventKind
+
+
+class TestHistogram(unittest.TestCase):
+    def test_render(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        self.assertEqual(
+            histogram.render("latency", 'service="web"'),
+            [
+                'latency_bucket{service="web",le="0.1"} 2',
+                'latency_bucket{service="web",le="1"} 3',
+                'latency_bucket{service="web",le="+Inf"} 4',
+                'latency_sum{service="web"} 3.65',
+                'latency_count{service="web"} 4',
+            ],
+        )
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        config = Config("./tests/config_templates/valid/service_handler_reference.yaml")
+        self.handler = ServiceHandler(email=None, services=config.services)
+
+    async def asyncTearDown(self):
+        await self.handler.delete()
+
+    async def test_lifecycle_counters(self):
+        metrics = Metrics(self.handler)
+        publish = self.handler.events.publish
+        publish(
+            Event(EventKind.SPAWNED, "web", 1, timestamp=10, previous=EventKind.STOPPED)
+        )
+        publish(Event(EventKind.RUNNING, "web", 1, timestamp=10.5))
+        publish(Event(EventKind.EXITED, "web", 1, exitcode=3, timestamp=12.5))
+        publish(
+            Event(EventKind.SPAWNED, "web", 2, timestamp=13, previous=EventKind.EXITED)
+        )
+        publish(Event(EventKind.RUNNING, "web", 2, timestamp=13.25))
+        publish(Event(EventKind.LIMIT_EXCEEDED, "web", 2, reason="max_rss"))
+        publish(Event(EventKind.ORPHANED, "web", 7, reason="killed"))
+        publish(Event(EventKind.STOPPING, "web", 2, timestamp=20))
+        publish(Event(EventKind.STOPPED, "web", 2, timestamp=21))
+        self.assertEqual(metrics.spawns, {"web": 2})
+        self.assertEqual(metrics.restarts, {"web": 1})
+        self.assertEqual(metrics.exits, {("web", 3): 1})
+        self.assertEqual(metrics.spawn_latency["web"].count, 2)
+        self.assertEqual(metrics.spawn_latency["web"].sum, 0.75)
+        self.assertEqual(metrics.stop_latency["web"].sum, 1)
+        self.assertEqual(metrics.state_seconds[("web", EventKind.RUNNING)], 8.75)
+        self.assertEqual(metrics._since, {})
+
+        text = metrics.render()
+        self.assertIn('taskmaster_restarts_total{service="web"} 1', text)
+        self.assertIn('taskmaster_exits_total{service="web",code="3"} 1', text)
+        self.assertIn('taskmaster_limit_restarts_total{service="web"} 1', text)
+        self.assertIn('taskmaster_orphans_total{service="web"} 1', text)
+        self.assertIn('taskmaster_stop_seconds_bucket{service="web",le="1"} 1', text)
+        self.assertIn(
+            'taskmaster_processes{service="sleep all",state="stopped"} 2', text
+        )
+        metrics.close()
+        publish(Event(EventKind.SPAWNED, "web", 3))
+        self.assertEqual(metrics.spawns, {"web": 2})
+
+    async def test_autostart_gauge(self):
+        metrics = Metrics(self.handler)
+        self.assertNotIn("taskmaster_autostart_seconds", metrics.render())
+        self.handler.status_model.autostart_seconds = 1.5
+        self.assertIn("\ntaskmaster_autostart_seconds 1.5\n", metrics.render())
+
+    async def test_scrape(self):
+        server = MetricsServer(self.handler, port=0, lag_interval=0.05)
+        await server.start()
+        await self.handler.start(["echo OUIII"])
+        await asyncio.sleep(0.5)
+
+        async def get(path, method="GET"):
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(
+                f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+            )
+            response = await reader.read()
+            writer.close()
+            await writer.wait_closed()
+            return response.decode()
+
+        response = await get("/metrics")
+        self.assertTrue(response.startswith("HTTP/1.1 200 OK\r\n"))
+        self.assertIn("text/plain; version=0.0.4", response)
+        self.assertIn('taskmaster_spawns_total{service="echo OUIII"} 3', response)
+        self.assertIn(
+            'taskmaster_exits_total{service="echo OUIII",code="0"} 3', response
+        )
+        self.assertIn(
+            'taskmaster_spawn_seconds_count{service="echo OUIII"} 3', response
+        )
+        self.assertIn(
+            'taskmaster_stop_leftovers_total{service="echo OUIII"} 0', response
+        )
+        self.assertIn("# TYPE taskmaster_event_loop_lag_seconds histogram", response)
+        self.assertGreater(server.metrics.lag.count, 0)
+
+        self.assertTrue((await get("/")).startswith("HTTP/1.1 404"))
+        self.assertTrue((await get("/metrics", "POST")).startswith("HTTP/1.1 405"))
+        head = await get("/metrics", "HEAD")
+        self.assertTrue(head.endswith("\r\n\r\n"))
+        await server.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import asyncio
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from taskmaster.utils.probes import Probe, ProbeError, ProbeKind
+from taskmaster.utils.process_tree import group_members
+from taskmaster.utils.spawn import spawn
+
+
+class TestProbe(unittest.IsolatedAsyncioTestCase):
+    def test_from_config(self):
+        probe = Probe.from_config({"type": "tcp", "port": 8080, "interval": 0.5})
+        self.assertEqual(probe.kind, ProbeKind.TCP)
+        self.assertEqual(probe.port, 8080)
+        self.assertEqual(probe.host, "127.0.0.1")
+        self.assertEqual(probe.interval, 0.5)
+        self.assertEqual(probe.timeout, 1.0)
+
+    def test_from_config_invalid(self):
+        for config in [
+            {"type": "http"},
+            {"type": "tcp"},
+            {"type": "unix"},
+            {"type": "file"},
+            {"type": "exec"},
+        ]:
+            with self.subTest(config=config):
+                with self.assertRaises(ProbeError):
+                    Probe.from_config(config)
+
+    async def test_tcp(self):
+        server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        probe = Probe(kind=ProbeKind.TCP, port=port)
+        self.assertTrue(await probe.check())
+        server.close()
+        await server.wait_closed()
+        self.assertFalse(await probe.check())
+
+    async def test_unix(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ready.sock")
+            probe = Probe(kind=ProbeKind.UNIX, path=path)
+            self.assertFalse(await probe.check())
+            server = await asyncio.start_unix_server(lambda r, w: w.close(), path)
+            self.assertTrue(await probe.check())
+            server.close()
+            await server.wait_closed()
+
+    async def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ready")
+            probe = Probe(kind=ProbeKind.FILE, path=path)
+            self.assertFalse(await probe.check())
+            with open(path, "w"):
+                pass
+            self.assertTrue(await probe.check(since=time.time() - 1))
+            self.assertFalse(await probe.check(since=time.time() + 10))
+
+    async def test_exec(self):
+        self.assertTrue(await Probe(kind=ProbeKind.EXEC, command="true").check())
+        self.assertFalse(await Probe(kind=ProbeKind.EXEC, command="false").check())
+        self.assertFalse(
+            await Probe(kind=ProbeKind.EXEC, command="nonexistent").check()
+        )
+
+    async def test_exec_timeout(self):
+        probe = Probe(kind=ProbeKind.EXEC, command="sleep 5", timeout=0.1)
+        begin = time.monotonic()
+        self.assertFalse(await probe.check())
+        self.assertLess(time.monotonic() - begin, 1)
+
+    async def test_exec_timeout_kills_the_tree(self):
+        probe = Probe(
+            kind=ProbeKind.EXEC, command="sh -c 'sleep 77 & sleep 77'", timeout=0.2
+        )
+        children = []
+
+        def spawned(*args, **kwargs):
+            children.append(spawn(*args, **kwargs))
+            return children[-1]
+
+        with patch("taskmaster.utils.probes.spawn", spawned):
+            self.assertFalse(await probe.check())
+        pgid = children[0].pid
+        # SIGKILL is delivered asynchronously to the rest of the group
+        for _ in range(50):
+            if not group_members(pgid):
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(group_members(pgid), [])
+
+    async def test_bind(self):
+        probe = Probe.from_config({"type": "exec", "command": "true"})
+        self.assertIsNone(probe.plan)
+        bound = probe.bind(workingdir="/tmp")
+        self.assertEqual(bound.plan.cwd, "/tmp")
+        self.assertTrue(await bound.check())
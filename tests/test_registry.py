@@ -0,0 +1,88 @@
+import unittest
+import asyncio
+
+from taskmaster.service import Service, SubProcess
+from taskmaster.utils.config import Config
+from taskmaster.utils.registry import ServiceRegistry
+
+
+class TestServiceRegistry(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.config = Config(
+            "./tests/config_templates/valid/service_reference.yaml"
+        ).services[0]
+
+    def service(self, name, labels=None, cmd=None):
+        config = dict(self.config)
+        config.update(name=name, labels=labels or [], stdout=None, stderr=None)
+        if cmd:
+            config["cmd"] = cmd
+        return Service(**config)
+
+    async def test_lookup_and_order(self):
+        registry = ServiceRegistry(
+            [self.service("a"), self.service("b"), self.service("c")]
+        )
+        self.assertEqual(len(registry), 3)
+        self.assertIn("b", registry)
+        self.assertIsNone(registry.get("d"))
+        self.assertEqual(registry.names(), ["a", "b", "c"])
+        self.assertEqual(
+            [service.config.name for service in registry.select(["c", "a", "d"])],
+            ["a", "c"],
+        )
+        registry.reorder(["c", "a"])
+        self.assertEqual(registry.names(), ["c", "a", "b"])
+        self.assertEqual(
+            [service.config.name for service in registry.select(["a", "c"])],
+            ["c", "a"],
+        )
+        removed = registry.remove("a")
+        self.assertEqual(removed.config.name, "a")
+        self.assertIsNone(removed.on_state_change)
+        self.assertEqual(registry.names(), ["c", "b"])
+
+    async def test_labels(self):
+        web = self.service("web", labels=["frontend", "critical"])
+        database = self.service("database", labels=["critical"])
+        registry = ServiceRegistry([web, database])
+        self.assertEqual(registry.with_label("critical"), [web, database])
+        self.assertEqual(registry.with_label("frontend"), [web])
+        self.assertEqual(registry.with_label("unknown"), [])
+
+        config = dict(web.config)
+        config["labels"] = ["backend"]
+        web.config = config
+        registry.refresh(web)
+        self.assertEqual(registry.with_label("critical"), [database])
+        self.assertEqual(registry.with_label("backend"), [web])
+
+    async def test_state_index(self):
+        sleep = self.service("sleep", cmd="sleep 2")
+        stopped = self.service("stopped")
+        registry = ServiceRegistry([sleep, stopped])
+        self.assertEqual(registry.in_state(SubProcess.State.STOPPED), [sleep, stopped])
+
+        asyncio.create_task(sleep.start())
+        await asyncio.sleep(0.1)
+        self.assertEqual(registry.in_state(SubProcess.State.STARTING), [sleep])
+        self.assertEqual(registry.in_state(SubProcess.State.STOPPED), [stopped])
+        self.assertEqual(sleep.state_counts, {SubProcess.State.STARTING: 1})
+
+        await asyncio.sleep(1.1)
+        self.assertEqual(registry.in_state(SubProcess.State.RUNNING), [sleep])
+        self.assertEqual(registry.in_state(SubProcess.State.STARTING), [])
+
+        await sleep.stop()
+        self.assertEqual(registry.in_state(SubProcess.State.RUNNING), [])
+        self.assertEqual(registry.in_state(SubProcess.State.STOPPED), [sleep, stopped])
+
+        registry.remove("stopped")
+        self.assertEqual(registry.in_state(SubProcess.State.STOPPED), [sleep])
+        await sleep.delete()
+        self.assertEqual(sleep.state_counts, {})
+        self.assertEqual(registry.in_state(SubProcess.State.STOPPED), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from taskmaster.utils.reload_plan import Action, ReloadPlan, ServiceDiff
+
+
+def service(**config):
+    base = {
+        "name": "web",
+        "cmd": "sleep 10",
+        "numprocs": 2,
+        "autostart": True,
+        "stdout": "/tmp/web.stdout",
+        "env": {"A": "1"},
+        "depends_on": [],
+    }
+    base.update(config)
+    return base
+
+
+class TestReloadPlan(unittest.TestCase):
+    def test_nothing_changed(self):
+        diff = ServiceDiff.compute(service(), service())
+        self.assertEqual(diff.action, Action.NONE)
+        self.assertEqual(diff.fields, ())
+
+    def test_empty_values_are_equal(self):
+        diff = ServiceDiff.compute(service(depends_on=[]), service(depends_on=None))
+        self.assertEqual(diff.action, Action.NONE)
+
+    def test_respawn(self):
+        diff = ServiceDiff.compute(service(), service(env={"A": "2"}, numprocs=4))
+        self.assertEqual(diff.action, Action.RESPAWN)
+        self.assertEqual(set(diff.fields), {"env", "numprocs"})
+        self.assertEqual(diff.numprocs, (2, 4))
+        self.assertEqual(str(diff), "web: respawn (env, numprocs 2 -> 4)")
+
+    def test_resource_settings_respawn(self):
+        diff = ServiceDiff.compute(service(), service(nice=10))
+        self.assertEqual(diff.action, Action.RESPAWN)
+
+    def test_restart(self):
+        diff = ServiceDiff.compute(service(), service(stdout="/tmp/other.stdout"))
+        self.assertEqual(diff.action, Action.RESTART)
+
+    def test_scale(self):
+        diff = ServiceDiff.compute(service(), service(numprocs=1))
+        self.assertEqual(diff.action, Action.SCALE)
+        self.assertEqual(str(diff), "web: scale (numprocs 2 -> 1)")
+
+    def test_update(self):
+        diff = ServiceDiff.compute(service(), service(autostart=False))
+        self.assertEqual(diff.action, Action.UPDATE)
+        self.assertEqual(diff.fields, ("autostart",))
+
+    def test_plan(self):
+        plan = ReloadPlan.compute(
+            [service(), service(name="db"), service(name="old")],
+            [service(name="db"), service(name="new"), service(cmd="sleep 20")],
+        )
+        self.assertEqual(
+            [(diff.name, diff.action) for diff in plan.diffs],
+            [
+                ("db", Action.NONE),
+                ("new", Action.ADD),
+                ("web", Action.RESPAWN),
+                ("old", Action.REMOVE),
+            ],
+        )
+        self.assertEqual(len(plan.changes), 3)
+        self.assertEqual(
+            str(plan),
+            "Reload plan: 3 of 4 services change.\n"
+            "  new: add\n"
+            "  web: respawn (cmd)\n"
+            "  old: remove",
+        )
+
+    def test_empty_plan(self):
+        plan = ReloadPlan.compute([service()], [service()])
+        self.assertEqual(plan.changes, [])
+        self.assertEqual(str(plan), "Reload plan: nothing to do.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import asyncio
+import subprocess
+import sys
+
+from taskmaster.service import ServiceHandler
+from taskmaster.utils.config import Config
+from taskmaster.utils.resources import ResourceSampler
+
+
+class TestResourceSampler(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.processes = []
+
+    async def asyncTearDown(self):
+        for process in self.processes:
+            process.kill()
+            process.wait()
+
+    def spawn(self, code="import time; time.sleep(30)"):
+        process = subprocess.Popen([sys.executable, "-c", code])
+        self.processes.append(process)
+        return process.pid
+
+    async def test_sample(self):
+        sampler = ResourceSampler(interval=0, max_open=1)
+        busy, idle, other = self.spawn("while True: pass"), self.spawn(), self.spawn()
+        sampler.track(busy, "busy")
+        sampler.track(idle, "idle")
+        sampler.track(other, "idle")
+        sampler.sample()
+        await asyncio.sleep(0.3)
+        sampler.sample()
+        self.assertEqual(sampler.version, 2)
+        self.assertGreater(sampler.process(busy).cpu_percent, 20)
+        self.assertLess(sampler.process(idle).cpu_percent, 20)
+        usage = sampler.service("idle")
+        self.assertEqual(usage.processes, 2)
+        self.assertGreater(usage.rss, 1 << 20)
+        self.assertGreaterEqual(usage.fds, 6)
+        self.assertGreaterEqual(usage.threads, 2)
+
+        # The last process takes the slot of the removed one
+        sampler.untrack(busy)
+        self.assertIsNone(sampler.process(busy))
+        self.assertEqual(sampler.process(other).processes, 1)
+        sampler.sample()
+        self.assertNotIn("busy", sampler.services())
+        sampler.close()
+        self.assertEqual(len(sampler), 0)
+
+    async def test_gone_process(self):
+        sampler = ResourceSampler(interval=0)
+        pid = self.spawn()
+        sampler.track(pid, "gone")
+        self.processes[0].kill()
+        self.processes[0].wait()
+        sampler.sample()
+        self.assertEqual(sampler.process(pid).cpu_percent, 0)
+        sampler.close()
+
+
+class TestHandlerSampler(unittest.IsolatedAsyncioTestCase):
+    async def test_follows_lifecycle(self):
+        config = Config("./tests/config_templates/valid/service_handler_reference.yaml")
+        handler = ServiceHandler(
+            email=None,
+            services=config.services,
+            supervisor={"sample_interval": 0.05},
+        )
+        passes = []
+        handler.sampler.listen(lambda sampler: passes.append(sampler.version))
+        asyncio.create_task(handler.start(["sleep all"]))
+        await asyncio.sleep(0.3)
+        self.assertEqual(len(handler.sampler), 2)
+        self.assertGreater(len(passes), 1)
+        self.assertEqual(handler.sampler.service("sleep all").processes, 2)
+        await handler.services.get("sleep all").stop()
+        self.assertEqual(len(handler.sampler), 0)
+        await handler.delete()
+
+
+if __name__ == "__main__":
+    unittest.main()
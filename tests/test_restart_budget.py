@@ -0,0 +1,131 @@
+import unittest
+import asyncio
+import os
+import tempfile
+
+from taskmaster.control import ControlClient, ControlServer
+from taskmaster.service import ServiceHandler
+from taskmaster.utils.config import Config
+from taskmaster.utils.events import EventKind
+from taskmaster.utils.restart_budget import RestartBudget
+
+
+class TestRestartBudget(unittest.IsolatedAsyncioTestCase):
+    async def test_burst_then_queued(self):
+        budget = RestartBudget(rate=20, burst=2)
+        await budget.acquire("web")
+        await budget.acquire("web")
+        self.assertEqual(budget.throttled, {})
+        task = asyncio.create_task(budget.acquire("web"))
+        await asyncio.sleep(0)
+        self.assertEqual(budget.waiting, 1)
+        await asyncio.wait_for(task, 1)
+        self.assertEqual(budget.waiting, 0)
+        self.assertEqual(budget.throttled, {"web": 1})
+
+    async def test_priority_order(self):
+        budget = RestartBudget(rate=50, burst=1)
+        await budget.acquire("first")
+        order = []
+
+        async def restart(name, priority):
+            await budget.acquire(name, priority)
+            order.append(name)
+
+        tasks = [
+            asyncio.create_task(restart("worker", 500)),
+            asyncio.create_task(restart("cache", 100)),
+            asyncio.create_task(restart("database", 1)),
+        ]
+        await asyncio.sleep(0)
+        self.assertEqual(budget.waiting, 3)
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        # Queued before the first token came back, served by priority
+        self.assertEqual(order, ["database", "cache", "worker"])
+
+    async def test_cancelled(self):
+        budget = RestartBudget(rate=20, burst=1)
+        await budget.acquire("web")
+        cancelled = asyncio.create_task(budget.acquire("web"))
+        waiting = asyncio.create_task(budget.acquire("db"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.wait_for(waiting, 1)
+        self.assertEqual(budget.waiting, 0)
+
+
+class TestHandlerRestartBudget(unittest.IsolatedAsyncioTestCase):
+    async def test_restart_storm(self):
+        config = Config("./tests/config_templates/valid/service_handler_reference.yaml")
+        service = dict(config.services[1])
+        service.update(
+            cmd="sh -c 'sleep 0.05; exit 1'",
+            numprocs=4,
+            autostart=True,
+            backoff={"base": 0.01},
+        )
+        handler = ServiceHandler(
+            email=None,
+            services=[service],
+            supervisor={"max_restarts_per_second": 5, "restart_burst": 1},
+        )
+        spawns = []
+        handler.events.listen(
+            lambda event: event.kind == EventKind.SPAWNED and spawns.append(event)
+        )
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "taskmaster.sock")
+        server = ControlServer(handler, path)
+        await server.start()
+        try:
+            await handler.start()
+            await asyncio.sleep(0.5)
+            # 4 starts, then a restart every 0.2 seconds
+            self.assertLessEqual(len(spawns), 4 + 4)
+            self.assertGreater(handler.restart_budget.waiting, 0)
+            async with await ControlClient().connect(path) as client:
+                status = await client.request("status")
+            self.assertEqual(
+                status["restarts"]["queued"], handler.restart_budget.waiting
+            )
+            self.assertGreater(status["restarts"]["throttled"], 0)
+        finally:
+            await handler.stop()
+            await asyncio.sleep(0.2)
+            await server.close()
+            await handler.delete()
+            directory.cleanup()
+
+    async def test_expected_exits_take_no_token(self):
+        config = Config("./tests/config_templates/valid/service_handler_reference.yaml")
+        services = []
+        for index in range(6):
+            service = dict(config.services[1])
+            service.update(
+                name=f"true {index}",
+                cmd="true",
+                numprocs=1,
+                autostart=True,
+                starttime=0,
+                startretries=3,
+                autorestart="never",
+                exitcodes=[0],
+                backoff={"base": 0.01},
+            )
+            services.append(service)
+        handler = ServiceHandler(
+            email=None,
+            services=services,
+            supervisor={"max_restarts_per_second": 1, "restart_burst": 1},
+        )
+        try:
+            await handler.start()
+            await asyncio.sleep(0.3)
+            self.assertEqual(handler.restart_budget.throttled, {})
+            self.assertEqual(handler.restart_budget.waiting, 0)
+        finally:
+            await handler.delete()
+
+
+if __name__ == "__main__":
+    unittest.main()
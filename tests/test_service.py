@@ -73,7 +73,7 @@ class TestService(unittest.IsolatedAsyncioTestCase):
         asyncio.create_task(service.start())
         await asyncio.sleep(0.1)
         asyncio.create_task(service.restart())
-        await asyncio.sleep(1.1)
+        await asyncio.sleep(0.5)
         self.assertEqual(service.status.get("process_1"), SubProcess.State.STARTING)
         await asyncio.sleep(1)
         self.assertEqual(service.status.get("process_1"), SubProcess.State.RUNNING)
@@ -86,7 +86,7 @@ class TestService(unittest.IsolatedAsyncioTestCase):
         asyncio.create_task(service.start())
         await asyncio.sleep(0.01)
         asyncio.create_task(service.restart())
-        await asyncio.sleep(1.1)
+        await asyncio.sleep(0.5)
         self.assertEqual(service.status.get("process_1"), SubProcess.State.STARTING)
         await asyncio.sleep(1)
         self.assertEqual(service.status.get("process_1"), SubProcess.State.RUNNING)
@@ -105,6 +105,17 @@ class TestService(unittest.IsolatedAsyncioTestCase):
         await asyncio.sleep(1)
         self.assertEqual(service.status.get("process_1"), SubProcess.State.STARTING)
 
+    async def test_done_tasks_are_dropped(self):
+        config = self.config
+        config["cmd"] = "true"
+        config["starttime"] = 0
+        config["autorestart"] = "never"
+        service = Service(**config)
+        await service.start()
+        await service.wait()
+        await asyncio.sleep(0)
+        self.assertEqual(service._wait_tasks, [])
+
     async def test_autorestart_unexpected_should_restart(self):
         config = self.config
         config["autorestart"] = "unexpected"
@@ -324,6 +335,137 @@ class TestService(unittest.IsolatedAsyncioTestCase):
         await service.reload()
         self.assertEqual(service.status.get("process_1"), SubProcess.State.RUNNING)
 
+    async def test_invalid_plan_fails_without_retries(self):
+        config = self.config
+        config["cmd"] = "nonexistent"
+        service = Service(**config)
+        self.assertIsNone(service.plan)
+        await asyncio.wait_for(service.start(), 0.1)
+        self.assertEqual(service.status.get("process_1"), SubProcess.State.FATAL)
+
+    async def test_reload_rejects_invalid_plan(self):
+        config = Config("./tests/config_templates/valid/test_reload.yml").services[0]
+        service = Service(**config)
+        await service.start()
+        plan = service.plan
+        service.config = dict(config, cmd="nonexistent")
+        await service.reload()
+        self.assertEqual(service.config.cmd, "sleep 100")
+        self.assertIs(service.plan, plan)
+        self.assertEqual(service.status.get("process_1"), SubProcess.State.RUNNING)
+        await service.stop()
+
+    async def test_liveness_restarts_unresponsive_process(self):
+        config = Config("./tests/config_templates/valid/test_reload.yml").services[0]
+        config["starttime"] = 0
+        config["stopsignal"] = "TERM"
+        config["liveness"] = {
+            "type": "file",
+            "path": "/nonexistent",
+            "interval": 0.05,
+            "failure_threshold": 2,
+        }
+        service = Service(**config)
+        await service.start()
+        pid = service._processes[0].pid
+        self.assertIn(service._processes[0], service.watchdog)
+        await asyncio.sleep(0.3)
+        self.assertEqual(service.status.get("process_1"), SubProcess.State.RUNNING)
+        self.assertNotEqual(service._processes[0].pid, pid)
+        await service.stop()
+        self.assertEqual(len(service.watchdog), 0)
+
+    async def test_reload_liveness(self):
+        config = Config("./tests/config_templates/valid/test_reload.yml").services[0]
+        config.update(starttime=0, numprocs=1, stopsignal="TERM")
+        service = Service(**config)
+        await service.start()
+        process = service._processes[0]
+        pid = process.pid
+        self.assertNotIn(process, service.watchdog)
+        config = dict(config)
+        config["liveness"] = {
+            "type": "file",
+            "path": "/nonexistent",
+            "interval": 0.05,
+            "failure_threshold": 2,
+        }
+        service.config = config
+        await service.reload()
+        self.assertIn(process, service.watchdog)
+        await asyncio.sleep(0.5)
+        # Restarted by the probe added by the reload
+        self.assertNotEqual(process.pid, pid)
+        self.assertEqual(process.state, SubProcess.State.RUNNING)
+        del config["liveness"]
+        service.config = config
+        await service.reload()
+        self.assertNotIn(process, service.watchdog)
+        await service.stop()
+
+    async def test_resource_settings(self):
+        config = Config("./tests/config_templates/valid/test_reload.yml").services[0]
+        config.update(starttime=0, numprocs=3, stopsignal="TERM")
+        config.update(nice=3, cpu_affinity="spread", rlimits={"core": 0})
+        service = Service(**config)
+        await service.start()
+        cpus = sorted(os.sched_getaffinity(0))
+        for index, process in enumerate(service._processes):
+            self.assertEqual(process.index, index)
+            self.assertEqual(os.getpriority(os.PRIO_PROCESS, process.pid), 3)
+            self.assertEqual(
+                os.sched_getaffinity(process.pid), {cpus[index % len(cpus)]}
+            )
+        await service.stop()
+
+    async def _watch_rolling(self, service, task):
+        unavailable = 0
+        while not task.done():
+            unavailable = max(
+                unavailable,
+                sum(
+                    status != SubProcess.State.RUNNING
+                    for key, status in service.status.items()
+                    if key.startswith("process_")
+                ),
+            )
+            await asyncio.sleep(0.02)
+        await task
+        return unavailable
+
+    async def test_rolling_restart(self):
+        config = Config("./tests/config_templates/valid/test_reload.yml").services[0]
+        config["numprocs"] = 4
+        config["starttime"] = 0.2
+        config["stopsignal"] = "TERM"
+        config["max_unavailable"] = "50%"
+        service = Service(**config)
+        await service.start()
+        self.assertEqual(service.max_unavailable, 2)
+        pids = {process.pid for process in service._processes}
+        task = asyncio.create_task(service.restart())
+        self.assertEqual(await self._watch_rolling(service, task), 2)
+        for process in service._processes:
+            self.assertEqual(process.state, SubProcess.State.RUNNING)
+            self.assertNotIn(process.pid, pids)
+        await service.stop()
+
+    async def test_rolling_reload_change_cmd(self):
+        config = Config("./tests/config_templates/valid/test_reload.yml").services[0]
+        config["numprocs"] = 3
+        config["starttime"] = 0.1
+        config["stopsignal"] = "TERM"
+        config["max_unavailable"] = 1
+        service = Service(**config)
+        await service.start()
+        service.config = dict(config, cmd="sleep 50")
+        task = asyncio.create_task(service.reload())
+        self.assertEqual(await self._watch_rolling(service, task), 1)
+        for process in service._processes:
+            self.assertEqual(process.state, SubProcess.State.RUNNING)
+            self.assertEqual(process.config["cmd"], "sleep 50")
+        await service.stop()
+
     async def test_send_email_on_start_one_proc(self):
         config = Config("./tests/config_templates/valid/test_send_email.yml").services[
             0
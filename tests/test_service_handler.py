@@ -1,9 +1,13 @@
 import unittest
 import asyncio
+import os
 from typing import Any, Dict
 
-from taskmaster.service import ServiceHandler
+from taskmaster.service import ServiceHandler, SubProcess
+from taskmaster.utils.child_watcher import ChildWatcher
 from taskmaster.utils.config import Config
+from taskmaster.utils.events import EventKind
+from taskmaster.utils.reload_plan import Action
 
 
 class TestServiceHandler(unittest.IsolatedAsyncioTestCase):
@@ -327,6 +331,74 @@ class TestServiceHandler(unittest.IsolatedAsyncioTestCase):
             },
         )
 
+    async def test_services_registry(self):
+        config = self.config
+        config["services"][1]["labels"] = ["echo"]
+        handler = ServiceHandler(email=None, **config)
+        self.assertEqual(handler.services.names(), ["sleep all", "echo OUIII"])
+        self.assertEqual(
+            [service.config.name for service in handler.services.with_label("echo")],
+            ["echo OUIII"],
+        )
+        asyncio.create_task(handler.start(["sleep all"]))
+        await asyncio.sleep(1.2)
+        self.assertEqual(
+            [
+                service.config.name
+                for service in handler.services.in_state(SubProcess.State.RUNNING)
+            ],
+            ["sleep all"],
+        )
+        config["services"][0]["labels"] = ["echo"]
+        handler.config = config
+        await handler.reload()
+        self.assertEqual(
+            [service.config.name for service in handler.services.with_label("echo")],
+            ["sleep all", "echo OUIII"],
+        )
+        await handler.delete()
+        self.assertEqual(len(handler.services), 0)
+
+    async def test_plan_reload_is_a_dry_run(self):
+        config = self.config
+        handler = ServiceHandler(email=None, **config)
+        asyncio.create_task(handler.start())
+        await asyncio.sleep(1.2)
+        config["services"][0]["cmd"] = "echo 'fake command'"
+        config["services"][1]["numprocs"] = 1
+        handler.config = config
+        plan = handler.plan_reload()
+        self.assertEqual(
+            [(diff.name, diff.action) for diff in plan.changes],
+            [("sleep all", Action.RESPAWN), ("echo OUIII", Action.SCALE)],
+        )
+        await asyncio.sleep(0.1)
+        self.assertEqual(handler.status[0]["cmd"], "sleep 2")
+        self.assertEqual(handler.status[0]["process_1"], "Running")
+        self.assertEqual(len(handler.status[1]), 5)
+        await handler.delete()
+
+    async def test_reload_only_changed_services(self):
+        config = self.config
+        handler = ServiceHandler(email=None, **config)
+        asyncio.create_task(handler.start())
+        await asyncio.sleep(1.2)
+        config["services"][1]["cmd"] = "echo 'fake command'"
+        handler.config = config
+        asyncio.create_task(handler.reload())
+        await asyncio.sleep(0.1)
+        # The sleep service did not change: its processes keep running
+        self.assertEqual(
+            handler.status[0],
+            {
+                "name": "sleep all",
+                "cmd": "sleep 2",
+                "process_1": "Running",
+                "process_2": "Running",
+            },
+        )
+        await handler.delete()
+
     async def test_reload_update_service_with_autostart_false(self):
         config = self.config
         handler = ServiceHandler(email=None, **config)
@@ -357,6 +429,57 @@ class TestServiceHandler(unittest.IsolatedAsyncioTestCase):
             },
         )
 
+    async def test_autostart_by_priority_with_limits(self):
+        config = self.config
+        config["supervisor"] = {"max_concurrent_starts": 1}
+        config["services"][0]["starttime"] = 0.1
+        config["services"][0]["priority"] = 10
+        config["services"][1]["cmd"] = "sleep 5"
+        config["services"][1]["autostart"] = True
+        config["services"][1]["starttime"] = 0.1
+        config["services"][1]["priority"] = 1
+        handler = ServiceHandler(email=None, **config)
+        task = asyncio.create_task(handler.autostart())
+        await asyncio.sleep(0.05)
+        self.assertEqual(handler.status[0]["process_1"], "Stopped")
+        self.assertEqual(handler.scheduler.active, 1)
+        await task
+        self.assertIsNotNone(handler.autostart_duration)
+        self.assertGreaterEqual(handler.autostart_duration, 0.5)
+        self.assertEqual(
+            handler.status_model.autostart_seconds, handler.autostart_duration
+        )
+        self.assertEqual(handler.status[0]["process_2"], "Running")
+        self.assertEqual(handler.status[1]["process_3"], "Running")
+        await handler.delete()
+
+    async def test_dependencies_order(self):
+        config = Config("./tests/config_templates/valid/depends_on.yaml")
+        handler = ServiceHandler(email=None, services=config.services)
+        task = asyncio.create_task(handler.autostart())
+        await asyncio.sleep(0.15)
+        web, database, cache = handler.status
+        self.assertEqual(web["process_1"], "Stopped")
+        self.assertEqual(database["process_1"], "Starting")
+        # Not autostarted, but started for web
+        self.assertEqual(cache["process_1"], "Running")
+        await task
+        web, database, cache = handler.status
+        self.assertEqual(web["process_1"], "Running")
+        self.assertEqual(database["process_1"], "Running")
+
+        await handler.stop(["web", "database"])
+        await asyncio.sleep(0.15)
+        web, database, cache = handler.status
+        self.assertEqual(web["process_1"], "Stopping")
+        self.assertEqual(database["process_1"], "Running")
+        await asyncio.sleep(0.3)
+        web, database, cache = handler.status
+        self.assertEqual(web["process_1"], "Stopped")
+        self.assertEqual(database["process_1"], "Stopped")
+        self.assertEqual(cache["process_1"], "Running")
+        await handler.delete()
+
     async def test_delete(self):
         config = self.config
         handler = ServiceHandler(email=None, **config)
@@ -364,3 +487,28 @@ class TestServiceHandler(unittest.IsolatedAsyncioTestCase):
         await asyncio.sleep(1)
         await handler.delete()
         self.assertEqual(handler.status, [])
+
+    async def test_kill_orphans(self):
+        config = Config("./tests/config_templates/valid/subreaper.yaml")
+        handler = ServiceHandler(
+            email=None, services=config.services, supervisor=config.supervisor
+        )
+        subscription = handler.events.subscribe(kinds=[EventKind.ORPHANED])
+        try:
+            await handler.start()
+            await asyncio.sleep(0.2)
+            ChildWatcher.current().sweep_orphans()
+            event = await asyncio.wait_for(subscription.get(), 1)
+            self.assertEqual(event.service, "daemon")
+            self.assertEqual(event.reason, "killed")
+            self.assertIsNone(event.exitcode)
+            self.assertEqual(handler.status[0]["orphans"], "1")
+            await asyncio.sleep(0.1)
+            # Reaped once killed
+            self.assertEqual(ChildWatcher.current().orphans, {})
+            with self.assertRaises(ProcessLookupError):
+                os.kill(event.pid, 0)
+        finally:
+            subscription.close()
+            await handler.services.get("daemon").stop()
+            await handler.delete()
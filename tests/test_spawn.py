@@ -0,0 +1,173 @@
+import unittest
+import os
+import resource
+import shutil
+import sys
+
+from taskmaster.utils.child_watcher import ChildWatcher
+from taskmaster.utils.spawn import (
+    SpawnBackend,
+    SpawnPath,
+    SpawnPlan,
+    SpawnPlanError,
+    can_posix_spawn,
+    spawn,
+)
+
+
+class TestSpawnPlan(unittest.TestCase):
+    def test_compile(self):
+        plan = SpawnPlan.compile(
+            cmd="echo 'Hello, World!'", umask=0o77, workingdir="/tmp", env={"a": 1}
+        )
+        self.assertEqual(plan.argv, ("echo", "Hello, World!"))
+        self.assertTrue(os.path.isabs(plan.executable))
+        self.assertEqual(plan.cwd, "/tmp")
+        self.assertEqual(plan.umask, 0o77)
+        self.assertEqual(plan.env["a"], "1")
+        self.assertEqual(plan.env.get("PATH"), os.environ.get("PATH"))
+        self.assertIsNone(plan.uid)
+
+    def test_plan_is_immutable(self):
+        plan = SpawnPlan.compile(cmd="true", workingdir="/tmp")
+        with self.assertRaises(AttributeError):
+            plan.cwd = "/"  # type: ignore
+        with self.assertRaises(TypeError):
+            plan.env["a"] = "b"  # type: ignore
+
+    def test_relative_executable(self):
+        plan = SpawnPlan.compile(cmd="./sigkill.out", workingdir="./tests/programs")
+        self.assertEqual(
+            plan.executable, os.path.abspath("./tests/programs/sigkill.out")
+        )
+
+    def test_current_user_needs_no_privilege_change(self):
+        import pwd
+
+        user = pwd.getpwuid(os.geteuid()).pw_name
+        plan = SpawnPlan.compile(cmd="true", user=user)
+        self.assertIsNone(plan.uid)
+        self.assertEqual(plan.user, user)
+
+    def test_invalid(self):
+        invalid = [
+            dict(cmd=""),
+            dict(cmd="echo 'unterminated"),
+            dict(cmd="nonexistent"),
+            dict(cmd="./nonexistent", workingdir="/tmp"),
+            dict(cmd="sleep 5", workingdir="/nonexistent"),
+            dict(cmd="sleep 5", user="nonexistent"),
+            dict(cmd="sleep 5", umask="022"),
+            dict(cmd="sleep 5", rlimits={"stack": 1024}),
+            dict(cmd="sleep 5", rlimits={"nofile": {"soft": 20, "hard": 10}}),
+            dict(cmd="sleep 5", rlimits={"as": "2 GB"}),
+            dict(cmd="sleep 5", nice=20),
+            dict(cmd="sleep 5", ionice={"class": "fast"}),
+            dict(cmd="sleep 5", ionice={"class": "idle", "level": 8}),
+            dict(cmd="sleep 5", cpu_affinity=[os.cpu_count() + 1]),
+            dict(cmd="sleep 5", cpu_affinity="even"),
+        ]
+        for config in invalid:
+            with self.subTest(config=config):
+                with self.assertRaises(SpawnPlanError):
+                    SpawnPlan.compile(**config)
+
+    def test_resources(self):
+        plan = SpawnPlan.compile(
+            cmd="true",
+            rlimits={
+                "nofile": 256,
+                "as": "1G",
+                "core": {"soft": 0, "hard": "unlimited"},
+            },
+            nice=5,
+            ionice={"class": "best-effort"},
+            cpu_affinity=[0],
+        )
+        self.assertEqual(
+            plan.rlimits,
+            (
+                (resource.RLIMIT_NOFILE, 256, 256),
+                (resource.RLIMIT_AS, 1 << 30, 1 << 30),
+                (resource.RLIMIT_CORE, 0, resource.RLIM_INFINITY),
+            ),
+        )
+        self.assertEqual(plan.nice, 5)
+        self.assertEqual(plan.ioprio, 2 << 13 | 4)
+        self.assertEqual(plan.cpus_of(3), (0,))
+        self.assertTrue(plan.has_resources)
+        self.assertFalse(can_posix_spawn(plan))
+        self.assertFalse(SpawnPlan.compile(cmd="true").has_resources)
+
+    def test_spread(self):
+        plan = SpawnPlan.compile(cmd="true", cpu_affinity="spread")
+        cpus = sorted(os.sched_getaffinity(0))
+        self.assertTrue(plan.spread)
+        for index in range(2 * len(cpus) + 1):
+            self.assertEqual(plan.cpus_of(index), (cpus[index % len(cpus)],))
+
+
+class TestSpawn(unittest.IsolatedAsyncioTestCase):
+    def _plan(self, cmd: str, workingdir: str) -> SpawnPlan:
+        umask = os.umask(0)
+        os.umask(umask)
+        return SpawnPlan.compile(cmd=cmd, umask=umask, workingdir=workingdir)
+
+    async def _run(self, plan, backend, **outputs):
+        child = spawn(plan, backend=backend, **outputs)
+        child.set_returncode(await ChildWatcher.current().watch(child.pid))
+        return child
+
+    async def test_posix_spawn(self):
+        with open("/tmp/posix_spawn.stdout", "w+") as f:
+            plan = self._plan("echo 'Hello, World!'", os.getcwd())
+            self.assertTrue(can_posix_spawn(plan))
+            child = await self._run(plan, SpawnBackend.FAST, stdout=f)
+        self.assertEqual(child.path, SpawnPath.POSIX_SPAWN)
+        self.assertEqual(child.returncode, 0)
+        with open("/tmp/posix_spawn.stdout") as f:
+            self.assertEqual(f.read(), "Hello, World!\n")
+
+    async def test_fork_exec_when_cwd_differs(self):
+        plan = self._plan("sh -c 'exit 3'", "/tmp")
+        self.assertFalse(can_posix_spawn(plan))
+        child = await self._run(plan, SpawnBackend.FAST)
+        self.assertEqual(child.path, SpawnPath.FORK_EXEC)
+        self.assertEqual(child.returncode, 3)
+
+    async def test_fork_backend(self):
+        plan = self._plan("true", os.getcwd())
+        child = await self._run(plan, SpawnBackend.FORK)
+        self.assertEqual(child.path, SpawnPath.FORK)
+        self.assertEqual(child.returncode, 0)
+
+    async def test_resources_applied_before_exec(self):
+        cpus = sorted(os.sched_getaffinity(0))
+        code = (
+            "import os, resource; "
+            "print(resource.getrlimit(resource.RLIMIT_NOFILE), "
+            "os.getpriority(os.PRIO_PROCESS, 0), sorted(os.sched_getaffinity(0)))"
+        )
+        plan = SpawnPlan.compile(
+            cmd=f'{sys.executable} -c "{code}"',
+            rlimits={"nofile": {"soft": 64, "hard": 128}},
+            nice=7,
+            cpu_affinity="spread",
+        )
+        with open("/tmp/spawn_resources.stdout", "w+") as f:
+            child = spawn(plan, stdout=f, index=len(cpus) + 1)
+            child.set_returncode(await ChildWatcher.current().watch(child.pid))
+        self.assertEqual(child.path, SpawnPath.FORK)
+        self.assertEqual(child.returncode, 0)
+        with open("/tmp/spawn_resources.stdout") as f:
+            self.assertEqual(f.read(), f"(64, 128) 7 [{cpus[1 % len(cpus)]}]\n")
+
+    @unittest.skipIf(shutil.which("ionice") is None, "ionice is not installed")
+    async def test_ionice(self):
+        plan = SpawnPlan.compile(cmd="ionice", ionice={"class": "idle"})
+        with open("/tmp/spawn_ionice.stdout", "w+") as f:
+            child = spawn(plan, stdout=f)
+            child.set_returncode(await ChildWatcher.current().watch(child.pid))
+        self.assertEqual(child.returncode, 0)
+        with open("/tmp/spawn_ionice.stdout") as f:
+            self.assertEqual(f.read().strip(), "idle")
@@ -0,0 +1,89 @@
+import unittest
+import asyncio
+
+from taskmaster.utils.spawn_scheduler import SpawnScheduler
+from taskmaster.utils.token_bucket import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_delay(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        delay = bucket.take()
+        self.assertGreater(delay, 0)
+        self.assertLessEqual(delay, 0.1)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=1, burst=0)
+
+
+class TestSpawnScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_unlimited(self):
+        scheduler = SpawnScheduler()
+        async with scheduler.slot():
+            async with scheduler.slot():
+                self.assertEqual(scheduler.active, 2)
+        self.assertEqual(scheduler.active, 0)
+
+    async def test_max_concurrent(self):
+        scheduler = SpawnScheduler(max_concurrent=2)
+        running = []
+        peak = 0
+
+        async def start(i):
+            nonlocal peak
+            async with scheduler.slot():
+                running.append(i)
+                peak = max(peak, len(running))
+                await asyncio.sleep(0.01)
+                running.remove(i)
+
+        await asyncio.gather(*[start(i) for i in range(6)])
+        self.assertEqual(peak, 2)
+        self.assertEqual(scheduler.active, 0)
+        self.assertEqual(scheduler.waiting, 0)
+
+    async def test_priority_order(self):
+        scheduler = SpawnScheduler(max_concurrent=1)
+        order = []
+
+        async def start(name, priority):
+            async with scheduler.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        first = asyncio.create_task(start("first", 500))
+        await asyncio.sleep(0)
+        await asyncio.gather(
+            start("low", 900), start("high", 1), start("mid", 100), first
+        )
+        self.assertEqual(order, ["first", "high", "mid", "low"])
+
+    async def test_rate_limit(self):
+        scheduler = SpawnScheduler(rate=50, burst=1)
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+
+        async def start():
+            async with scheduler.slot():
+                pass
+
+        await asyncio.gather(*[start() for _ in range(5)])
+        self.assertGreaterEqual(loop.time() - begin, 4 / 50)
+
+    async def test_cancel_while_waiting(self):
+        scheduler = SpawnScheduler(max_concurrent=1)
+        await scheduler.acquire()
+        waiter = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.waiting, 1)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        scheduler.release()
+        self.assertEqual(scheduler.active, 0)
+        self.assertEqual(scheduler.waiting, 0)
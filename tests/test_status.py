@@ -0,0 +1,113 @@
+import unittest
+import asyncio
+
+from taskmaster.service import ServiceHandler, SubProcess
+from taskmaster.utils.config import Config
+from taskmaster.utils.status import ServiceSummary, StatusModel
+
+
+class TestStatusModel(unittest.TestCase):
+    def setUp(self):
+        self.built = []
+
+        def summarize(name):
+            self.built.append(name)
+            return ServiceSummary(name=name, cmd=f"run {name}", states=("Stopped",))
+
+        self.model = StatusModel(summarize)
+        self.model.add("a", {"Stopped": 1})
+        self.model.add("b", {"Stopped": 1})
+
+    def test_summaries_are_built_once(self):
+        self.assertEqual(
+            [summary.row for summary in self.model.summaries()],
+            [
+                {"name": "a", "cmd": "run a", "process_1": "Stopped"},
+                {"name": "b", "cmd": "run b", "process_1": "Stopped"},
+            ],
+        )
+        self.model.summaries()
+        self.assertEqual(self.built, ["a", "b"])
+        self.model.touch("b")
+        self.model.summaries()
+        self.assertEqual(self.built, ["a", "b", "b"])
+
+    def test_changes_since(self):
+        full = self.model.changes()
+        self.assertEqual([summary.name for summary in full.changed], ["a", "b"])
+        self.assertEqual(full.order, ("a", "b"))
+
+        version = full.version
+        self.assertFalse(self.model.changes(version))
+
+        self.model.transition("b", "Stopped", "Starting")
+        self.model.transition("a", "Stopped", "Starting")
+        self.model.transition("b", "Starting", "Running")
+        delta = self.model.changes(version)
+        self.assertEqual([summary.name for summary in delta.changed], ["a", "b"])
+        self.assertIsNone(delta.order)
+        self.assertEqual(delta.version, version + 3)
+        self.assertEqual(self.model.counts, {"Starting": 1, "Running": 1})
+
+        version = delta.version
+        self.model.remove("a", {"Starting": 1})
+        self.model.add("c", {})
+        delta = self.model.changes(version)
+        self.assertEqual([summary.name for summary in delta.changed], ["c"])
+        self.assertEqual(delta.order, ("b", "c"))
+        self.assertEqual(self.model.counts, {"Running": 1})
+
+        self.model.reorder(["c", "b"])
+        self.assertEqual(self.model.changes(delta.version).order, ("c", "b"))
+
+    def test_unknown_version_gets_everything(self):
+        delta = self.model.changes(self.model.version + 10)
+        self.assertEqual(len(delta.changed), 2)
+        self.assertEqual(delta.order, ("a", "b"))
+
+
+class TestHandlerStatus(unittest.IsolatedAsyncioTestCase):
+    async def test_status_follows_transitions(self):
+        config = Config("./tests/config_templates/valid/service_handler_reference.yaml")
+        handler = ServiceHandler(email=None, services=config.services)
+        model = handler.status_model
+        self.assertEqual(model.counts, {SubProcess.State.STOPPED: 5})
+        version = model.changes().version
+
+        asyncio.create_task(handler.start(["echo OUIII"]))
+        await asyncio.sleep(0.5)
+        delta = model.changes(version)
+        self.assertEqual(
+            [summary.name for summary in delta.changed],
+            ["echo OUIII"],
+        )
+        self.assertEqual(delta.changed[0].counts, {"Exited": 3})
+        self.assertEqual(
+            model.counts,
+            {SubProcess.State.STOPPED: 2, SubProcess.State.EXITED: 3},
+        )
+        self.assertEqual(handler.status[1], delta.changed[0].row)
+        self.assertFalse(model.changes(delta.version))
+        await handler.delete()
+
+    async def test_thousands_of_processes(self):
+        config = Config("./tests/config_templates/valid/numprocs_max.yaml")
+        config.services[0]["user"] = None
+        handler = ServiceHandler(email=None, services=config.services)
+        service = handler.services.get("sleep")
+        self.assertEqual(len(service._processes), 4096)
+        self.assertFalse(hasattr(service._processes[0], "__dict__"))
+        service._processes[-1].state = SubProcess.State.FATAL
+        row = handler.status[0]
+        self.assertEqual(len(row), 2 + 4096)
+        self.assertEqual(row["process_1"], "Stopped")
+        self.assertEqual(row["process_4096"], "Fatal")
+        self.assertEqual(
+            handler.status_model.counts,
+            {SubProcess.State.STOPPED: 4095, SubProcess.State.FATAL: 1},
+        )
+        await handler.delete()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,13 @@
 import unittest
+from unittest.mock import patch
 import asyncio
+import os
 
 from taskmaster.service import SubProcess
 from taskmaster.utils.config import Signal, AutoRestart
+from taskmaster.utils.spawn import SpawnBackend, SpawnPath
+from taskmaster.utils.probes import Probe, ProbeKind
+from taskmaster.utils.process_tree import group_members
 
 
 class TestSubprocess(unittest.IsolatedAsyncioTestCase):
@@ -36,6 +41,60 @@ class TestSubprocess(unittest.IsolatedAsyncioTestCase):
         await subprocess.start(retries=0, starttime=2)
         self.assertEqual(subprocess.state.name, "FATAL")  # ptetre random ca
 
+    async def test_start_with_subsecond_starttime(self):
+        subprocess: SubProcess = SubProcess(
+            parent_name="sleep",
+            cmd="sleep 0.2",
+            umask=0o77,
+            workingdir="/tmp",
+        )
+        await subprocess.start(retries=0, starttime=0.1)
+        self.assertEqual(subprocess.state.name, "RUNNING")
+        await subprocess.wait(0)
+        self.assertEqual(subprocess.state.name, "EXITED")
+
+    async def test_spawn_path_is_reported(self):
+        subprocess: SubProcess = SubProcess(
+            parent_name="sleep",
+            cmd="sleep 5",
+            umask=0o77,
+            workingdir="/tmp",
+            spawn_backend=SpawnBackend.FORK,
+        )
+        self.assertIsNone(subprocess.spawn_path)
+        await subprocess.start(retries=0, starttime=0)
+        self.assertEqual(subprocess.spawn_path, SpawnPath.FORK)
+        await subprocess.stop(stopsignal=Signal.TERM, stoptime=0)
+
+    async def test_start_with_readiness(self):
+        if os.path.exists("/tmp/taskmaster.ready"):
+            os.remove("/tmp/taskmaster.ready")
+        subprocess: SubProcess = SubProcess(
+            parent_name="sleep",
+            cmd="sh -c 'sleep 0.2; touch taskmaster.ready; sleep 5'",
+            umask=0o77,
+            workingdir="/tmp",
+            readiness=Probe(kind=ProbeKind.FILE, path="/tmp/taskmaster.ready"),
+        )
+        task = asyncio.create_task(subprocess.start(retries=0, starttime=5))
+        await asyncio.sleep(0.1)
+        self.assertEqual(subprocess.state.name, "STARTING")
+        await asyncio.wait_for(task, 1)
+        self.assertEqual(subprocess.state.name, "RUNNING")
+        await subprocess.stop(stopsignal=Signal.TERM, stoptime=0)
+
+    async def test_start_never_ready(self):
+        subprocess: SubProcess = SubProcess(
+            parent_name="sleep",
+            cmd="sleep 5",
+            umask=0o77,
+            workingdir="/tmp",
+            readiness=Probe(kind=ProbeKind.FILE, path="/nonexistent"),
+        )
+        await asyncio.wait_for(subprocess.start(retries=1, starttime=0.2), 1)
+        self.assertEqual(subprocess.state.name, "FATAL")
+        self.assertIsNotNone(subprocess._process.returncode)
+
     async def test_start_with_nonexistent_workingdir(self):
         subprocess: SubProcess = SubProcess(
             parent_name="sleep",
@@ -124,6 +183,71 @@ class TestSubprocess(unittest.IsolatedAsyncioTestCase):
         await subprocess.stop(stopsignal=Signal.QUIT, stoptime=0)
         self.assertEqual(subprocess.state.name, "STOPPED")
 
+    async def test_stop_when_gone(self):
+        subprocess: SubProcess = SubProcess(
+            parent_name="sleep",
+            cmd="sleep 5",
+            umask=0o77,
+            workingdir="/tmp",
+        )
+        await subprocess.start(retries=0, starttime=0)
+        # Exits between the state check and the signal
+        with patch("os.getpgid", side_effect=ProcessLookupError):
+            await subprocess.stop(stopsignal=Signal.TERM, stoptime=0.1)
+        self.assertEqual(subprocess.state.name, "STOPPED")
+
+    async def tree(self, cmd):
+        subprocess: SubProcess = SubProcess(
+            parent_name="tree",
+            cmd=cmd,
+            umask=0o77,
+            workingdir="/tmp",
+        )
+        await subprocess.start(retries=0, starttime=0)
+        # Leaves the shell the time to fork
+        await asyncio.sleep(0.1)
+        pgid = subprocess.pid
+        self.assertEqual(os.getpgid(pgid), pgid)
+        self.assertGreater(len(group_members(pgid)), 1)
+        return subprocess, pgid
+
+    async def assertGroupGone(self, pgid):
+        # SIGKILL is delivered asynchronously
+        for _ in range(50):
+            if not group_members(pgid):
+                return
+            await asyncio.sleep(0.01)
+        self.assertEqual(group_members(pgid), [])
+
+    async def test_stop_process_tree(self):
+        subprocess, pgid = await self.tree("sh -c 'sleep 100 & wait'")
+        await subprocess.stop(stopsignal=Signal.TERM, stoptime=2)
+        self.assertEqual(subprocess.state.name, "STOPPED")
+        self.assertEqual(group_members(pgid), [])
+        self.assertEqual(subprocess.leftovers, 0)
+        self.assertLess(subprocess.stop_latency, 1)
+
+    async def test_stop_kills_leftover_children(self):
+        subprocess, pgid = await self.tree(
+            "sh -c '(trap \"\" TERM; exec sleep 100) & sleep 100'"
+        )
+        with self.assertLogs(level="WARNING"):
+            await subprocess.stop(stopsignal=Signal.TERM, stoptime=0.3)
+        self.assertEqual(subprocess.state.name, "STOPPED")
+        await self.assertGroupGone(pgid)
+        self.assertEqual(subprocess.leftovers, 1)
+        self.assertGreaterEqual(subprocess.stop_latency, 0.3)
+
+    async def test_stop_kills_unresponsive_tree(self):
+        subprocess, pgid = await self.tree(
+            "sh -c 'trap \"\" TERM; sleep 100 & sleep 100'"
+        )
+        with self.assertLogs(level="WARNING"):
+            await subprocess.stop(stopsignal=Signal.TERM, stoptime=0.3)
+        self.assertEqual(subprocess.state.name, "STOPPED")
+        await self.assertGroupGone(pgid)
+        self.assertEqual(subprocess.leftovers, 2)
+
     async def test_autorestart_always(self):
         subprocess: SubProcess = SubProcess(
             parent_name="sleep",
@@ -0,0 +1,63 @@
+import unittest
+import asyncio
+
+from taskmaster.utils.timer_wheel import TimerWheel
+
+
+class TestTimerWheel(unittest.IsolatedAsyncioTestCase):
+    async def test_fires_in_order(self):
+        wheel = TimerWheel()
+        fired = []
+        wheel.call_later(0.05, fired.append, "b")
+        wheel.call_later(0.02, fired.append, "a")
+        self.assertEqual(len(wheel), 2)
+        await asyncio.sleep(0.1)
+        self.assertEqual(fired, ["a", "b"])
+        self.assertEqual(len(wheel), 0)
+
+    async def test_never_fires_early(self):
+        wheel = TimerWheel()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await wheel.sleep(0.123)
+        elapsed = loop.time() - start
+        self.assertGreaterEqual(elapsed, 0.123)
+        self.assertLess(elapsed, 0.123 + 0.05)
+
+    async def test_cancel(self):
+        wheel = TimerWheel()
+        fired = []
+        timer = wheel.call_later(0.02, fired.append, "a")
+        wheel.cancel(timer)
+        wheel.cancel(timer)
+        self.assertEqual(len(wheel), 0)
+        await asyncio.sleep(0.05)
+        self.assertEqual(fired, [])
+
+    async def test_beyond_one_rotation(self):
+        wheel = TimerWheel(resolution=0.01, slots=4)
+        fired = []
+        wheel.call_later(0.1, fired.append, "late")
+        wheel.call_later(0.01, fired.append, "early")
+        await asyncio.sleep(0.05)
+        self.assertEqual(fired, ["early"])
+        await asyncio.sleep(0.1)
+        self.assertEqual(fired, ["early", "late"])
+
+    async def test_wait_timeout(self):
+        wheel = TimerWheel()
+        future = asyncio.get_running_loop().create_future()
+        self.assertFalse(await wheel.wait(future, timeout=0.02))
+        self.assertFalse(future.cancelled())
+        asyncio.get_running_loop().call_later(0.01, future.set_result, 1)
+        self.assertTrue(await wheel.wait(future, timeout=1))
+        self.assertEqual(len(wheel), 0)
+
+    async def test_sleep_cancelled(self):
+        wheel = TimerWheel()
+        task = asyncio.create_task(wheel.sleep(10))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(len(wheel), 0)
@@ -0,0 +1,62 @@
+import unittest
+import asyncio
+import os
+import tempfile
+
+from taskmaster.utils.probes import Probe, ProbeKind
+from taskmaster.utils.watchdog import Watchdog
+
+
+class TestWatchdog(unittest.IsolatedAsyncioTestCase):
+    async def test_failure_after_threshold(self):
+        watchdog = Watchdog()
+        failed = asyncio.Event()
+        probe = Probe(kind=ProbeKind.FILE, path="/nonexistent", interval=0.02)
+        watchdog.watch("process", probe, failed.set, threshold=3)
+        await asyncio.sleep(0.05)
+        self.assertFalse(failed.is_set())
+        await asyncio.wait_for(failed.wait(), 1)
+        self.assertNotIn("process", watchdog)
+
+    async def test_heartbeat(self):
+        watchdog = Watchdog()
+        failed = asyncio.Event()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "heartbeat")
+            probe = Probe(kind=ProbeKind.FILE, path=path, interval=0.02, max_age=1)
+            with open(path, "w"):
+                pass
+            watchdog.watch("process", probe, failed.set, threshold=1)
+            await asyncio.sleep(0.1)
+            self.assertFalse(failed.is_set())
+            os.utime(path, (0, 0))
+            await asyncio.wait_for(failed.wait(), 1)
+
+    async def test_unwatch(self):
+        watchdog = Watchdog()
+        failed = asyncio.Event()
+        probe = Probe(kind=ProbeKind.FILE, path="/nonexistent", interval=0.02)
+        watchdog.watch("process", probe, failed.set, threshold=1)
+        watchdog.unwatch("process")
+        watchdog.unwatch("process")
+        await asyncio.sleep(0.1)
+        self.assertFalse(failed.is_set())
+        self.assertEqual(len(watchdog.timers), 0)
+
+    async def test_many_probes(self):
+        watchdog = Watchdog()
+        server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        failures = []
+        tcp = Probe(kind=ProbeKind.TCP, port=port, interval=0.02)
+        missing = Probe(kind=ProbeKind.FILE, path="/nonexistent", interval=0.02)
+        for i in range(50):
+            watchdog.watch(("tcp", i), tcp, lambda i=i: failures.append(i))
+            watchdog.watch(("file", i), missing, lambda i=i: failures.append(i))
+        await asyncio.sleep(0.5)
+        self.assertEqual(sorted(failures), list(range(50)))
+        self.assertEqual(len(watchdog), 50)
+        for i in range(50):
+            watchdog.unwatch(("tcp", i))
+        server.close()
+        await server.wait_closed()